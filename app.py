@@ -1,120 +1,222 @@
-from flask import Flask, render_template, redirect, url_for, flash, request, make_response
+from flask import Flask, Response, current_app, make_response, render_template, redirect, url_for, flash, request, send_from_directory, jsonify, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
+from flask_wtf.csrf import CSRFProtect
 from werkzeug.security import check_password_hash
-from werkzeug.utils import secure_filename
-from models import db, User, Book, Genre, Cover, Review, BookViewLog
-from forms import LoginForm, BookForm, ReviewForm
+from models import db, User, Book, Genre, Cover, Review, BookViewLog, BookViewDaily, CatalogImport, Job
+from forms import LoginForm, BookForm, ReviewForm, CatalogImportForm
+from stats import (
+    book_stats_query, popular_books_query,
+    activity_log_filters, approximate_view_log_size
+)
+from pagination import keyset_paginate, id_list_paginate
+from facets import browse_catalog, parse_filters, facet_args
+from commands import register_commands
+from database import configure_database
+from instrumentation import init_instrumentation, request_metrics, query_budget, metrics_allowed
+from view_buffer import view_buffer
+from cache import cache
+from identity import (
+    init_identity, load_identity, permission_required,
+    MANAGE_BOOKS, EDIT_BOOKS, VIEW_STATISTICS
+)
+from covers import store_cover, release_cover, cover_url, InvalidCover
+from fragments import (
+    catalog_version, bump_catalog_version, book_card, render_fragment, fragment_key,
+    make_etag, conditional_allowed, is_not_modified, set_validators
+)
+from search import search_books
+from recently_viewed import recent_books, remember_view, merge_guest_views, forget_session_views, session_visitor_id
+from markdown_render import render_book, render_review
+from recommendations import recommended_books_query, forget_book
+from trending import trending_books_query, forget_book as forget_trending_book, LEADERBOARD_SIZE
+from catalog_import import extract_covers, error_report_path
+from exports import parse_date
+from jobs import job_runner, download_name, result_path, discard_workdir, encode_params, JobLimitExceeded
 import os
-import hashlib
-from io import StringIO
-import csv
-import datetime
-import codecs
-from sqlalchemy import func
-from sqlalchemy.orm import joinedload
-from datetime import timedelta
+import tempfile
+from sqlalchemy.orm import joinedload, selectinload
+
+# Связи, которые показывает карточка книги, загружаются заранее пачкой
+BOOK_CARD_OPTIONS = (selectinload(Book.genres), joinedload(Book.cover))
+
+# Ключи кэша: рейтинг популярных - на версию каталога и параметры выборки,
+# список жанров сбрасывается при изменении книг и жанров
+POPULAR_BOOKS_KEY = 'popular_books:{version}:{limit}:{months}'
+GENRE_CHOICES_KEY = 'genre_choices'
 
 def get_popular_books(limit=5, months=3):
-    three_months_ago = datetime.datetime.utcnow() - timedelta(days=90)
-    return (
-        db.session.query(Book, func.count(BookViewLog.id).label('views'))
-        .join(BookViewLog)
-        .filter(BookViewLog.timestamp >= three_months_ago)
-        .group_by(Book)
-        .order_by(db.text('views DESC'))
-        .limit(limit)
-        .all()
+    # Рейтинг из суточной сводки кэшируется как пары (id, просмотры),
+    # сами книги загружаются по первичному ключу
+    ranking = cache.get_or_set(
+        POPULAR_BOOKS_KEY.format(version=catalog_version()[0], limit=limit, months=months),
+        lambda: [tuple(row) for row in popular_books_query(limit=limit, days=months * 30)]
     )
+    if not ranking:
+        return []
+    books = {
+        book.id: book
+        for book in Book.query.options(*BOOK_CARD_OPTIONS).filter(Book.id.in_([book_id for book_id, _ in ranking]))
+    }
+    return [(books[book_id], views) for book_id, views in ranking if book_id in books]
 
-def get_recent_books(limit=5, user_id=None, session_id=None, ip_address=None):
-    query = (
-        db.session.query(Book)
-        .join(BookViewLog)
-        .filter(BookViewLog.timestamp >= (datetime.datetime.utcnow() - timedelta(days=30)))
+def get_genre_choices():
+    return cache.get_or_set(
+        GENRE_CHOICES_KEY,
+        lambda: [(g.id, g.name) for g in Genre.query.order_by(Genre.id)],
+        ttl=300
     )
-    
-    if user_id:
-        query = query.filter(BookViewLog.user_id == user_id)
-    elif session_id:
-        query = query.filter(BookViewLog.session_id == session_id)
-    else:
-        query = query.filter(BookViewLog.ip_address == ip_address)
-    
-    return query.order_by(BookViewLog.timestamp.desc()).distinct().limit(limit).all()
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = 'your-secret-key'
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///library.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-app.config['UPLOAD_FOLDER'] = 'static/covers'
+def invalidate_catalog_cache():
+    cache.delete(GENRE_CHOICES_KEY)
+    bump_catalog_version()  # новые ETag, ключи фрагментов и рейтинга популярных
+
+def get_trending_books(genre_id=None, limit=LEADERBOARD_SIZE):
+    # Готовый рейтинг "популярное сейчас": один запрос по первичному ключу
+    return trending_books_query(genre_id, limit).options(*BOOK_CARD_OPTIONS).all()
+
+# Токен CSRF проверяется во всех POST-запросах, в том числе вне FlaskForm
+csrf = CSRFProtect()
 
-# --- Init ---
-db.init_app(app)
-login_manager = LoginManager(app)
+login_manager = LoginManager()
 login_manager.login_view = 'login'
 login_manager.login_message = 'Для выполнения данного действия необходимо пройти процедуру аутентификации.'
 
-@login_manager.user_loader
-def load_user(user_id):
-    return User.query.get(int(user_id))
+# Маршруты собираются при импорте модуля и регистрируются в create_app()
+_routes = []
+
+def route(rule, **options):
+    def decorator(view):
+        _routes.append((rule, view, options))
+        return view
+    return decorator
+
+# --- Обложки ---
+# Имена файлов - хеши содержимого, поэтому их можно кэшировать "навсегда"
+COVER_MAX_AGE = 365 * 24 * 3600
+
+@route('/covers/<path:filename>')
+def cover_file(filename):
+    response = send_from_directory(current_app.config['UPLOAD_FOLDER'], filename, max_age=COVER_MAX_AGE)
+    response.headers['Cache-Control'] = f'public, max-age={COVER_MAX_AGE}, immutable'
+    return response
 
 # --- Главная с пагинацией ---
-@app.route('/')
-@app.route('/page/<int:page>')
+@route('/')
+@route('/page/<int:page>')
 def index(page=1):
     per_page = 6
-    books = Book.query.order_by(Book.year.desc()).paginate(page=page, per_page=per_page)
+    # Фильтры фасетов из строки запроса; список id и счётчики - из индекса фасетов в памяти
+    filters = parse_filters(request.args)
+    genre_names = dict(get_genre_choices())
+    book_ids, facets = browse_catalog(filters, genre_names)
+    books = id_list_paginate(Book.query.options(*BOOK_CARD_OPTIONS), Book.id, book_ids, page=page, per_page=per_page)
     
     # Получаем популярные книги
     popular_books = get_popular_books(limit=5)
+    trending_books = get_trending_books(limit=6)
     
-    # Получаем недавно просмотренные книги
-    recent_books = None
-    if current_user.is_authenticated:
-        recent_books = get_recent_books(user_id=current_user.id)
-    else:
-        session_id = request.cookies.get('session')
-        if session_id:
-            recent_books = get_recent_books(session_id=session_id)
-        else:
-            recent_books = get_recent_books(ip_address=request.remote_addr)
-    
-    return render_template('index.html', 
+    # Недавно просмотренные: список из сессии и книги по первичному ключу
+    recently_viewed = recent_books(BOOK_CARD_OPTIONS)
+
+    # Гостю, у которого страница не изменилась, отвечаем 304 без отрисовки
+    etag = None
+    if conditional_allowed():
+        etag = make_etag(
+            'index', page, sorted(filters.items()), catalog_version()[0],
+            [(book.id, book.version) for book in books.items],
+            [(book.id, book.version, views) for book, views in popular_books],
+            [book.id for book in trending_books],
+            [book.id for book in recently_viewed]
+        )
+        if is_not_modified(etag):
+            return set_validators(Response(status=304), etag)
+
+    response = make_response(render_template('index.html', 
                          books=books,
+                         filters=filters,
+                         facets=facets,
+                         genre_names=genre_names,
                          popular_books=popular_books,
-                         recent_books=recent_books)
+                         trending_books=trending_books,
+                         recent_books=recently_viewed))
+    return set_validators(response, etag) if etag else response
+
+# --- Поиск по каталогу ---
+@route('/search')
+def search():
+    per_page = 6
+    search_args = {
+        key: request.args[key]
+        for key in ('q', 'genre', 'year_from', 'year_to')
+        if request.args.get(key)
+    }
+    books = search_books(
+        text=request.args.get('q', '').strip(),
+        genre_id=request.args.get('genre', type=int),
+        year_from=request.args.get('year_from', type=int),
+        year_to=request.args.get('year_to', type=int)
+    ).options(*BOOK_CARD_OPTIONS).paginate(page=request.args.get('page', 1, type=int), per_page=per_page)
+
+    return render_template('search.html',
+                           books=books,
+                           genres=get_genre_choices(),
+                           search_args=search_args)
+
+# --- Страница жанра ---
+@route('/genre/<int:genre_id>')
+def view_genre(genre_id):
+    genre = Genre.query.get_or_404(genre_id)
+    return render_template('genre.html', genre=genre, trending_books=get_trending_books(genre_id))
 
 # --- Просмотр книги ---
-@app.route('/book/<int:book_id>')
+@route('/book/<int:book_id>')
 def view_book(book_id):
     book = Book.query.get_or_404(book_id)
-    reviews = Review.query.filter_by(book_id=book_id).order_by(Review.timestamp.desc()).all()
 
-    # Проверка лимита просмотров
+    # Логирование просмотра через буфер (лимит проверяется внутри),
+    # в том числе когда страница не изменилась
     user_id = current_user.id if current_user.is_authenticated else None
-    session_id = request.cookies.get('session')
+    session_id = session_visitor_id()
     ip_address = request.remote_addr
+    view_buffer.record(book_id, user_id, session_id, ip_address)
+    remember_view(book_id)
+
+    catalog, catalog_updated = catalog_version()
+    etag = last_modified = None
+    if conditional_allowed():
+        etag = make_etag('book', book.id, book.version, catalog)
+        last_modified = max(book.updated_at, catalog_updated)
+        if is_not_modified(etag, last_modified):
+            return set_validators(Response(status=304), etag, last_modified)
+
+    # Описание и рецензии берутся из кэша фрагментов, связи и рецензии
+    # загружаются только при его промахе
+    book_info = render_fragment(
+        '_book_info.html', fragment_key('book', book.id, book.version, catalog),
+        lambda: {'book': book}
+    )
+    book_reviews = render_fragment(
+        '_book_reviews.html', fragment_key('reviews', book.id, book.version, catalog),
+        lambda: {'reviews': Review.query.options(joinedload(Review.user))
+                 .filter_by(book_id=book_id)
+                 .order_by(Review.timestamp.desc())
+                 .all()}
+    )
 
-    if BookViewLog.check_daily_limit(book_id, user_id, session_id, ip_address):
-        # Логирование просмотра
-        view_log = BookViewLog(
-            book_id=book_id,
-            user_id=user_id,
-            session_id=session_id,
-            ip_address=ip_address
-        )
-        db.session.add(view_log)
-        db.session.commit()
+    # "Читатели также смотрели": готовый top-K, один запрос по ключу
+    recommended = recommended_books_query(book_id).options(joinedload(Book.cover)).all()
 
     user_review = None
     if current_user.is_authenticated:
         user_review = Review.query.filter_by(book_id=book_id, user_id=current_user.id).first()
 
     review_form = ReviewForm()           # форма для рецензии
-    return render_template('view_book.html', book=book, reviews=reviews, user_review=user_review, review_form=review_form)
+    response = make_response(render_template('view_book.html', book=book, book_info=book_info, book_reviews=book_reviews,
+                                             recommended=recommended, user_review=user_review, review_form=review_form))
+    return set_validators(response, etag, last_modified) if etag else response
 
 # --- Добавление рецензии ---
-@app.route('/review/<int:book_id>', methods=['POST'])
+@route('/review/<int:book_id>', methods=['POST'])
 @login_required
 def add_review(book_id):
     book = Book.query.get_or_404(book_id)
@@ -127,43 +229,49 @@ def add_review(book_id):
         return redirect(url_for('view_book', book_id=book_id))
 
     if form.validate_on_submit():
-        print('Форма прошла валидацию!')  # Лог в консоль
+        current_app.logger.debug('Форма прошла валидацию!')
         review = Review(
             text=form.text.data,
             rating=form.rating.data,
             user_id=current_user.id,
             book_id=book_id
         )
+        render_review(review)
         db.session.add(review)
         db.session.commit()
         flash('Рецензия добавлена!', 'success')
         return redirect(url_for('view_book', book_id=book_id))
     else:
         if request.method == 'POST':
-            print('Форма НЕ прошла валидацию.')
-            print(form.errors)
+            current_app.logger.debug(f'Форма НЕ прошла валидацию: {form.errors}')
 
     return render_template('review_form.html', form=form, book=book)
 
 
 
 # --- Добавление книги ---
-@app.route('/add', methods=['GET', 'POST'])
-@login_required
+@route('/add', methods=['GET', 'POST'])
+@permission_required(MANAGE_BOOKS)
 def add_book():
-    print(f"Метод: {request.method}")
-
-    # Проверка прав
-    if current_user.role.name != 'Администратор':
-        flash('У вас недостаточно прав для выполнения данного действия.', 'danger')
-        print("Пользователь не админ!")
-        return redirect(url_for('index'))
+    current_app.logger.debug(f"Метод: {request.method}")
 
     form = BookForm()
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]  # список жанров в форме
+    form.genres.choices = get_genre_choices()  # список жанров в форме
 
     if form.validate_on_submit():
-        print("Форма прошла валидацию!")
+        current_app.logger.debug("Форма прошла валидацию!")
+
+        # Обложка проверяется и сохраняется до записи книги
+        # (файл хранится под своим хешем и общий для книг с одинаковой обложкой)
+        cover = None
+        if form.cover.data:
+            file = form.cover.data
+            try:
+                md5, filename = store_cover(file, current_app.config['UPLOAD_FOLDER'])
+            except InvalidCover as error:
+                form.cover.errors.append(str(error))
+                return render_template('book_form.html', form=form, show_cover_field=True)
+            cover = Cover(filename=filename, mimetype=file.mimetype, md5_hash=md5)
 
         # Создание новой книги
         book = Book(
@@ -174,53 +282,34 @@ def add_book():
             author=form.author.data,
             pages=form.pages.data
         )
+        render_book(book)
 
         # Связывание жанров
         selected_genres = Genre.query.filter(Genre.id.in_(form.genres.data)).all()
         book.genres = selected_genres
 
+        if cover is not None:
+            cover.book = book
         db.session.add(book)
         db.session.commit()
-
-        # Обработка обложки
-        if form.cover.data:
-            file = form.cover.data
-            content = file.read()
-            md5 = hashlib.md5(content).hexdigest()
-
-            existing_cover = Cover.query.filter_by(md5_hash=md5).first()
-            if existing_cover:
-                book.cover = existing_cover
-            else:
-                filename = f"{book.id}_{secure_filename(file.filename)}"
-                file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                with open(file_path, 'wb') as f:
-                    f.write(content)
-                new_cover = Cover(filename=filename, mimetype=file.mimetype, md5_hash=md5, book=book)
-                db.session.add(new_cover)
-
-        db.session.commit()
+        invalidate_catalog_cache()
 
         flash('Книга успешно добавлена!', 'success')
         return redirect(url_for('index'))
     else:
         if request.method == 'POST':
-            print("Форма НЕ прошла валидацию.")
-            print(form.errors)  # вывод ошибок в консоль
+            current_app.logger.debug(f"Форма НЕ прошла валидацию: {form.errors}")
 
     return render_template('book_form.html', form=form, show_cover_field=True)
 
 # --- Редактирование книги ---
-@app.route('/edit/<int:book_id>', methods=['GET', 'POST'])
-@login_required
+@route('/edit/<int:book_id>', methods=['GET', 'POST'])
+@permission_required(EDIT_BOOKS, message='У вас недостаточно прав.')
 def edit_book(book_id):
     book = Book.query.get_or_404(book_id)
-    if current_user.role.name not in ['Администратор', 'Модератор']:
-        flash('У вас недостаточно прав.', 'danger')
-        return redirect(url_for('index'))
 
     form = BookForm(obj=book)
-    form.genres.choices = [(g.id, g.name) for g in Genre.query.all()]
+    form.genres.choices = get_genre_choices()
 
     if request.method == 'GET':
         form.genres.data = [g.id for g in book.genres]
@@ -232,233 +321,279 @@ def edit_book(book_id):
         book.publisher = form.publisher.data
         book.author = form.author.data
         book.pages = form.pages.data
+        render_book(book)
         book.genres = Genre.query.filter(Genre.id.in_(form.genres.data)).all()
 
         db.session.commit()
+        invalidate_catalog_cache()
         flash('Книга обновлена', 'success')
         return redirect(url_for('view_book', book_id=book.id))
 
     return render_template('book_form.html', form=form, title='Редактировать книгу', show_cover_field=False)
 
 # --- Удаление книги ---
-@app.route('/delete/<int:book_id>', methods=['POST'])
-@login_required
+@route('/delete/<int:book_id>', methods=['POST'])
+@query_budget(None)  # буфер просмотров сбрасывается пачками
+@permission_required(MANAGE_BOOKS)
 def delete_book(book_id):
-    if current_user.role.name != 'Администратор':
-        flash('У вас недостаточно прав для выполнения данного действия.', 'danger')
-        return redirect(url_for('index'))
-    
     book = Book.query.get_or_404(book_id)
     
-    # Сначала удаляем все записи просмотров
+    # Записи просмотров (включая ещё не записанные из буфера) удаляются в одной
+    # транзакции с книгой: при ошибке её история остаётся целой; архивные файлы сохраняются
+    view_buffer.flush()
     BookViewLog.query.filter_by(book_id=book_id).delete()
+    BookViewDaily.query.filter_by(book_id=book_id).delete()
+    Review.query.filter_by(book_id=book_id).delete()
+    forget_book(book_id)
+    forget_trending_book(book_id)
     
-    # Удаляем обложку если есть
-    if book.cover:
-        cover_path = os.path.join(app.config['UPLOAD_FOLDER'], book.cover.filename)
-        if os.path.exists(cover_path):
-            os.remove(cover_path)
+    # Файлы обложки удаляются только после фиксации: при ошибке книга остаётся с обложкой
+    cover = Cover(filename=book.cover.filename, md5_hash=book.cover.md5_hash) if book.cover else None
     
     # Удаляем саму книгу
     db.session.delete(book)
     
     try:
         db.session.commit()
+        # Файлы удаляются, если они больше не нужны другим книгам
+        if cover is not None:
+            release_cover(cover, current_app.config['UPLOAD_FOLDER'])
+        invalidate_catalog_cache()
         flash('Книга удалена', 'success')
     except Exception as e:
         db.session.rollback()
         flash('Ошибка при удалении книги', 'danger')
-        print(f"Error: {str(e)}")
+        current_app.logger.error(f"Error: {str(e)}")
     
     return redirect(url_for('index'))
 
 # --- Вход ---
-@app.route('/login', methods=['GET', 'POST'])
+@route('/login', methods=['GET', 'POST'])
 def login():
     form = LoginForm()
     if form.validate_on_submit():
         user = User.query.filter_by(username=form.username.data).first()
         if user and check_password_hash(user.password_hash, form.password.data):
-            login_user(user, remember=form.remember.data)
+            login_user(load_identity(user.id), remember=form.remember.data)
+            merge_guest_views(user.id)
             flash('Успешный вход', 'success')
             return redirect(url_for('index'))
         flash('Неверный логин или пароль', 'danger')
     return render_template('login.html', form=form)
 
 # --- Выход ---
-@app.route('/logout')
+@route('/logout')
 @login_required
 def logout():
     logout_user()
+    forget_session_views()
     flash('Вы вышли из системы.', 'info')
     return redirect(url_for('index'))
 
 # --- Статистика просмотров ---
-@app.route('/statistics')
-@app.route('/statistics/page/<int:page>')
-@login_required
+@route('/statistics')
+@route('/statistics/page/<int:page>')
+@permission_required(VIEW_STATISTICS, message='У вас недостаточно прав для просмотра статистики.')
 def statistics(page=1):
-    if current_user.role.name != 'Администратор':
-        flash('У вас недостаточно прав для просмотра статистики.', 'danger')
-        return redirect(url_for('index'))
-
-    week_ago = datetime.datetime.utcnow() - timedelta(days=7)
-    month_ago = datetime.datetime.utcnow() - timedelta(days=30)
-    
-    # Детальная статистика просмотров
+    # Детальная статистика просмотров (один сгруппированный запрос + счётчик страниц)
     per_page = 10
-    book_stats = []
-    books = Book.query.all()
-    
-    for book in books:
-        views = BookViewLog.query.filter_by(book_id=book.id)
-        stats = {
-            'book': book,
-            'total_views': views.count(),
-            'monthly_views': views.filter(BookViewLog.timestamp >= month_ago).count(),
-            'weekly_views': views.filter(BookViewLog.timestamp >= week_ago).count(),
-            'first_view': views.order_by(BookViewLog.timestamp.asc()).first().timestamp if views.first() else None,
-            'last_view': views.order_by(BookViewLog.timestamp.desc()).first().timestamp if views.first() else None
-        }
-        book_stats.append(stats)
-    
-    book_stats.sort(key=lambda x: x['total_views'], reverse=True)
-    
-    # Создаем пагинацию вручную
-    total = len(book_stats)
-    start = (page - 1) * per_page
-    end = start + per_page
-    paginated_stats = book_stats[start:end]
-    
-    pagination = {
-        'page': page,
-        'per_page': per_page,
-        'total': total,
-        'pages': (total + per_page - 1) // per_page
-    }
-    
+    book_stats = book_stats_query().paginate(page=page, per_page=per_page)
+
     return render_template('statistics.html', 
-                         book_stats=paginated_stats,
-                         pagination=pagination)
+                         book_stats=book_stats.items,
+                         pagination=book_stats,
+                         jobs=job_runner.recent('export_statistics', current_user.id))
 
 # --- Журнал действий ---
-@app.route('/activity_log')
-@app.route('/activity_log/page/<int:page>')
-@login_required
-def activity_log(page=1):
-    if current_user.role.name != 'Администратор':
-        flash('У вас недостаточно прав для просмотра журнала.', 'danger')
-        return redirect(url_for('index'))
-    
+def get_activity_log_filters():
+    # Фильтры журнала из параметров запроса или формы экспорта:
+    # пользователь (логин), книга, период (ГГГГ-ММ-ДД)
+    filters = {
+        'date_from': parse_date(request.values.get('date_from')),
+        'date_to': parse_date(request.values.get('date_to')),
+        'book_id': request.values.get('book_id', type=int),
+        'user_id': None
+    }
+    username = request.values.get('user')
+    if username:
+        user = User.query.filter_by(username=username).first()
+        # Несуществующий пользователь - пустой результат
+        filters['user_id'] = user.id if user else -1
+    return filters
+
+@route('/activity_log')
+@permission_required(VIEW_STATISTICS, message='У вас недостаточно прав для просмотра журнала.')
+def activity_log():
     per_page = 10
+    filters = get_activity_log_filters()
     log_query = BookViewLog.query.options(
         db.joinedload(BookViewLog.user),
         db.joinedload(BookViewLog.book)
-    ).order_by(BookViewLog.timestamp.desc())
+    ).filter(*activity_log_filters(**filters))
     
-    log_entries = log_query.paginate(page=page, per_page=per_page)
-    return render_template('activity_log.html', activity_log=log_entries)
+    # Курсорная пагинация по (timestamp, id): глубокие страницы без OFFSET
+    log_entries = keyset_paginate(
+        log_query, BookViewLog.timestamp, BookViewLog.id, per_page,
+        after=request.args.get('after'),
+        before=request.args.get('before')
+    )
 
-# --- Экспорт статистики ---
-@app.route('/export_statistics')
-@login_required
+    # Точное число записей - только по запросу, без фильтров - приблизительное
+    total, total_is_exact = None, False
+    if request.args.get('count'):
+        total, total_is_exact = log_query.order_by(None).count(), True
+    elif not any(filters.values()):
+        total = approximate_view_log_size()
+
+    filter_args = {
+        key: request.args[key]
+        for key in ('user', 'book_id', 'date_from', 'date_to', 'count')
+        if request.args.get(key)
+    }
+    return render_template('activity_log.html', activity_log=log_entries,
+                           filter_args=filter_args, total=total, total_is_exact=total_is_exact,
+                           jobs=job_runner.recent('export_activity_log', current_user.id))
+
+# --- Метрики для Prometheus ---
+@route('/metrics')
+def metrics():
+    if not metrics_allowed(current_user):
+        abort(403)
+    extra = {
+        f'view_buffer_{name}': ('counter' if name.endswith('_total') else 'gauge', value)
+        for name, value in view_buffer.metrics().items()
+    }
+    extra.update({
+        f'cache_{name}_total': ('counter', value)
+        for name, value in cache.stats().items()
+    })
+    return Response(request_metrics.render(extra), mimetype='text/plain; version=0.0.4')
+
+# --- Экспорт в фоне ---
+def start_export(kind, params, redirect_to, **redirect_args):
+    try:
+        job_runner.submit(kind, params, current_user.id)
+        flash('Экспорт запущен, файл появится в списке ниже.', 'info')
+    except JobLimitExceeded as error:
+        flash(f'{error}. Дождитесь окончания или отмените одну из них.', 'warning')
+    return redirect(url_for(redirect_to, **redirect_args))
+
+@route('/export_statistics', methods=['POST'])
+@permission_required(VIEW_STATISTICS, redirect_to='statistics')
 def export_statistics():
-    if current_user.role.name != 'Администратор':
-        flash('У вас недостаточно прав для выполнения данного действия.', 'danger')
-        return redirect(url_for('statistics'))
+    return start_export('export_statistics', {}, 'statistics')
 
-    # Подготовка данных
-    week_ago = datetime.datetime.utcnow() - timedelta(days=7)
-    month_ago = datetime.datetime.utcnow() - timedelta(days=30)
-    
-    book_stats = []
-    for book in Book.query.all():
-        views = BookViewLog.query.filter_by(book_id=book.id)
-        stats = [
-            book.title,
-            book.author,
-            str(views.count()),
-            str(views.filter(BookViewLog.timestamp >= month_ago).count()),
-            str(views.filter(BookViewLog.timestamp >= week_ago).count()),
-            views.order_by(BookViewLog.timestamp.asc()).first().timestamp.strftime('%d.%m.%Y %H:%M') if views.first() else '-',
-            views.order_by(BookViewLog.timestamp.desc()).first().timestamp.strftime('%d.%m.%Y %H:%M') if views.first() else '-'
-        ]
-        book_stats.append(stats)
-
-    # Создаем CSV
-    output = StringIO()
-    output.write(codecs.BOM_UTF8.decode('utf-8'))
-    writer = csv.writer(output, quoting=csv.QUOTE_ALL, dialect='excel')
-    
-    writer.writerow([
-        'Название книги',
-        'Автор',
-        'Всего просмотров',
-        'За последний месяц',
-        'За последнюю неделю',
-        'Первый просмотр',
-        'Последний просмотр'
-    ])
-    
-    for stats in sorted(book_stats, key=lambda x: int(x[2]) if x[2] != '-' else 0, reverse=True):
-        writer.writerow(stats)
-
-    # Отправляем файл
-    output.seek(0)
-    response = make_response(output.getvalue())
-    current_date = datetime.datetime.now().strftime('%d_%m_%Y_%H_%M')
-    response.headers["Content-Disposition"] = f"attachment; filename=statistics_{current_date}.csv"
-    response.headers["Content-type"] = "text/csv; charset=utf-8-sig"
-    return response
-
-@app.route('/export_activity_log')
-@login_required
+@route('/export_activity_log', methods=['POST'])
+@permission_required(VIEW_STATISTICS, redirect_to='activity_log')
 def export_activity_log():
-    if current_user.role.name != 'Администратор':
-        flash('У вас недостаточно прав для выполнения данного действия.', 'danger')
-        return redirect(url_for('activity_log'))
+    # Те же необязательные фильтры, что и на странице журнала
+    filter_args = {
+        key: request.form[key]
+        for key in ('user', 'book_id', 'date_from', 'date_to')
+        if request.form.get(key)
+    }
+    return start_export('export_activity_log', get_activity_log_filters(), 'activity_log', **filter_args)
 
-    # Получаем все записи журнала с загрузкой связей
-    logs = BookViewLog.query.options(
-        db.joinedload(BookViewLog.user),
-        db.joinedload(BookViewLog.book)
-    ).order_by(BookViewLog.timestamp.desc()).all()
+def get_own_job(job_id):
+    job = db.get_or_404(Job, job_id)
+    if job.user_id != current_user.id:
+        abort(404)
+    return job
 
-    # Создаем CSV
-    output = StringIO()
-    output.write(codecs.BOM_UTF8.decode('utf-8'))
-    writer = csv.writer(output, quoting=csv.QUOTE_ALL, dialect='excel')
-    
-    writer.writerow([
-        'Дата и время',
-        'Пользователь',
-        'Книга',
-        'IP адрес',
-        'Идентификатор сессии'
-    ])
-    
-    for log in logs:
-        writer.writerow([
-            log.timestamp.strftime('%d.%m.%Y %H:%M'),
-            log.user.username if log.user else 'Гость',
-            log.book.title,
-            log.ip_address or '-',
-            log.session_id or '-'
-        ])
-
-    # Отправляем файл
-    output.seek(0)
-    response = make_response(output.getvalue())
-    current_date = datetime.datetime.now().strftime('%d_%m_%Y_%H_%M')
-    response.headers["Content-Disposition"] = f"attachment; filename=activity_log_{current_date}.csv"
-    response.headers["Content-type"] = "text/csv; charset=utf-8-sig"
-    return response
+# Статус и отмена - для задач любого вида, доступ ограничен владельцем задачи
+@route('/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    job = get_own_job(job_id)
+    return jsonify(status=job.status, progress=job.progress, total=job.total, percent=job.percent())
+
+@route('/jobs/<int:job_id>/download')
+@permission_required(VIEW_STATISTICS)
+def job_download(job_id):
+    job = get_own_job(job_id)
+    if job.status != 'done':
+        abort(404)
+    return send_from_directory(current_app.config['JOBS_FOLDER'], os.path.basename(result_path('', job.id)),
+                               as_attachment=True, download_name=download_name(job),
+                               mimetype='text/csv; charset=utf-8-sig')
+
+@route('/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def job_cancel(job_id):
+    job_runner.cancel(get_own_job(job_id))
+    flash('Задача отменена.', 'info')
+    return redirect(request.referrer or url_for('statistics'))
+
+# --- Импорт каталога ---
+@route('/import', methods=['GET', 'POST'])
+@permission_required(MANAGE_BOOKS)
+def catalog_import():
+    form = CatalogImportForm()
+    if form.validate_on_submit():
+        folder = current_app.config['IMPORT_FOLDER']
+        os.makedirs(folder, exist_ok=True)
+        upload = form.catalog.data
+        # Загрузка и обложки лежат во временной папке, пока идёт фоновая
+        # задача импорта; папку удаляет диспетчер задач
+        workdir = tempfile.mkdtemp(prefix='upload_', dir=folder)
+        path = os.path.join(workdir, 'catalog' + os.path.splitext(upload.filename)[1].lower())
+        upload.save(path)
+        covers_dir = None
+        if form.covers.data:
+            covers_dir = os.path.join(workdir, 'covers')
+            extract_covers(form.covers.data.stream, covers_dir)
+        params = {'path': path, 'covers_dir': covers_dir, 'workdir': workdir,
+                  'restart': form.restart.data, 'source': upload.filename}
+        try:
+            job_runner.submit('import_catalog', params, current_user.id)
+            flash('Импорт запущен, ход выполнения - в списке ниже.', 'info')
+        except JobLimitExceeded as error:
+            discard_workdir(encode_params(params))
+            flash(f'{error}. Дождитесь окончания или отмените одну из них.', 'warning')
+        return redirect(url_for('catalog_import'))
+
+    imports = CatalogImport.query.order_by(CatalogImport.id.desc()).limit(10).all()
+    return render_template('catalog_import.html', form=form, imports=imports,
+                           jobs=job_runner.recent('import_catalog', current_user.id))
+
+@route('/import/<int:import_id>/errors')
+@permission_required(MANAGE_BOOKS)
+def catalog_import_errors(import_id):
+    job = db.get_or_404(CatalogImport, import_id)
+    return send_from_directory(current_app.config['IMPORT_FOLDER'], os.path.basename(error_report_path('', job)),
+                               as_attachment=True, mimetype='text/csv')
+
+# --- Фабрика приложения ---
+def create_app(config=None):
+    # config - словарь настроек поверх значений по умолчанию (в том числе DATABASE_URL)
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = 'your-secret-key'
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOAD_FOLDER'] = 'static/covers'
+    app.config['IMPORT_FOLDER'] = os.path.join(app.instance_path, 'imports')  # отчёты импорта каталога
+    app.config['VIEW_ARCHIVE_FOLDER'] = os.path.join(app.instance_path, 'view_archive')
+    app.config['VIEW_LOG_RETENTION_DAYS'] = int(os.environ.get('VIEW_LOG_RETENTION_DAYS', 180))  # flask views archive
+    app.config['RECENTLY_VIEWED_TTL_DAYS'] = int(os.environ.get('RECENTLY_VIEWED_TTL_DAYS', 180))  # flask views prune-recent
+    app.config.from_mapping(config or {})
+    configure_database(app)  # DATABASE_URL и параметры движка из настроек или окружения
+
+    db.init_app(app)
+    login_manager.init_app(app)
+    csrf.init_app(app)
+    register_commands(app)
+    init_instrumentation(app)
+    view_buffer.init_app(app)
+    cache.init_app(app)
+    init_identity(login_manager)  # пользователь и роль из кэша, без запроса к базе
+    job_runner.init_app(app)  # экспорты в фоновых процессах
+
+    app.add_template_global(cover_url)
+    app.add_template_global(book_card)
+    app.add_template_global(facet_args)
+    for rule, view, options in _routes:
+        app.add_url_rule(rule, view_func=view, **options)
+    return app
 
 if __name__ == '__main__':
-    if not os.path.exists('library.db'):
-        with app.app_context():
-            db.create_all()
-            print('✅ База данных создана')
-    if not os.path.exists(app.config['UPLOAD_FOLDER']):
-        os.makedirs(app.config['UPLOAD_FOLDER'])
-    app.run(debug=True)
+    # База и папки создаются командой "flask --app app setup"
+    create_app().run(debug=True)
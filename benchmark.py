@@ -0,0 +1,293 @@
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+import urllib.request
+import numpy as np
+
+# --- Нагрузочный прогон основных маршрутов ---
+# Пример: python benchmark.py --server client --requests 200
+#         python benchmark.py --server gunicorn --workers 4 --concurrency 8
+# Для каждого маршрута считаются p50/p95/p99 (мс) и пропускная способность,
+# результат сравнивается с сохранённой базой (--baseline), при регрессии
+# сильнее --tolerance код возврата 1. --save-baseline обновляет базу.
+# Экспорты выполняются фоновыми задачами (jobs.py): для них меряется время
+# от отправки формы до готовности файла (статус задачи опрашивается).
+
+DEFAULT_BASELINE = os.path.join('benchmarks', 'baseline.json')
+
+TARGETS = ['index', 'index_deep', 'view_book', 'statistics', 'activity_log',
+           'export_statistics', 'export_activity_log']
+
+# Экспорты тяжелее страниц, для них меньше запросов
+HEAVY_TARGETS = {'export_statistics', 'export_activity_log'}
+
+JOB_POLL_INTERVAL = 0.02
+CSRF_TOKEN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+LATEST_JOB = re.compile(r'data-job="(\d+)"')
+
+
+def dataset_info():
+    from app import create_app
+    from models import db, Book, Review, BookViewLog
+    from stats import approximate_view_log_size
+    with create_app().app_context():
+        return {
+            'books': db.session.query(db.func.count(Book.id)).scalar(),
+            'reviews': db.session.query(db.func.count(Review.id)).scalar(),
+            'views': approximate_view_log_size(),
+            'max_book_id': db.session.query(db.func.max(Book.id)).scalar() or 1,
+            'database': db.engine.dialect.name
+        }
+
+
+def target_paths(name, info, rng):
+    if name == 'index':
+        return '/'
+    if name == 'index_deep':
+        return f'/page/{max(1, info["books"] // 10 // 2)}'
+    if name == 'view_book':
+        return f'/book/{rng.randint(1, info["max_book_id"])}'
+    if name == 'statistics':
+        return '/statistics'
+    if name == 'activity_log':
+        return '/activity_log'
+    if name == 'export_statistics':
+        return '/statistics'
+    if name == 'export_activity_log':
+        # Полный журнал на десятках миллионов строк - отдельная задача, берём сутки
+        day = (datetime.date.today() - datetime.timedelta(days=1)).isoformat()
+        return f'/activity_log?date_from={day}'
+    raise ValueError(name)
+
+
+def run_export(session, name, page):
+    # Время от отправки формы экспорта до готовности файла; (секунды, код)
+    token = CSRF_TOKEN.search(session.fetch(page)[1])
+    data = dict(urllib.parse.parse_qsl(urllib.parse.urlsplit(page).query))
+    if token:
+        data['csrf_token'] = token.group(1)
+    started = time.perf_counter()
+    status, html = session.fetch('/' + name, data)
+    job = LATEST_JOB.search(html)  # задачи на странице - от новых к старым
+    if status >= 400 or job is None:
+        return time.perf_counter() - started, status if status >= 400 else 500
+    while True:
+        status, body = session.fetch(f'/jobs/{job.group(1)}')
+        state = json.loads(body)['status'] if status == 200 else 'failed'
+        if state not in ('queued', 'running'):
+            return time.perf_counter() - started, 200 if state == 'done' else 500
+        time.sleep(JOB_POLL_INTERVAL)
+
+
+# --- Клиенты ---
+
+class TestClientSession:
+    def __init__(self, app, username, password):
+        self.client = app.test_client()
+        self.client.post('/login', data={'username': username, 'password': password})
+
+    def get(self, path):
+        response = self.client.get(path)
+        size = len(response.get_data())
+        response.close()
+        return response.status_code, size
+
+    def fetch(self, path, data=None):
+        # (код, текст); POST при data, с переходом по перенаправлению
+        if data is None:
+            response = self.client.get(path)
+        else:
+            response = self.client.post(path, data=data, follow_redirects=True)
+        return response.status_code, response.get_data(as_text=True)
+
+
+class HttpSession:
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()))
+        page = self.opener.open(self.base_url + '/login').read().decode('utf-8')
+        token = CSRF_TOKEN.search(page)
+        data = {'username': username, 'password': password}
+        if token:
+            data['csrf_token'] = token.group(1)
+        self.opener.open(self.base_url + '/login', urllib.parse.urlencode(data).encode()).read()
+
+    def get(self, path):
+        try:
+            with self.opener.open(self.base_url + path) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as error:
+            return error.code, 0
+
+    def fetch(self, path, data=None):
+        # (код, текст); POST при data, перенаправление urllib выполняет сам
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        try:
+            with self.opener.open(self.base_url + path, body) as response:
+                return response.status, response.read().decode('utf-8')
+        except urllib.error.HTTPError as error:
+            return error.code, ''
+
+
+# --- Прогон ---
+
+def run_target(name, sessions, info, requests, warmup, seed):
+    rng = random.Random(seed)
+    paths = [target_paths(name, info, rng) for _ in range(warmup + requests)]
+    local = threading.local()
+    lock = threading.Lock()
+    queue = iter(range(len(sessions)))
+
+    def session():
+        if not hasattr(local, 'session'):
+            with lock:
+                local.session = sessions[next(queue)]
+        return local.session
+
+    def timed(path):
+        if name in HEAVY_TARGETS:
+            return run_export(session(), name, path)
+        started = time.perf_counter()
+        status, _ = session().get(path)
+        return time.perf_counter() - started, status
+
+    with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+        list(executor.map(timed, paths[:warmup]))
+        started = time.perf_counter()
+        results = list(executor.map(timed, paths[warmup:]))
+        elapsed = time.perf_counter() - started
+
+    latencies = np.array([latency for latency, _ in results]) * 1000
+    errors = sum(1 for _, status in results if status >= 400)
+    return {
+        'requests': len(results),
+        'errors': errors,
+        'p50': round(float(np.percentile(latencies, 50)), 2),
+        'p95': round(float(np.percentile(latencies, 95)), 2),
+        'p99': round(float(np.percentile(latencies, 99)), 2),
+        'rps': round(len(results) / elapsed, 1)
+    }
+
+
+def start_gunicorn(port, workers):
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'wsgi:app']
+    )
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/login').read()
+            return process
+        except OSError:
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError('gunicorn не запустился')
+
+
+def compare(results, baseline, tolerance):
+    # Регрессия: p95 выше базы или пропускная способность ниже базы больше чем на tolerance
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        if current['p95'] > base['p95'] * (1 + tolerance):
+            regressions.append(f'{name}: p95 {current["p95"]} мс против {base["p95"]} мс')
+        if current['rps'] < base['rps'] * (1 - tolerance):
+            regressions.append(f'{name}: {current["rps"]} запр/с против {base["rps"]} запр/с')
+    return regressions
+
+
+def print_table(results, baseline):
+    print(f'{"маршрут":<22}{"p50":>9}{"p95":>9}{"p99":>9}{"запр/с":>9}{"ошибок":>8}{"база p95":>10}')
+    for name, row in results.items():
+        base = baseline.get(name, {}).get('p95', '-')
+        print(f'{name:<22}{row["p50"]:>9}{row["p95"]:>9}{row["p99"]:>9}{row["rps"]:>9}{row["errors"]:>8}{base:>10}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный прогон маршрутов.')
+    parser.add_argument('--server', choices=['client', 'gunicorn'], default='client',
+                        help='Тестовый клиент Flask или локальный gunicorn.')
+    parser.add_argument('--url', help='Адрес уже запущенного сервера вместо локального gunicorn.')
+    parser.add_argument('--workers', type=int, default=4, help='Процессы gunicorn.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=TARGETS)
+    parser.add_argument('--username', default='admin')
+    parser.add_argument('--password', default='adminpass')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--tolerance', type=float, default=0.2)
+    parser.add_argument('--output', help='Сохранить результаты прогона в JSON.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    info = dataset_info()
+    mode = 'http' if args.url else args.server
+    print(f'Данные: {info["books"]} книг, {info["reviews"]} рецензий, ~{info["views"]} просмотров ({info["database"]})')
+
+    process = None
+    if mode == 'client':
+        from app import create_app
+        app = create_app({'WTF_CSRF_ENABLED': False})
+        sessions = [TestClientSession(app, args.username, args.password) for _ in range(args.concurrency)]
+    else:
+        if mode == 'gunicorn':
+            process = start_gunicorn(args.port, args.workers)
+        base_url = args.url or f'http://127.0.0.1:{args.port}'
+        sessions = [HttpSession(base_url, args.username, args.password) for _ in range(args.concurrency)]
+
+    results = {}
+    try:
+        for name in args.targets:
+            requests = max(1, args.requests // 10) if name in HEAVY_TARGETS else args.requests
+            warmup = min(args.warmup, requests)
+            results[name] = run_target(name, sessions, info, requests, warmup, args.seed)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    stored = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding='utf-8') as f:
+            stored = json.load(f)
+    baseline = stored.get(mode, {})
+    print_table(results, baseline.get('results', {}))
+
+    run = {'dataset': info, 'concurrency': args.concurrency, 'results': results}
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(run, f, ensure_ascii=False, indent=2)
+
+    if args.save_baseline:
+        stored[mode] = run
+        os.makedirs(os.path.dirname(args.baseline) or '.', exist_ok=True)
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(stored, f, ensure_ascii=False, indent=2)
+        print(f'База сохранена в {args.baseline}')
+        return 0
+
+    if baseline and baseline.get('dataset', {}).get('books') != info['books']:
+        print('⚠ База записана на данных другого размера, сравнение ориентировочное')
+    regressions = compare(results, baseline.get('results', {}), args.tolerance)
+    for line in regressions:
+        print(f'❌ {line}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import pickle
+import threading
+import time
+import uuid
+
+try:
+    import redis
+except ImportError:  # общий кэш необязателен
+    redis = None
+
+
+# --- Кэш приложения ---
+# CACHE_BACKEND = 'local' (LRU + TTL в памяти процесса) или 'redis'
+# (общий для всех воркеров, CACHE_REDIS_URL). Значения хранятся вместе
+# со сроком жизни, get_or_set() не даёт нескольким потокам одновременно
+# пересчитывать одно и то же значение после его истечения.
+
+_MISSING = object()
+
+
+class LocalCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self.evictions = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}  # ключ -> [блокировка, число ожидающих и владеющих]
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return _MISSING
+            value, expires = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return _MISSING
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (value, expires)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    @contextmanager
+    def lock(self, key):
+        # Блокировка ключа живёт, пока её кто-то держит или ждёт, поэтому
+        # словарь не растёт с числом когда-либо пересчитанных ключей
+        with self._lock:
+            entry = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._key_locks[key]
+
+
+class RedisCache:
+    def __init__(self, client, prefix='library:', lock_timeout=30):
+        # client - redis.Redis или совместимая локальная замена (например, fakeredis)
+        self.client = client
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.evictions = 0  # вытеснением управляет сам Redis
+
+    def get(self, key):
+        data = self.client.get(self.prefix + key)
+        return _MISSING if data is None else pickle.loads(data)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl)
+
+    def delete(self, *keys):
+        if keys:
+            self.client.delete(*[self.prefix + key for key in keys])
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+    @contextmanager
+    def lock(self, key):
+        # Простая блокировка SET NX EX: работает без Lua и на локальных заменах Redis
+        name = self.prefix + 'lock:' + key
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        acquired = False
+        while not acquired and time.monotonic() < deadline:
+            acquired = bool(self.client.set(name, token, nx=True, ex=self.lock_timeout))
+            if not acquired:
+                time.sleep(0.05)
+        try:
+            yield
+        finally:
+            if acquired and self.client.get(name) == token.encode():
+                self.client.delete(name)
+
+
+class Cache:
+    def __init__(self, app=None):
+        self.backend = LocalCache()
+        self.default_ttl = 60
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, client=None):
+        app.config.setdefault('CACHE_BACKEND', 'local')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 60)
+        app.config.setdefault('CACHE_MAX_SIZE', 1024)
+        app.config.setdefault('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+
+        self.default_ttl = app.config['CACHE_DEFAULT_TTL']
+        if app.config['CACHE_BACKEND'] == 'redis':
+            if client is None:
+                if redis is None:
+                    raise RuntimeError('Для CACHE_BACKEND=redis нужен пакет redis')
+                client = redis.Redis.from_url(app.config['CACHE_REDIS_URL'])
+            self.backend = RedisCache(client)
+        else:
+            self.backend = LocalCache(app.config['CACHE_MAX_SIZE'])
+        app.extensions['cache'] = self
+
+    def get(self, key, default=None):
+        value = self.backend.get(key)
+        if value is _MISSING:
+            self.misses += 1
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None):
+        self.backend.set(key, value, ttl or self.default_ttl)
+
+    def get_or_set(self, key, factory, ttl=None):
+        value = self.backend.get(key)
+        if value is not _MISSING:
+            self.hits += 1
+            return value
+
+        # Пересчитывает только тот, кто первым взял блокировку, остальные ждут
+        with self.backend.lock(key):
+            value = self.backend.get(key)
+            if value is not _MISSING:
+                self.hits += 1
+                return value
+            self.misses += 1
+            value = factory()
+            self.set(key, value, ttl)
+            return value
+
+    def delete(self, *keys):
+        self.backend.delete(*keys)
+
+    def clear(self):
+        self.backend.clear()
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.backend.evictions
+        }
+
+
+cache = Cache()
@@ -0,0 +1,292 @@
+from models import db, Book, Genre, Cover, CatalogImport, book_genres
+from forms import BookForm
+from covers import store_cover, release_cover, InvalidCover, EXTENSIONS
+from sqlalchemy import insert
+from werkzeug.datastructures import FileStorage
+from wtforms import IntegerField
+from wtforms.validators import DataRequired, Length, NumberRange
+import csv
+import datetime
+import hashlib
+import json
+import mimetypes
+import os
+import zipfile
+
+
+# --- Импорт каталога ---
+# Источник - CSV (с заголовком) или JSONL, поля как в BookForm, жанры -
+# названия через ";" (в JSONL можно списком), cover - имя файла в папке
+# обложек. Строки проверяются правилами BookForm и вставляются пачками;
+# после каждой пачки в той же транзакции сохраняется число прочитанных
+# строк, поэтому прерванный импорт того же файла продолжается с места
+# остановки. Ошибки пишутся в CSV-отчёт: номер строки, поле, сообщение;
+# строка с нечитаемой обложкой тоже считается ошибочной и не вставляется.
+# Ошибки пачки дописываются в отчёт только после её фиксации, чтобы
+# продолженный импорт не повторял их.
+# Если импорт прерывается исключением, задача отмечается как failed.
+# HTML описаний отрисовывается после импорта (rerender_stale).
+
+CHUNK_SIZE = 5000
+
+BOOK_FIELDS = ('title', 'description', 'year', 'publisher', 'author', 'pages')
+
+ERROR_REPORT_HEADER = ['Строка', 'Поле', 'Ошибка']
+
+
+class CatalogAlreadyImported(Exception):
+    def __init__(self, job):
+        super().__init__(f'Файл уже импортирован ({job.finished_at:%d.%m.%Y %H:%M})')
+        self.job = job
+
+
+def _field_rules():
+    # Правила берутся из объявления BookForm, чтобы не расходиться с формой
+    rules = {}
+    for name in BOOK_FIELDS:
+        field = getattr(BookForm, name)
+        rule = {'label': field.args[0], 'integer': issubclass(field.field_class, IntegerField),
+                'required': False, 'max_length': None, 'min': None, 'max': None}
+        for validator in field.kwargs.get('validators', []):
+            if isinstance(validator, DataRequired):
+                rule['required'] = True
+            elif isinstance(validator, Length) and validator.max >= 0:
+                rule['max_length'] = validator.max
+            elif isinstance(validator, NumberRange):
+                rule['min'], rule['max'] = validator.min, validator.max
+        rules[name] = rule
+    return rules
+
+
+BOOK_RULES = _field_rules()
+
+
+def validate_row(row, genre_map, covers_dir=None):
+    # Возвращает (значения книги, id жанров, имя обложки, [(поле, ошибка)])
+    values, errors = {}, []
+    for name, rule in BOOK_RULES.items():
+        value = row.get(name)
+        value = str(value).strip() if value is not None else ''
+        if not value:
+            if rule['required']:
+                errors.append((name, f'{rule["label"]}: обязательное поле'))
+            continue
+        if rule['integer']:
+            try:
+                value = int(value)
+            except ValueError:
+                errors.append((name, f'{rule["label"]}: ожидается целое число'))
+                continue
+            if (rule['min'] is not None and value < rule['min']) or (rule['max'] is not None and value > rule['max']):
+                errors.append((name, f'{rule["label"]}: вне диапазона {rule["min"]}-{rule["max"]}'))
+                continue
+        elif rule['max_length'] and len(value) > rule['max_length']:
+            errors.append((name, f'{rule["label"]}: длиннее {rule["max_length"]} символов'))
+            continue
+        values[name] = value
+
+    genres = row.get('genres') or []
+    if isinstance(genres, str):
+        genres = genres.split(';')
+    genre_ids = []
+    for genre in (str(g).strip() for g in genres):
+        if not genre:
+            continue
+        genre_id = genre_map.get(genre.lower())
+        if genre_id is None:
+            errors.append(('genres', f'Неизвестный жанр: {genre}'))
+        elif genre_id not in genre_ids:
+            genre_ids.append(genre_id)
+    if not genre_ids and not any(field == 'genres' for field, _ in errors):
+        errors.append(('genres', 'Жанры: обязательное поле'))
+
+    cover = (row.get('cover') or '').strip() or None
+    if cover:
+        if covers_dir is None:
+            errors.append(('cover', 'Папка обложек не указана'))
+        elif os.path.splitext(cover)[1].lower() not in EXTENSIONS:
+            errors.append(('cover', 'Только изображения (.jpg, .jpeg, .png)'))
+        elif not os.path.isfile(os.path.join(covers_dir, os.path.basename(cover))):
+            errors.append(('cover', f'Файл не найден: {cover}'))
+    return values, genre_ids, cover, errors
+
+
+def read_rows(path):
+    # Пары (номер строки, словарь); для нечитаемой строки JSONL - (номер, None)
+    if os.path.splitext(path)[1].lower() in ('.jsonl', '.ndjson'):
+        with open(path, encoding='utf-8-sig') as f:
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    row = None
+                yield number, row if isinstance(row, dict) else None
+    else:
+        with open(path, encoding='utf-8-sig', newline='') as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+
+
+def fingerprint(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def estimate_rows(path):
+    # Число строк файла без заголовка CSV - для прогресса (многострочные поля CSV его завышают)
+    lines = 0
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            lines += chunk.count(b'\n')
+    if os.path.splitext(path)[1].lower() not in ('.jsonl', '.ndjson'):
+        lines -= 1
+    return max(lines, 0)
+
+
+def error_report_path(folder, job):
+    return os.path.join(folder, f'import_{job.id}_errors.csv')
+
+
+def extract_covers(file, folder):
+    # Из архива берутся только изображения и только имена файлов (без путей)
+    os.makedirs(folder, exist_ok=True)
+    with zipfile.ZipFile(file) as archive:
+        for entry in archive.infolist():
+            name = os.path.basename(entry.filename)
+            if entry.is_dir() or os.path.splitext(name)[1].lower() not in EXTENSIONS:
+                continue
+            with archive.open(entry) as source, open(os.path.join(folder, name), 'wb') as target:
+                for chunk in iter(lambda: source.read(1024 * 1024), b''):
+                    target.write(chunk)
+
+
+def _store_covers(covers, covers_dir, upload_folder):
+    # Обложки пачки: (строки Cover по позиции книги, [(позиция, номер строки, ошибка)])
+    stored, errors = {}, []
+    if covers:
+        os.makedirs(upload_folder, exist_ok=True)
+    for position, number, name in covers:
+        path = os.path.join(covers_dir, os.path.basename(name))
+        mimetype = mimetypes.guess_type(path)[0] or 'image/jpeg'
+        try:
+            with open(path, 'rb') as stream:
+                md5, filename = store_cover(FileStorage(stream=stream, filename=name, content_type=mimetype), upload_folder)
+        except (InvalidCover, OSError) as error:
+            errors.append((position, number, f'{name}: {error}'))
+            continue
+        stored[position] = {'filename': filename, 'mimetype': mimetype, 'md5_hash': md5}
+    return stored, errors
+
+
+def _flush_chunk(job, report, report_rows, books, links, covers, covers_dir, upload_folder):
+    # Обложки сохраняются до вставки: строки с ошибкой обложки не вставляются
+    stored, errors = _store_covers(covers, covers_dir, upload_folder)
+    report_rows = report_rows + [[number, 'cover', message] for _, number, message in errors]
+    skipped = {position for position, _, _ in errors}
+    kept = [position for position in range(len(books)) if position not in skipped]
+    job.imported += len(kept)
+    job.failed += len(skipped)
+    try:
+        if kept:
+            book_table = Book.__table__
+            ids = db.session.execute(
+                insert(book_table).returning(book_table.c.id, sort_by_parameter_order=True),
+                [books[position] for position in kept]
+            ).scalars().all()
+            ids = dict(zip(kept, ids))
+            db.session.execute(insert(book_genres), [
+                {'book_id': ids[position], 'genre_id': genre_id} for position in kept for genre_id in links[position]
+            ])
+            if stored:
+                db.session.execute(insert(Cover), [
+                    dict(row, book_id=ids[position]) for position, row in stored.items()
+                ])
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        # Файлы пачки, на которые не успели сослаться, не оставляем
+        for row in stored.values():
+            release_cover(Cover(filename=row['filename'], md5_hash=row['md5_hash']), upload_folder)
+        raise
+    csv.writer(report, delimiter=';').writerows(sorted(report_rows, key=lambda row: row[0]))
+    report.flush()
+
+
+def import_catalog(path, report_folder, covers_dir=None, upload_folder=None, chunk_size=CHUNK_SIZE,
+                   restart=False, progress=None, source=None):
+    source_hash = fingerprint(path)
+    job = CatalogImport.query.filter_by(fingerprint=source_hash).order_by(CatalogImport.id.desc()).first()
+    if job is not None and job.status == 'done' and not restart:
+        raise CatalogAlreadyImported(job)
+    if job is None or restart:
+        job = CatalogImport(source=source or os.path.basename(path), fingerprint=source_hash, status='running')
+        db.session.add(job)
+    job.status = 'running'
+    db.session.commit()
+
+    try:
+        return _run_import(job, path, report_folder, covers_dir, upload_folder, chunk_size, progress)
+    except Exception:
+        # Задача не должна остаться в статусе running: отмечаем её упавшей,
+        # прочитанные строки сохранены, повторный импорт продолжит с них
+        db.session.rollback()
+        job.status = 'failed'
+        db.session.commit()
+        raise
+
+
+def _run_import(job, path, report_folder, covers_dir, upload_folder, chunk_size, progress):
+    os.makedirs(report_folder, exist_ok=True)
+    report_path = error_report_path(report_folder, job)
+    new_report = job.rows_done == 0 or not os.path.exists(report_path)
+    genre_map = {name.lower(): genre_id for genre_id, name in db.session.query(Genre.id, Genre.name)}
+
+    with open(report_path, 'w' if new_report else 'a', encoding='utf-8-sig' if new_report else 'utf-8', newline='') as report:
+        if new_report:
+            csv.writer(report, delimiter=';').writerow(ERROR_REPORT_HEADER)
+
+        books, links, covers, report_rows = [], [], [], []
+        pending = failed = 0
+        skip = job.rows_done
+        for number, row in read_rows(path):
+            if skip:
+                skip -= 1
+                continue
+            pending += 1
+            if row is None:
+                report_rows.append([number, '', 'Некорректная строка JSON'])
+                failed += 1
+            else:
+                values, genre_ids, cover, errors = validate_row(row, genre_map, covers_dir)
+                if errors:
+                    report_rows.extend([number, field, message] for field, message in errors)
+                    failed += 1
+                else:
+                    values.update(review_count=0, rating_sum=0, html_version=0)
+                    if cover:
+                        covers.append((len(books), number, cover))
+                    books.append(values)
+                    links.append(genre_ids)
+
+            if pending >= chunk_size:
+                # Счётчики задачи фиксируются той же транзакцией, что и книги
+                job.rows_done += pending
+                job.failed += failed
+                _flush_chunk(job, report, report_rows, books, links, covers, covers_dir, upload_folder)
+                if progress:
+                    progress(job)
+                books, links, covers, report_rows = [], [], [], []
+                pending = failed = 0
+
+        job.rows_done += pending
+        job.failed += failed
+        job.status = 'done'
+        job.finished_at = datetime.datetime.utcnow()
+        _flush_chunk(job, report, report_rows, books, links, covers, covers_dir, upload_folder)
+    return job
@@ -0,0 +1,267 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from models import db, Book, Review, BookViewDaily, BookTrending, BookCoView
+from stats import rebuild_daily_views, check_daily_views, recompute_rating_aggregates
+from query_plans import check_query_plans
+from search import rebuild_search_index
+from markdown_render import rerender_stale, RENDERER_VERSION
+from view_archive import archive_views, archived_activity_rows, check_archived_views, BATCH_SIZE, BATCH_PAUSE
+from exports import stream_csv, parse_date, ACTIVITY_LOG_HEADER
+from catalog_import import import_catalog, error_report_path, CatalogAlreadyImported, CHUNK_SIZE
+from fragments import bump_catalog_version
+from recommendations import update_recommendations, rebuild_recommendations
+from trending import refresh_leaderboards, rebuild_trending
+from recently_viewed import prune_recently_viewed
+from schema import upgrade_schema
+from sqlalchemy import inspect
+import os
+import time
+
+# --- Консольные команды (flask <группа> <команда>) ---
+
+rollup_cli = AppGroup('rollup', help='Суточная сводка просмотров.')
+
+
+@rollup_cli.command('rebuild')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None,
+              help='Пересчитать только начиная с этой даты (ГГГГ-ММ-ДД).')
+def rollup_rebuild(since):
+    rows = rebuild_daily_views(since)
+    click.echo(f'✅ Сводка пересчитана, строк: {rows}')
+
+
+@rollup_cli.command('check')
+@click.option('--since', type=click.DateTime(formats=['%Y-%m-%d']), default=None)
+def rollup_check(since):
+    mismatches = check_daily_views(since)
+    for book_id, day, expected, actual in mismatches:
+        click.echo(f'книга {book_id}, {day}: в журнале {expected}, в сводке {actual}')
+    if mismatches:
+        raise click.ClickException(f'Найдено расхождений: {len(mismatches)}')
+    click.echo('✅ Сводка совпадает с журналом')
+
+
+ratings_cli = AppGroup('ratings', help='Агрегаты оценок книг.')
+
+
+@ratings_cli.command('repair')
+def ratings_repair():
+    books = recompute_rating_aggregates()
+    bump_catalog_version()
+    click.echo(f'✅ Оценки пересчитаны для книг: {books}')
+
+
+search_cli = AppGroup('search', help='Полнотекстовый индекс каталога.')
+
+
+@search_cli.command('rebuild')
+def search_rebuild():
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Индекс FTS5 поддерживается только для SQLite')
+    books = rebuild_search_index()
+    click.echo(f'✅ Поисковый индекс перестроен, книг: {books}')
+
+
+markdown_cli = AppGroup('markdown', help='HTML, отрисованный из Markdown.')
+
+
+@markdown_cli.command('rerender')
+@click.option('--batch-size', default=500, show_default=True)
+@click.option('--workers', type=int, default=None, help='Число процессов (по умолчанию - по числу ядер).')
+def markdown_rerender(batch_size, workers):
+    books = rerender_stale(Book, batch_size=batch_size, workers=workers)
+    reviews = rerender_stale(Review, batch_size=batch_size, workers=workers)
+    bump_catalog_version()  # HTML в кэше фрагментов устарел
+    click.echo(f'✅ Версия {RENDERER_VERSION}: обновлено книг {books}, рецензий {reviews}')
+
+
+views_cli = AppGroup('views', help='Хранение и архив журнала просмотров.')
+
+
+@views_cli.command('archive')
+@click.option('--days', type=int, default=None, help='Срок хранения в журнале, дней (VIEW_LOG_RETENTION_DAYS).')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+@click.option('--pause', default=BATCH_PAUSE, show_default=True, help='Пауза между пачками, с.')
+def views_archive(days, batch_size, pause):
+    days = days if days is not None else current_app.config['VIEW_LOG_RETENTION_DAYS']
+    started = time.perf_counter()
+
+    def progress(archived):
+        if archived % (batch_size * 100) == 0:
+            click.echo(f'перенесено {archived} ({time.perf_counter() - started:.1f} с)')
+
+    try:
+        archived = archive_views(current_app.config['VIEW_ARCHIVE_FOLDER'], days, batch_size, pause, progress=progress)
+    except RuntimeError as error:
+        raise click.ClickException(str(error))
+    click.echo(f'✅ В архив перенесено просмотров: {archived} (хранятся последние {days} дн.)')
+
+
+@views_cli.command('export')
+@click.option('--from', 'date_from', required=True, help='Начало периода, ГГГГ-ММ-ДД.')
+@click.option('--to', 'date_to', required=True, help='Конец периода включительно, ГГГГ-ММ-ДД.')
+@click.option('--book-id', type=int, default=None)
+@click.option('--output', type=click.File('w', encoding='utf-8', lazy=True), default='-',
+              help='Файл CSV (по умолчанию - вывод в консоль).')
+def views_export(date_from, date_to, book_id, output):
+    date_from, date_to = parse_date(date_from), parse_date(date_to)
+    if not date_from or not date_to:
+        raise click.ClickException('Даты указываются в формате ГГГГ-ММ-ДД')
+    rows = archived_activity_rows(current_app.config['VIEW_ARCHIVE_FOLDER'], date_from, date_to, book_id)
+    for chunk in stream_csv(ACTIVITY_LOG_HEADER, rows):
+        output.write(chunk)
+
+
+@views_cli.command('check-archive')
+def views_check_archive():
+    mismatches = check_archived_views(current_app.config['VIEW_ARCHIVE_FOLDER'])
+    for book_id, day, expected, actual in mismatches:
+        click.echo(f'книга {book_id}, {day}: в архиве {expected}, в сводке {actual}')
+    if mismatches:
+        raise click.ClickException(f'Найдено расхождений: {len(mismatches)}')
+    click.echo('✅ Сводка за архивные сутки совпадает с архивом')
+
+
+@views_cli.command('prune-recent')
+@click.option('--days', type=int, default=None, help='Срок хранения, дней (RECENTLY_VIEWED_TTL_DAYS).')
+def views_prune_recent(days):
+    days = days if days is not None else current_app.config['RECENTLY_VIEWED_TTL_DAYS']
+    deleted = prune_recently_viewed(days)
+    click.echo(f'✅ Удалено списков недавно просмотренных: {deleted} (не обновлялись дольше {days} дн.)')
+
+
+catalog_cli = AppGroup('catalog', help='Импорт каталога книг.')
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--covers', type=click.Path(exists=True, file_okay=False), default=None,
+              help='Папка с файлами обложек (поле cover).')
+@click.option('--chunk-size', default=CHUNK_SIZE, show_default=True)
+@click.option('--restart', is_flag=True, help='Импортировать заново, не продолжая прошлую попытку.')
+@click.option('--no-render', is_flag=True, help='Не отрисовывать Markdown описаний после импорта.')
+def catalog_import_file(path, covers, chunk_size, restart, no_render):
+    started = time.perf_counter()
+
+    def progress(job):
+        elapsed = time.perf_counter() - started
+        click.echo(f'строк {job.rows_done}: добавлено {job.imported}, с ошибками {job.failed} ({elapsed:.1f} с)')
+
+    report_folder = current_app.config['IMPORT_FOLDER']
+    try:
+        job = import_catalog(path, report_folder, covers_dir=covers, upload_folder=current_app.config['UPLOAD_FOLDER'],
+                             chunk_size=chunk_size, restart=restart, progress=progress)
+    except CatalogAlreadyImported as error:
+        raise click.ClickException(f'{error}; для повторного импорта укажите --restart')
+    if not no_render:
+        rerender_stale(Book)
+    bump_catalog_version()
+    if job.failed:
+        click.echo(f'Отчёт об ошибках: {os.path.abspath(error_report_path(report_folder, job))}')
+    click.echo(f'✅ Импорт #{job.id} завершён: добавлено книг {job.imported}, строк с ошибками {job.failed}')
+
+
+recommendations_cli = AppGroup('recommendations', help='Рекомендации "Читатели также смотрели".')
+
+
+def _recommendations_progress(started):
+    def progress(day, rows):
+        click.echo(f'до {day:%Y-%m-%d}: строк корзин {rows} ({time.perf_counter() - started:.1f} с)')
+    return progress
+
+
+@recommendations_cli.command('update')
+def recommendations_update():
+    started = time.perf_counter()
+    books = update_recommendations(progress=_recommendations_progress(started))
+    bump_catalog_version()
+    click.echo(f'✅ Соседи пересчитаны для книг: {books} ({time.perf_counter() - started:.1f} с)')
+
+
+@recommendations_cli.command('rebuild')
+def recommendations_rebuild():
+    started = time.perf_counter()
+    books = rebuild_recommendations(progress=_recommendations_progress(started))
+    bump_catalog_version()
+    click.echo(f'✅ Матрица построена заново, книг с соседями: {books} ({time.perf_counter() - started:.1f} с)')
+
+
+trending_cli = AppGroup('trending', help='Рейтинги "Популярное сейчас".')
+
+
+@trending_cli.command('refresh')
+def trending_refresh():
+    rows = refresh_leaderboards()
+    click.echo(f'✅ Рейтинги пересчитаны, строк: {rows}')
+
+
+@trending_cli.command('rebuild')
+def trending_rebuild():
+    started = time.perf_counter()
+    rows = rebuild_trending()
+    click.echo(f'✅ Счета книг пересчитаны по суточной сводке, строк рейтингов: {rows} '
+               f'({time.perf_counter() - started:.1f} с)')
+
+
+@click.command('setup')
+def setup():
+    # Схема и рабочие папки; выполняется при установке и обновлении, а не при старте воркеров
+    created, columns, indexes = upgrade_schema()
+    for change in created + columns + indexes:
+        click.echo(f'  + {change}')
+    click.echo(f'✅ Схема базы данных проверена: таблиц создано {len(created)}, '
+               f'столбцов добавлено {len(columns)}, индексов {len(indexes)}')
+    if columns or (created and Book.__table__.name not in created):
+        _fill_upgraded(created, columns)
+    for key in ('UPLOAD_FOLDER', 'IMPORT_FOLDER', 'VIEW_ARCHIVE_FOLDER', 'JOBS_FOLDER'):
+        os.makedirs(current_app.config[key], exist_ok=True)
+    click.echo('✅ Папки обложек, импорта, архива и экспортов созданы')
+
+
+def _fill_upgraded(created, columns):
+    # Производные данные для таблиц и столбцов, добавленных к существующей базе
+    if 'book.review_count' in columns:
+        click.echo(f'оценки пересчитаны для книг: {recompute_rating_aggregates()}')
+    if 'book.html_version' in columns or 'review.html_version' in columns:
+        click.echo(f'HTML описаний: {rerender_stale(Book)}, рецензий: {rerender_stale(Review)}')
+    if db.engine.dialect.name == 'sqlite' and 'book_fts' not in inspect(db.engine).get_table_names():
+        click.echo(f'поисковый индекс, книг: {rebuild_search_index()}')
+    if BookViewDaily.__table__.name in created:
+        click.echo(f'сводка просмотров, строк: {rebuild_daily_views()}')
+    if BookTrending.__table__.name in created:
+        click.echo(f'рейтинги "популярное сейчас", строк: {rebuild_trending()}')
+    if BookCoView.__table__.name in created:
+        click.echo(f'рекомендации, книг: {rebuild_recommendations()}')
+    bump_catalog_version()
+
+
+@click.command('check-plans')
+@click.option('--verbose', is_flag=True, help='Показать планы всех запросов.')
+def check_plans(verbose):
+    if db.engine.dialect.name != 'sqlite':
+        raise click.ClickException('Проверка планов поддерживается только для SQLite')
+    failed = 0
+    for name, (plan, scans) in check_query_plans().items():
+        if scans or verbose:
+            click.echo(f'{name}:')
+            for detail in plan:
+                click.echo(f'    {detail}')
+        if scans:
+            failed += 1
+    if failed:
+        raise click.ClickException(f'Полный просмотр таблицы в запросах: {failed}')
+    click.echo('✅ Все горячие запросы используют индексы')
+
+
+def register_commands(app):
+    app.cli.add_command(rollup_cli)
+    app.cli.add_command(ratings_cli)
+    app.cli.add_command(search_cli)
+    app.cli.add_command(markdown_cli)
+    app.cli.add_command(catalog_cli)
+    app.cli.add_command(views_cli)
+    app.cli.add_command(recommendations_cli)
+    app.cli.add_command(trending_cli)
+    app.cli.add_command(setup)
+    app.cli.add_command(check_plans)
@@ -0,0 +1,123 @@
+from flask import current_app, url_for
+from models import Cover
+import hashlib
+import os
+import tempfile
+
+try:
+    from PIL import Image
+except ImportError:  # без Pillow миниатюры не создаются, отдаётся оригинал
+    Image = None
+
+
+# --- Хранилище обложек ---
+# Файл хранится под именем своего MD5 (<md5>.<ext>), одинаковые обложки
+# разных книг делят один файл. Миниатюры создаются один раз при загрузке.
+
+COVER_SIZES = {
+    'card': (300, 450),
+    'detail': (600, 900)
+}
+
+CHUNK_SIZE = 64 * 1024
+
+EXTENSIONS = {'.jpg', '.jpeg', '.png'}
+
+
+class InvalidCover(ValueError):
+    # Загруженный файл не читается как изображение
+    pass
+
+
+def thumbnail_name(filename, size):
+    return f'{os.path.splitext(filename)[0]}_{size}.jpg'
+
+
+def _check_image(path):
+    if Image is None:
+        return
+    try:
+        with Image.open(path) as image:
+            image.verify()
+    except Exception as e:
+        raise InvalidCover('Файл обложки не является изображением JPEG или PNG') from e
+
+
+def _remove_files(folder, filename):
+    for name in [filename] + [thumbnail_name(filename, size) for size in COVER_SIZES]:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _make_thumbnails(folder, filename):
+    if Image is None:
+        return
+    source = os.path.join(folder, filename)
+    for size, dimensions in COVER_SIZES.items():
+        target = os.path.join(folder, thumbnail_name(filename, size))
+        if os.path.exists(target):
+            continue
+        with Image.open(source) as image:
+            image = image.convert('RGB')
+            image.thumbnail(dimensions)
+            image.save(target, 'JPEG', quality=85, optimize=True)
+
+
+def store_cover(file, folder):
+    # Пишет загрузку во временный файл, считая MD5 по частям; возвращает (md5, имя файла).
+    # Нечитаемое изображение - InvalidCover, файлы этой загрузки при этом удаляются
+    extension = os.path.splitext(file.filename)[1].lower()
+    if extension not in EXTENSIONS:
+        extension = '.png' if file.mimetype == 'image/png' else '.jpg'
+    md5 = hashlib.md5()
+    with tempfile.NamedTemporaryFile(dir=folder, delete=False) as tmp:
+        for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+            md5.update(chunk)
+            tmp.write(chunk)
+
+    try:
+        _check_image(tmp.name)
+    except InvalidCover:
+        os.remove(tmp.name)
+        raise
+
+    md5_hash = md5.hexdigest()
+    filename = f'{md5_hash}{extension}'
+    path = os.path.join(folder, filename)
+    if os.path.exists(path):
+        os.remove(tmp.name)
+        stored = False
+    else:
+        os.replace(tmp.name, path)
+        stored = True
+    try:
+        _make_thumbnails(folder, filename)
+    except Exception as e:
+        # verify() пропускает часть повреждённых файлов; уже существовавший файл не трогаем
+        if stored:
+            _remove_files(folder, filename)
+        raise InvalidCover('Не удалось обработать изображение обложки') from e
+    return md5_hash, filename
+
+
+def release_cover(cover, folder):
+    # Удаляет файлы обложки, если на них больше не ссылается ни одна книга
+    references = Cover.query.filter(
+        Cover.md5_hash == cover.md5_hash,
+        Cover.filename == cover.filename,
+        Cover.id != cover.id
+    ).count()
+    if references:
+        return
+    _remove_files(folder, cover.filename)
+
+
+def cover_url(cover, size=None):
+    # URL миниатюры нужного размера; для старых обложек без миниатюр - оригинал
+    filename = cover.filename
+    if size:
+        thumbnail = thumbnail_name(filename, size)
+        if os.path.exists(os.path.join(current_app.config['UPLOAD_FOLDER'], thumbnail)):
+            filename = thumbnail
+    return url_for('cover_file', filename=filename)
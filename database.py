@@ -0,0 +1,83 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import os
+import sqlite3
+
+
+# --- Настройки подключения к базе данных ---
+# DATABASE_URL выбирает СУБД (по умолчанию SQLite-файл library.db).
+# После fork() воркеры gunicorn не должны пользоваться соединениями
+# мастера: dispose_after_fork() сбрасывает унаследованный пул.
+# Для SQLite при каждом подключении включаются WAL и остальные PRAGMA,
+# для PostgreSQL настраиваются пул соединений и statement_timeout.
+#
+#   SQLITE_JOURNAL_MODE      режим журнала (WAL)
+#   SQLITE_BUSY_TIMEOUT_MS   ожидание блокировки записи, мс (5000)
+#   SQLITE_SYNCHRONOUS       режим synchronous (NORMAL)
+#   SQLITE_MMAP_SIZE         размер mmap, байт (268435456)
+#   SQLITE_CACHE_SIZE_KB     кэш страниц на соединение, КиБ (20000)
+#   DB_POOL_SIZE             размер пула PostgreSQL (10)
+#   DB_MAX_OVERFLOW          сверх пула (20)
+#   DB_POOL_RECYCLE          пересоздание соединений, с (1800)
+#   DB_STATEMENT_TIMEOUT_MS  ограничение времени запроса, мс (5000)
+
+DEFAULT_DATABASE_URL = 'sqlite:///library.db'
+
+_sqlite_pragmas = {}
+
+
+def _env_int(name, default):
+    return int(os.environ.get(name, default))
+
+
+@event.listens_for(Engine, 'connect')
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or not _sqlite_pragmas:
+        return
+    cursor = dbapi_connection.cursor()
+    for name, value in _sqlite_pragmas.items():
+        cursor.execute(f'PRAGMA {name}={value}')
+    cursor.close()
+
+
+def sqlite_options():
+    busy_timeout = _env_int('SQLITE_BUSY_TIMEOUT_MS', 5000)
+    _sqlite_pragmas.update({
+        'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+        'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+        'busy_timeout': busy_timeout,
+        'mmap_size': _env_int('SQLITE_MMAP_SIZE', 256 * 1024 * 1024),
+        'cache_size': -_env_int('SQLITE_CACHE_SIZE_KB', 20000),
+        'temp_store': 'MEMORY'
+    })
+    return {'connect_args': {'timeout': busy_timeout / 1000}}
+
+
+def postgresql_options():
+    statement_timeout = _env_int('DB_STATEMENT_TIMEOUT_MS', 5000)
+    return {
+        'pool_size': _env_int('DB_POOL_SIZE', 10),
+        'max_overflow': _env_int('DB_MAX_OVERFLOW', 20),
+        'pool_recycle': _env_int('DB_POOL_RECYCLE', 1800),
+        'pool_pre_ping': True,
+        'connect_args': {'options': f'-c statement_timeout={statement_timeout}'}
+    }
+
+
+def configure_database(app):
+    # DATABASE_URL из настроек приложения (create_app(config)) важнее окружения
+    url = app.config.get('DATABASE_URL') or os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URL)
+    if url.startswith('postgres://'):
+        url = 'postgresql://' + url[len('postgres://'):]
+
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    if url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = sqlite_options()
+    elif url.startswith('postgresql'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = postgresql_options()
+
+
+def dispose_after_fork(engine):
+    # close=False: соединения мастера не закрываются из дочернего процесса,
+    # а просто забываются, новый процесс откроет свои
+    engine.dispose(close=False)
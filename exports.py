@@ -0,0 +1,96 @@
+from models import db, User, Book, BookViewLog
+from stats import book_stats_query, activity_log_filters
+import csv
+import codecs
+import datetime
+
+STATISTICS_HEADER = [
+    'Название книги',
+    'Автор',
+    'Всего просмотров',
+    'За последний месяц',
+    'За последнюю неделю',
+    'Первый просмотр',
+    'Последний просмотр'
+]
+
+ACTIVITY_LOG_HEADER = [
+    'Дата и время',
+    'Пользователь',
+    'Книга',
+    'IP адрес',
+    'Идентификатор сессии'
+]
+
+
+class _Echo:
+    # csv.writer пишет сюда и сразу возвращает готовую строку
+    def write(self, value):
+        return value
+
+
+def _format_timestamp(value):
+    return value.strftime('%d.%m.%Y %H:%M') if value else '-'
+
+
+def parse_date(value):
+    # Дата из параметров запроса в формате ГГГГ-ММ-ДД, иначе None
+    try:
+        return datetime.datetime.strptime(value, '%Y-%m-%d')
+    except (TypeError, ValueError):
+        return None
+
+
+# --- Потоковая запись CSV ---
+
+def stream_csv(header, rows, chunk_size=500):
+    writer = csv.writer(_Echo(), quoting=csv.QUOTE_ALL, dialect='excel')
+    yield codecs.BOM_UTF8.decode('utf-8') + writer.writerow(header)
+
+    buffer = []
+    for row in rows:
+        buffer.append(writer.writerow(row))
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if buffer:
+        yield ''.join(buffer)
+
+
+# --- Источники строк (читаются порциями через yield_per) ---
+
+def statistics_rows(chunk_size=1000):
+    for stats in book_stats_query().yield_per(chunk_size):
+        yield [
+            stats.title,
+            stats.author,
+            str(stats.total_views),
+            str(stats.monthly_views),
+            str(stats.weekly_views),
+            _format_timestamp(stats.first_view),
+            _format_timestamp(stats.last_view)
+        ]
+
+
+def activity_log_rows(date_from=None, date_to=None, book_id=None, user_id=None, chunk_size=1000):
+    query = (
+        db.session.query(
+            BookViewLog.timestamp,
+            User.username,
+            Book.title,
+            BookViewLog.ip_address,
+            BookViewLog.session_id
+        )
+        .join(Book, BookViewLog.book_id == Book.id)
+        .outerjoin(User, BookViewLog.user_id == User.id)
+        .filter(*activity_log_filters(date_from, date_to, book_id, user_id))
+    )
+
+    for log in query.order_by(BookViewLog.timestamp.desc()).yield_per(chunk_size):
+        yield [
+            _format_timestamp(log.timestamp),
+            log.username or 'Гость',
+            log.title,
+            log.ip_address or '-',
+            log.session_id or '-'
+        ]
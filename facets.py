@@ -0,0 +1,139 @@
+from models import db, Book, book_genres
+from fragments import catalog_version
+from sqlalchemy import select
+import threading
+import numpy as np
+
+
+# --- Фасетный просмотр каталога ---
+# Индекс фасетов - столбцы книг (год, издательство, автор) и пары
+# (книга, жанр) в массивах NumPy, книги в порядке главной страницы.
+# Индекс строится в каждом процессе один раз на версию каталога, после
+# чего фильтр - это булева маска, а счётчики всех фасетов под текущим
+# фильтром - bincount по этой маске, без запросов к базе.
+
+PUBLISHER_FACET_SIZE = 15
+
+
+def _codes(values):
+    # Коды значений (по алфавиту) и список самих значений
+    names, codes = np.unique(np.array(values, dtype=object), return_inverse=True)
+    return names.tolist(), codes.astype(np.int64)
+
+
+class FacetIndex:
+    def __init__(self, version):
+        self.version = version
+        connection = db.session.connection()
+        rows = connection.execute(
+            select(Book.id, Book.year, Book.publisher, Book.author).order_by(Book.year.desc(), Book.id)
+        ).all()
+        ids, years, publishers, authors = zip(*rows) if rows else ((), (), (), ())
+        self.ids = np.array(ids, dtype=np.int64)
+        self.years = np.array(years, dtype=np.int64)
+        self.decades = self.years // 10 * 10
+        self.publishers, self.publisher_codes = _codes(publishers)
+        self.authors, self.author_codes = _codes(authors)
+        self.publisher_index = {name: code for code, name in enumerate(self.publishers)}
+        self.author_index = {name: code for code, name in enumerate(self.authors)}
+
+        # Пары (позиция книги, жанр)
+        pairs = connection.execute(select(book_genres.c.book_id, book_genres.c.genre_id)).all()
+        pair_books, pair_genres = zip(*pairs) if pairs else ((), ())
+        sorter = np.argsort(self.ids)
+        pair_books = np.array(pair_books, dtype=np.int64)
+        self.pair_positions = sorter[np.searchsorted(self.ids, pair_books, sorter=sorter)] if len(pair_books) \
+            else np.empty(0, dtype=np.int64)
+        self.pair_genres = np.array(pair_genres, dtype=np.int64)
+
+    def mask(self, filters):
+        mask = np.ones(len(self.ids), dtype=bool)
+        for genre_id in filters.get('genre', ()):
+            has_genre = np.zeros(len(self.ids), dtype=bool)
+            has_genre[self.pair_positions[self.pair_genres == genre_id]] = True
+            mask &= has_genre
+        if 'decade' in filters:
+            mask &= self.decades == filters['decade']
+        if 'publisher' in filters:
+            mask &= self.publisher_codes == self.publisher_index.get(filters['publisher'], -1)
+        if 'author' in filters:
+            mask &= self.author_codes == self.author_index.get(filters['author'], -1)
+        if 'year_from' in filters:
+            mask &= self.years >= filters['year_from']
+        if 'year_to' in filters:
+            mask &= self.years <= filters['year_to']
+        return mask
+
+    def counts(self, mask, genre_names):
+        # Число книг под фильтром для каждого значения фасетов (нулевые не показываются)
+        genre_counts = np.bincount(self.pair_genres[mask[self.pair_positions]], minlength=max(genre_names, default=0) + 1)
+        genres = [(genre_id, name, int(genre_counts[genre_id]))
+                  for genre_id, name in genre_names.items() if genre_counts[genre_id]]
+
+        decades, decade_counts = np.unique(self.decades[mask], return_counts=True)
+
+        publisher_counts = np.bincount(self.publisher_codes[mask], minlength=len(self.publishers))
+        top = np.argsort(-publisher_counts, kind='stable')[:PUBLISHER_FACET_SIZE]
+        publishers = [(self.publishers[code], int(publisher_counts[code])) for code in top if publisher_counts[code]]
+        return {
+            'genres': genres,
+            'decades': list(zip(decades.tolist()[::-1], decade_counts.tolist()[::-1])),
+            'publishers': publishers
+        }
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def facet_index():
+    # Индекс текущей версии каталога; перестраивается одним потоком
+    global _index
+    version = catalog_version()[0]
+    if _index is None or _index.version != version:
+        with _index_lock:
+            if _index is None or _index.version != version:
+                _index = FacetIndex(version)
+    return _index
+
+
+def parse_filters(args):
+    # Фильтры из строки запроса; некорректные значения пропускаются
+    filters = {}
+    genres = sorted({int(value) for value in args.getlist('genre') if value.isdigit()})
+    if genres:
+        filters['genre'] = genres
+    for key in ('decade', 'year_from', 'year_to'):
+        value = args.get(key, type=int)
+        if value is not None:
+            filters[key] = value
+    for key in ('publisher', 'author'):
+        value = args.get(key, '').strip()
+        if value:
+            filters[key] = value
+    return filters
+
+
+def facet_args(filters, key=None, value=None):
+    # Аргументы url_for() для фильтров с переключённым значением фасета:
+    # жанры добавляются и убираются по одному, остальные фасеты заменяются
+    args = {name: list(values) if name == 'genre' else values for name, values in filters.items()}
+    if key == 'genre':
+        genres = set(args.get('genre', ()))
+        genres ^= {value}
+        args['genre'] = sorted(genres)
+    elif key is not None:
+        if value is None or args.get(key) == value:
+            args.pop(key, None)
+        else:
+            args[key] = value
+    if not args.get('genre'):
+        args.pop('genre', None)
+    return args
+
+
+def browse_catalog(filters, genre_names):
+    # (id книг под фильтром в порядке каталога, счётчики фасетов)
+    index = facet_index()
+    mask = index.mask(filters)
+    return index.ids[mask], index.counts(mask, genre_names)
@@ -4,7 +4,7 @@ from wtforms import (
     IntegerField, SelectField, SelectMultipleField, FileField, BooleanField
 )
 from wtforms.validators import DataRequired, Length, NumberRange, Optional
-from flask_wtf.file import FileAllowed
+from flask_wtf.file import FileAllowed, FileRequired
 
 class LoginForm(FlaskForm):
     username = StringField('Логин', validators=[DataRequired(), Length(max=64)])
@@ -40,3 +40,13 @@ class ReviewForm(FlaskForm):
     submit = SubmitField('Сохранить')
 
 
+class CatalogImportForm(FlaskForm):
+    catalog = FileField('Каталог (CSV или JSONL)', validators=[
+        FileRequired('Выберите файл каталога'),
+        FileAllowed(['csv', 'jsonl', 'ndjson'], 'Только файлы .csv и .jsonl')
+    ])
+    covers = FileField('Обложки (ZIP-архив)', validators=[
+        FileAllowed(['zip'], 'Только архив .zip')
+    ])
+    restart = BooleanField('Импортировать заново, даже если файл уже загружался')
+    submit = SubmitField('Импортировать')
@@ -0,0 +1,89 @@
+from flask import render_template, request, session
+from flask_login import current_user
+from markupsafe import Markup
+from werkzeug.http import is_resource_modified
+from models import db, CatalogState
+from cache import cache
+import datetime
+import hashlib
+
+
+# --- Условные ответы и кэш отрисованных фрагментов ---
+# Версия книги (Book.version) растёт при изменении книги и её рецензий,
+# версия каталога (CatalogState) - при добавлении, изменении, удалении и
+# импорте книг. По ним строятся ETag/Last-Modified страниц для гостей и
+# ключи кэша HTML-фрагментов (карточки книг, описание, рецензии), так что
+# устаревшие фрагменты просто перестают запрашиваться. Вход в систему,
+# flash-сообщения и недавно просмотренные книги рисуются на каждый запрос.
+
+CATALOG_VERSION_KEY = 'catalog_version'
+CATALOG_VERSION_TTL = 5  # другие процессы увидят новую версию не позже
+FRAGMENT_TTL = 3600
+
+
+def catalog_version():
+    # (версия, время изменения) каталога
+    def load():
+        state = db.session.get(CatalogState, 1)
+        return (state.version, state.updated_at) if state else (0, datetime.datetime(2000, 1, 1))
+    return cache.get_or_set(CATALOG_VERSION_KEY, load, ttl=CATALOG_VERSION_TTL)
+
+
+def bump_catalog_version():
+    now = datetime.datetime.utcnow()
+    updated = CatalogState.query.filter_by(id=1).update(
+        {CatalogState.version: CatalogState.version + 1, CatalogState.updated_at: now}
+    )
+    if not updated:
+        db.session.add(CatalogState(id=1, version=1, updated_at=now))
+    db.session.commit()
+    cache.delete(CATALOG_VERSION_KEY)
+
+
+# --- ETag и Last-Modified ---
+
+def make_etag(*parts):
+    return hashlib.md5(repr(parts).encode('utf-8')).hexdigest()
+
+
+def conditional_allowed():
+    # Только для гостей без отложенных flash-сообщений: их страница не зависит от сессии
+    return not current_user.is_authenticated and not session.get('_flashes')
+
+
+def is_not_modified(etag, last_modified=None):
+    return not is_resource_modified(request.environ, etag=etag, last_modified=last_modified)
+
+
+def set_validators(response, etag, last_modified=None):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    # Общие кэши хранят страницу, но каждый раз сверяются с сервером
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    response.vary.add('Cookie')
+    return response
+
+
+# --- Фрагменты ---
+
+def permission_variant():
+    # Кнопки в карточках зависят только от флагов прав
+    return ''.join('1' if flag else '0' for flag in (
+        current_user.can_edit_books, current_user.can_manage_books
+    ))
+
+
+def fragment_key(*parts):
+    return 'fragment:' + ':'.join(str(part) for part in parts)
+
+
+def render_fragment(template, key, context):
+    # context - функция, возвращающая переменные шаблона; вызывается только при промахе
+    return Markup(cache.get_or_set(key, lambda: render_template(template, **context()), ttl=FRAGMENT_TTL))
+
+
+def book_card(book, variant='catalog', views=None):
+    key = fragment_key('card', variant, book.id, book.version, catalog_version()[0], permission_variant(), views)
+    return render_fragment('_book_card.html', key, lambda: {'book': book, 'variant': variant, 'views': views})
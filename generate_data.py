@@ -0,0 +1,242 @@
+from models import db, User, Role, Book, Genre, Review, BookViewLog, book_genres
+from werkzeug.security import generate_password_hash
+from faker import Faker
+from sqlalchemy import insert, func
+from app import create_app
+from stats import rebuild_daily_views, recompute_rating_aggregates
+from trending import rebuild_trending
+from markdown_render import rerender_stale
+from fragments import bump_catalog_version
+import argparse
+import datetime
+import time
+import numpy as np
+
+# --- Генератор синтетических данных ---
+# Пример: python generate_data.py --scale large
+# Книги, рецензии и просмотры вставляются пачками (executemany), популярность
+# книг распределена по Zipf, давность просмотров - экспоненциально.
+
+SCALES = {
+    'small': {'books': 1000, 'users': 500, 'reviews': 10000, 'views': 200000},
+    'medium': {'books': 20000, 'users': 5000, 'reviews': 200000, 'views': 5000000},
+    'large': {'books': 100000, 'users': 20000, 'reviews': 1000000, 'views': 50000000}
+}
+
+GENRE_NAMES = [
+    'Фантастика', 'Приключения', 'Научные', 'Детектив', 'Роман', 'Поэзия', 'История',
+    'Биография', 'Фэнтези', 'Ужасы', 'Философия', 'Психология', 'Детская литература',
+    'Классика', 'Драма', 'Юмор', 'Путешествия', 'Бизнес', 'Программирование', 'Искусство'
+]
+
+CHUNK_SIZE = 10000
+VIEW_CHUNK_SIZE = 500000
+
+
+def log(message, started):
+    print(f'[{time.perf_counter() - started:7.1f} с] {message}')
+
+
+def zipf_choice(rng, ids, size, exponent):
+    # Индексы из ids с вероятностью ~ 1 / rank^exponent (ids уже перемешаны)
+    weights = 1.0 / np.arange(1, len(ids) + 1) ** exponent
+    return ids[rng.choice(len(ids), size=size, p=weights / weights.sum())]
+
+
+def insert_chunks(table, rows):
+    for start in range(0, len(rows), CHUNK_SIZE):
+        db.session.execute(insert(table), rows[start:start + CHUNK_SIZE])
+        db.session.commit()
+
+
+def ensure_roles_and_genres(genre_count):
+    role = Role.query.filter_by(name='Пользователь').first()
+    if role is None:
+        db.session.add_all([
+            Role(name='Администратор', description='Полный доступ'),
+            Role(name='Модератор', description='Редактирование книг и рецензий'),
+            Role(name='Пользователь', description='Может оставлять рецензии')
+        ])
+        db.session.commit()
+        role = Role.query.filter_by(name='Пользователь').first()
+
+    existing = {g.name for g in Genre.query.all()}
+    names = GENRE_NAMES + [f'Жанр {i}' for i in range(len(GENRE_NAMES), genre_count)]
+    db.session.add_all([Genre(name=name) for name in names[:genre_count] if name not in existing])
+    db.session.commit()
+    return role, np.array([g.id for g in Genre.query.all()])
+
+
+def generate_users(fake, rng, count, role):
+    # Один общий хеш пароля: scrypt на каждого пользователя занял бы минуты
+    password_hash = generate_password_hash('userpass')
+    prefix = f'gen{int(time.time())}_'
+    insert_chunks(User.__table__, [{
+        'username': f'{prefix}{i}',
+        'password_hash': password_hash,
+        'last_name': fake.last_name(),
+        'first_name': fake.first_name(),
+        'middle_name': None,
+        'role_id': role.id
+    } for i in range(count)])
+    return np.array([row[0] for row in db.session.query(User.id).filter(User.username.like(f'{prefix}%'))])
+
+
+def generate_books(fake, rng, count, genre_ids):
+    # Тексты берутся из небольших пулов: Faker на каждую строку слишком медленный
+    titles = [fake.sentence(nb_words=3).rstrip('.') for _ in range(2000)]
+    authors = [fake.name() for _ in range(5000)]
+    publishers = [fake.company() for _ in range(500)]
+    descriptions = [fake.paragraph(nb_sentences=5) for _ in range(2000)]
+
+    first_id = (db.session.query(func.max(Book.id)).scalar() or 0) + 1
+    insert_chunks(Book.__table__, [{
+        'title': f'{titles[rng.integers(len(titles))]} {i}',
+        'description': descriptions[rng.integers(len(descriptions))],
+        'year': int(rng.integers(1800, 2026)),
+        'publisher': publishers[rng.integers(len(publishers))],
+        'author': authors[rng.integers(len(authors))],
+        'pages': int(rng.integers(50, 1200)),
+        'review_count': 0,
+        'rating_sum': 0,
+        'html_version': 0
+    } for i in range(count)])
+    book_ids = np.array([row[0] for row in db.session.query(Book.id).filter(Book.id >= first_id)])
+
+    links = set()
+    for book_id in book_ids.tolist():
+        for genre_id in rng.choice(genre_ids, size=int(rng.integers(1, 4)), replace=False).tolist():
+            links.add((book_id, genre_id))
+    insert_chunks(book_genres, [{'book_id': b, 'genre_id': g} for b, g in links])
+    return book_ids
+
+
+def generate_reviews(fake, rng, count, book_ids, user_ids, exponent):
+    texts = [fake.paragraph(nb_sentences=3) for _ in range(1000)]
+    now = datetime.datetime.utcnow()
+    # Одна рецензия на пару (книга, пользователь); с запасом на повторы
+    books = zipf_choice(rng, book_ids, count * 2, exponent)
+    users = rng.choice(user_ids, size=count * 2)
+    pairs = np.unique(np.stack([books, users], axis=1), axis=0)
+    rng.shuffle(pairs)
+    pairs = pairs[:count]
+    ratings = rng.choice([0, 1, 2, 3, 4, 5], size=len(pairs), p=[0.03, 0.05, 0.1, 0.22, 0.3, 0.3])
+    ages = rng.integers(0, 365 * 24 * 3600, size=len(pairs))
+    insert_chunks(Review.__table__, [{
+        'book_id': book_id,
+        'user_id': user_id,
+        'rating': int(rating),
+        'text': texts[i % len(texts)],
+        'html_version': 0,
+        'timestamp': now - datetime.timedelta(seconds=int(age))
+    } for i, ((book_id, user_id), rating, age) in enumerate(zip(pairs.tolist(), ratings, ages))])
+    return len(pairs)
+
+
+def generate_views(rng, count, book_ids, user_ids, days, exponent, started):
+    table = BookViewLog.__table__
+    connection = db.session.connection()
+    # Индексы журнала перестраиваются один раз после загрузки
+    for index in table.indexes:
+        index.drop(connection)
+    db.session.commit()
+
+    sqlite = db.engine.dialect.name == 'sqlite'
+    now = np.datetime64(datetime.datetime.utcnow(), 'us')
+    sessions = np.array([f'{value:032x}' for value in rng.integers(0, 2 ** 62, size=200000)])
+    ips = np.array([f'10.{a}.{b}.{c}' for a, b, c in rng.integers(0, 256, size=(100000, 3))])
+    inserted = 0
+    while inserted < count:
+        size = min(VIEW_CHUNK_SIZE, count - inserted)
+        books = zipf_choice(rng, book_ids, size, exponent)
+        # Свежие просмотры встречаются чаще старых
+        ages = np.minimum(rng.exponential(days * 86400 / 4, size=size), days * 86400 - 1)
+        timestamps = now - (ages * 1e6).astype('timedelta64[us]')
+        logged_in = rng.random(size) < 0.3
+        users = np.where(logged_in, rng.choice(user_ids, size=size), 0)
+        visitor = rng.integers(0, len(sessions), size=size)
+
+        if sqlite:
+            # Быстрый путь: готовые строки времени в формате SQLAlchemy для SQLite
+            stamps = np.char.replace(np.datetime_as_string(timestamps, unit='us'), 'T', ' ')
+            rows = [
+                (book_id, user_id or None, None if user_id else sessions[v], ips[v % len(ips)], stamp)
+                for book_id, user_id, v, stamp in zip(books.tolist(), users.tolist(), visitor.tolist(), stamps.tolist())
+            ]
+            db.session.connection().exec_driver_sql(
+                'INSERT INTO book_view_log (book_id, user_id, session_id, ip_address, timestamp) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+        else:
+            db.session.execute(insert(table), [
+                {'book_id': book_id, 'user_id': user_id or None,
+                 'session_id': None if user_id else sessions[v], 'ip_address': ips[v % len(ips)],
+                 'timestamp': stamp}
+                for book_id, user_id, v, stamp in zip(books.tolist(), users.tolist(), visitor.tolist(),
+                                                     timestamps.astype(datetime.datetime).tolist())
+            ])
+        db.session.commit()
+        inserted += size
+        log(f'просмотров: {inserted}', started)
+
+    connection = db.session.connection()
+    for index in table.indexes:
+        index.create(connection)
+    db.session.commit()
+    log('индексы журнала созданы', started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Синтетические данные для нагрузочного тестирования.')
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--books', type=int)
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--reviews', type=int)
+    parser.add_argument('--views', type=int)
+    parser.add_argument('--genres', type=int, default=len(GENRE_NAMES))
+    parser.add_argument('--days', type=int, default=365, help='Глубина журнала просмотров, дней.')
+    parser.add_argument('--zipf', type=float, default=1.1, help='Показатель распределения Zipf.')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    sizes = dict(SCALES[args.scale])
+    for key in sizes:
+        if getattr(args, key) is not None:
+            sizes[key] = getattr(args, key)
+
+    fake = Faker('ru_RU')
+    Faker.seed(args.seed)
+    rng = np.random.default_rng(args.seed)
+    started = time.perf_counter()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text('PRAGMA synchronous=OFF'))
+
+        role, genre_ids = ensure_roles_and_genres(args.genres)
+        user_ids = generate_users(fake, rng, sizes['users'], role)
+        log(f'пользователей: {len(user_ids)}', started)
+        book_ids = generate_books(fake, rng, sizes['books'], genre_ids)
+        rng.shuffle(book_ids)
+        log(f'книг: {len(book_ids)}', started)
+        reviews = generate_reviews(fake, rng, sizes['reviews'], book_ids, user_ids, args.zipf)
+        log(f'рецензий: {reviews}', started)
+        generate_views(rng, sizes['views'], book_ids, user_ids, args.days, args.zipf, started)
+
+        rebuild_daily_views()
+        log('суточная сводка пересчитана', started)
+        rebuild_trending()
+        log('рейтинги популярного пересчитаны', started)
+        recompute_rating_aggregates()
+        log('оценки книг пересчитаны', started)
+        rerender_stale(Book, batch_size=5000)
+        rerender_stale(Review, batch_size=5000)
+        bump_catalog_version()
+        log('Markdown отрисован', started)
+    print('✅ Синтетические данные созданы')
+
+
+if __name__ == '__main__':
+    main()
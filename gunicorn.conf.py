@@ -0,0 +1,18 @@
+import os
+
+# --- Настройки gunicorn ---
+# gunicorn -c gunicorn.conf.py wsgi:app
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 4))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+preload_app = True  # приложение создаётся и прогревается один раз в мастере
+
+
+def post_fork(server, worker):
+    # Пул соединений, унаследованный от мастера, воркеру не принадлежит
+    from wsgi import app
+    from models import db
+    from database import dispose_after_fork
+    with app.app_context():
+        dispose_after_fork(db.engine)
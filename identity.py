@@ -0,0 +1,133 @@
+from flask import flash, redirect, url_for
+from flask_login import AnonymousUserMixin, UserMixin, current_user, login_required
+from sqlalchemy import event, insert, update
+from sqlalchemy.orm import Session, joinedload, object_session
+from models import db, User, Role, IdentityState
+from cache import cache
+from functools import wraps
+
+
+# --- Пользователь и права на время запроса ---
+# Пользователь вместе с ролью загружается одним запросом и хранится в кэше
+# как неизменяемый снимок Identity с заранее вычисленными флагами прав.
+# Ключ снимка включает версию пользователей и ролей (IdentityState), как
+# ключи фрагментов - версию каталога: изменение или удаление пользователя
+# или роли увеличивает её в той же транзакции, и старые снимки перестают
+# запрашиваться во всех процессах. Сама версия кэшируется на
+# IDENTITY_VERSION_TTL секунд, поэтому в обычном режиме проверка входа и
+# прав не обращается к базе.
+
+IDENTITY_TTL = 300
+IDENTITY_VERSION_KEY = 'identity_version'
+IDENTITY_VERSION_TTL = 5  # другие процессы увидят изменение прав не позже
+
+MANAGE_BOOKS = 'manage_books'        # добавление, удаление и импорт книг
+EDIT_BOOKS = 'edit_books'            # редактирование книг
+VIEW_STATISTICS = 'view_statistics'  # статистика, журнал действий и экспорт
+
+ROLE_PERMISSIONS = {
+    'Администратор': {MANAGE_BOOKS, EDIT_BOOKS, VIEW_STATISTICS},
+    'Модератор': {EDIT_BOOKS},
+    'Пользователь': set()
+}
+
+DENIED_MESSAGE = 'У вас недостаточно прав для выполнения данного действия.'
+
+
+class Identity(UserMixin):
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
+        self.last_name = user.last_name
+        self.first_name = user.first_name
+        self.middle_name = user.middle_name
+        self.role_id = user.role_id
+        self.role_name = user.role.name
+        self.permissions = frozenset(ROLE_PERMISSIONS.get(self.role_name, ()))
+        self.can_manage_books = MANAGE_BOOKS in self.permissions
+        self.can_edit_books = EDIT_BOOKS in self.permissions
+        self.can_view_statistics = VIEW_STATISTICS in self.permissions
+
+    def full_name(self):
+        return f"{self.last_name} {self.first_name} {self.middle_name or ''}".strip()
+
+    def can(self, permission):
+        return permission in self.permissions
+
+
+class AnonymousIdentity(AnonymousUserMixin):
+    permissions = frozenset()
+    can_manage_books = can_edit_books = can_view_statistics = False
+
+    def can(self, permission):
+        return False
+
+
+def identity_version():
+    def load():
+        state = db.session.get(IdentityState, 1)
+        return state.version if state else 0
+    return cache.get_or_set(IDENTITY_VERSION_KEY, load, ttl=IDENTITY_VERSION_TTL)
+
+
+def identity_key(user_id):
+    return f'identity:{identity_version()}:{user_id}'
+
+
+def _fetch_identity(user_id):
+    user = User.query.options(joinedload(User.role)).filter_by(id=user_id).first()
+    return Identity(user) if user else None
+
+
+def load_identity(user_id):
+    return cache.get_or_set(identity_key(user_id), lambda: _fetch_identity(user_id), ttl=IDENTITY_TTL)
+
+
+def permission_required(permission, message=DENIED_MESSAGE, redirect_to='index'):
+    # Заменяет login_required и проверку роли внутри маршрута
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            if not current_user.can(permission):
+                flash(message, 'danger')
+                return redirect(url_for(redirect_to))
+            return view(*args, **kwargs)
+        return login_required(wrapped)
+    return decorator
+
+
+def init_identity(login_manager):
+    login_manager.anonymous_user = AnonymousIdentity
+    login_manager.user_loader(lambda user_id: load_identity(int(user_id)))
+
+
+# --- Сброс снимков после изменения пользователей и ролей ---
+
+def _bump_version(connection, target):
+    # Версия меняется в транзакции изменения: откат отменяет и её
+    if not connection.execute(update(IdentityState).where(IdentityState.id == 1)
+                              .values(version=IdentityState.version + 1)).rowcount:
+        connection.execute(insert(IdentityState).values(id=1, version=1))
+    session = object_session(target)
+    if session is not None:
+        session.info['identity_changed'] = True
+
+
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+@event.listens_for(Role, 'after_update')
+@event.listens_for(Role, 'after_delete')
+def _identity_changed(mapper, connection, target):
+    _bump_version(connection, target)
+
+
+@event.listens_for(Session, 'after_commit')
+def _drop_identity_version(session):
+    # Этот процесс видит новую версию сразу, остальные - по истечении её TTL
+    if session.info.pop('identity_changed', False):
+        cache.delete(IDENTITY_VERSION_KEY)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _forget_identity_change(session, previous_transaction):
+    session.info.pop('identity_changed', None)
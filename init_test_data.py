@@ -1,8 +1,9 @@
 from models import db, User, Role, Book, Genre
 from werkzeug.security import generate_password_hash
-from app import app
+from app import create_app
+from markdown_render import render_book
 
-with app.app_context():
+with create_app().app_context():
     db.create_all()
 
     admin_role = Role(name='Администратор', description='Полный доступ')
@@ -74,6 +75,8 @@ with app.app_context():
              genres=[genres[2]])
     ]
 
+    for book in books:
+        render_book(book)
     db.session.add_all(books)
     db.session.commit()
     print('✅ Пользователи, роли, жанры и книги успешно добавлены.')
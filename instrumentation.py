@@ -0,0 +1,180 @@
+from flask import current_app, g, request, has_request_context, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import hmac
+import os
+import threading
+import time
+
+
+class QueryBudgetExceeded(RuntimeError):
+    pass
+
+
+# --- Бюджет SQL-запросов на один HTTP-запрос ---
+# SQL_QUERY_BUDGET - лимит по умолчанию, SQL_QUERY_BUDGET_RAISE - бросать
+# исключение вместо записи в лог (включается в тестах).
+
+def query_budget(limit):
+    # Индивидуальный лимит для конкретного маршрута
+    def decorator(view):
+        view._query_budget = limit
+        return view
+    return decorator
+
+
+# --- Метрики маршрутов ---
+# На каждый запрос: общее время, число и суммарное время SQL-запросов,
+# время отрисовки шаблонов. Медленные SQL-запросы (SLOW_QUERY_MS)
+# пишутся в лог вместе с маршрутом. Метрики хранятся в памяти процесса.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+
+    def observe(self, endpoint, duration, sql_count, sql_seconds, template_seconds):
+        with self._lock:
+            stats = self._endpoints.get(endpoint)
+            if stats is None:
+                stats = self._endpoints[endpoint] = {
+                    'buckets': [0] * len(LATENCY_BUCKETS),
+                    'count': 0,
+                    'sum': 0.0,
+                    'sql_queries': 0,
+                    'sql_seconds': 0.0,
+                    'template_seconds': 0.0
+                }
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if duration <= bound:
+                    stats['buckets'][i] += 1
+            stats['count'] += 1
+            stats['sum'] += duration
+            stats['sql_queries'] += sql_count
+            stats['sql_seconds'] += sql_seconds
+            stats['template_seconds'] += template_seconds
+
+    def render(self, extra=None):
+        # Текстовый формат Prometheus; extra - {имя: (тип, значение)}
+        with self._lock:
+            endpoints = {name: dict(stats, buckets=list(stats['buckets']))
+                         for name, stats in self._endpoints.items()}
+
+        lines = [
+            '# HELP http_request_duration_seconds Время обработки запроса.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for name, stats in sorted(endpoints.items()):
+            for bound, value in zip(LATENCY_BUCKETS, stats['buckets']):
+                lines.append(f'http_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {value}')
+            lines.append(f'http_request_duration_seconds_bucket{{endpoint="{name}",le="+Inf"}} {stats["count"]}')
+            lines.append(f'http_request_duration_seconds_sum{{endpoint="{name}"}} {stats["sum"]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{endpoint="{name}"}} {stats["count"]}')
+
+        for metric, key, help_text in (
+            ('sql_queries_total', 'sql_queries', 'Число SQL-запросов.'),
+            ('sql_duration_seconds_total', 'sql_seconds', 'Суммарное время SQL-запросов.'),
+            ('template_render_seconds_total', 'template_seconds', 'Суммарное время отрисовки шаблонов.')
+        ):
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} counter')
+            for name, stats in sorted(endpoints.items()):
+                lines.append(f'{metric}{{endpoint="{name}"}} {stats[key]}')
+
+        for metric, (kind, value) in sorted((extra or {}).items()):
+            lines.append(f'# TYPE {metric} {kind}')
+            lines.append(f'{metric} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+request_metrics = RequestMetrics()
+
+
+# --- Перехват SQL и шаблонов ---
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if has_request_context():
+        g.sql_query_count = g.get('sql_query_count', 0) + 1
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get('query_started')
+    if not started or not has_request_context():
+        return
+    elapsed = time.perf_counter() - started.pop()
+    g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+    if elapsed * 1000 >= current_app.config['SLOW_QUERY_MS']:
+        current_app.logger.warning(f'Медленный SQL-запрос ({elapsed * 1000:.1f} мс) в {request.endpoint}: {statement}')
+
+
+def _before_render(app, template, context, **extra):
+    g.setdefault('template_started', []).append(time.perf_counter())
+
+
+def _after_render(app, template, context, **extra):
+    # Вложенные render_template() уже входят во время внешнего шаблона
+    started = g.get('template_started')
+    if started:
+        elapsed = time.perf_counter() - started.pop()
+        if not started:
+            g.template_seconds = g.get('template_seconds', 0.0) + elapsed
+
+
+# --- Доступ к /metrics ---
+# Метрики отдаются администраторам (право просмотра статистики), запросам
+# с заголовком "Authorization: Bearer <METRICS_TOKEN>" и адресам из
+# METRICS_ALLOWED_IPS (например, серверу Prometheus).
+
+def metrics_allowed(user):
+    config = current_app.config
+    token = config['METRICS_TOKEN']
+    if token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return True
+    if request.remote_addr in config['METRICS_ALLOWED_IPS']:
+        return True
+    return user.can_view_statistics
+
+
+def init_instrumentation(app):
+    app.config.setdefault('SQL_QUERY_BUDGET', 20)
+    app.config.setdefault('SQL_QUERY_BUDGET_RAISE', False)
+    app.config.setdefault('SLOW_QUERY_MS', 200)
+    app.config.setdefault('METRICS_TOKEN', os.environ.get('METRICS_TOKEN'))
+    app.config.setdefault('METRICS_ALLOWED_IPS', [
+        address.strip() for address in os.environ.get('METRICS_ALLOWED_IPS', '').split(',') if address.strip()
+    ])
+
+    if not event.contains(Engine, 'before_cursor_execute', _before_cursor_execute):
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def record_request_metrics(response):
+        count = g.get('sql_query_count', 0)
+        if 'request_started' in g:
+            request_metrics.observe(
+                request.endpoint or 'unknown',
+                time.perf_counter() - g.request_started,
+                count,
+                g.get('sql_seconds', 0.0),
+                g.get('template_seconds', 0.0)
+            )
+
+        view = app.view_functions.get(request.endpoint)
+        limit = getattr(view, '_query_budget', app.config['SQL_QUERY_BUDGET'])
+        if limit is not None and count > limit:
+            message = f'{request.endpoint}: {count} SQL-запросов при бюджете {limit}'
+            if app.config['SQL_QUERY_BUDGET_RAISE']:
+                raise QueryBudgetExceeded(message)
+            app.logger.warning(message)
+        return response
@@ -0,0 +1,435 @@
+from flask import Flask, current_app
+from models import db, Book, Job
+from stats import approximate_view_log_size
+from exports import (
+    stream_csv, statistics_rows, activity_log_rows,
+    STATISTICS_HEADER, ACTIVITY_LOG_HEADER
+)
+from catalog_import import import_catalog, estimate_rows, CatalogAlreadyImported
+from markdown_render import rerender_stale
+from fragments import bump_catalog_version
+from sqlalchemy import func, select, update
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import atexit
+import datetime
+import importlib
+import json
+import multiprocessing
+import os
+import pickle
+import shutil
+import threading
+import time
+
+
+# --- Фоновые задачи ---
+# Долгие экспорты и импорт каталога выполняются вне запроса: маршрут только добавляет строку
+# в таблицу Job (status = queued) и сразу возвращает ответ. Диспетчер -
+# фоновый поток каждого процесса приложения - забирает задачи из таблицы
+# одним UPDATE с проверкой общего лимита JOBS_MAX_RUNNING, поэтому при
+# нескольких воркерах gunicorn лимит действует на всю машину. Задача
+# выполняется в пуле процессов, пишет результат в JOBS_FOLDER и отмечает
+# прогресс; файл хранится JOBS_RESULT_TTL секунд. Импорт каталога файла
+# не создаёт (итог - строка CatalogImport), а его загрузка лежит в папке
+# params['workdir'], которую диспетчер удаляет, когда задача закончилась.
+#
+# Отмена: задача из очереди снимается сразу, выполняющаяся проверяет флаг
+# cancel_requested при каждой отметке прогресса. Диспетчер обновляет
+# heartbeat_at своих задач раз в JOBS_HEARTBEAT_INTERVAL секунд; задачи,
+# чей процесс пропал дольше JOBS_STALE_AFTER секунд, считаются упавшими.
+#
+# Каждые JOBS_POLL_INTERVAL секунд диспетчер только читает, есть ли задачи
+# в очереди; пишущие транзакции (забор задачи, heartbeat, поиск упавших)
+# выполняются, когда для них есть работа или подошёл их срок.
+
+ACTIVE_STATUSES = ('queued', 'running')
+PROGRESS_EVERY = 2000  # строк между отметками прогресса
+EXPIRE_EVERY = 60      # секунд между удалениями просроченных файлов
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobLimitExceeded(Exception):
+    pass
+
+
+# --- Задачи: параметры -> (заголовок CSV, строки, ожидаемое число строк) ---
+
+def _date_param(value):
+    return datetime.datetime.fromisoformat(value) if value else None
+
+
+def _export_statistics(params):
+    return STATISTICS_HEADER, statistics_rows(), db.session.query(func.count(Book.id)).scalar()
+
+
+def _export_activity_log(params):
+    filters = {
+        'date_from': _date_param(params.get('date_from')),
+        'date_to': _date_param(params.get('date_to')),
+        'book_id': params.get('book_id'),
+        'user_id': params.get('user_id')
+    }
+    # Без фильтров число строк известно приблизительно, с фильтрами - нет
+    total = None if any(filters.values()) else approximate_view_log_size()
+    return ACTIVITY_LOG_HEADER, activity_log_rows(**filters), total
+
+
+# kind -> (префикс имени файла, функция)
+JOB_TASKS = {
+    'export_statistics': ('statistics', _export_statistics),
+    'export_activity_log': ('activity_log', _export_activity_log)
+}
+
+
+def _import_catalog(job_id, params):
+    # Импорт каталога: прогресс - прочитанные строки, отмена - на границе пачки
+    config = current_app.config
+    _update_job(job_id, total=estimate_rows(params['path']))
+    try:
+        job = import_catalog(
+            params['path'], config['IMPORT_FOLDER'], covers_dir=params.get('covers_dir'),
+            upload_folder=config['UPLOAD_FOLDER'], restart=params.get('restart', False),
+            source=params.get('source'), progress=lambda job: _report_progress(job_id, job.rows_done)
+        )
+    except CatalogAlreadyImported as error:
+        raise RuntimeError(f'{error}. Чтобы загрузить его ещё раз, отметьте повторный импорт') from None
+    _update_job(job_id, progress=job.rows_done)
+    rerender_stale(Book)
+    bump_catalog_version()
+
+
+# Задачи без файла результата: kind -> функция(job_id, параметры)
+JOB_ACTIONS = {
+    'import_catalog': _import_catalog
+}
+
+
+def encode_params(params):
+    return json.dumps({
+        key: value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+        for key, value in sorted(params.items())
+        if value is not None
+    }, ensure_ascii=False)
+
+
+def result_path(folder, job_id):
+    return os.path.join(folder, f'job_{job_id}.csv')
+
+
+def download_name(job):
+    prefix = JOB_TASKS[job.kind][0]
+    return f"{prefix}_{job.finished_at.strftime('%d_%m_%Y_%H_%M')}.csv"
+
+
+def discard_workdir(params):
+    # Временные файлы задачи (загрузка импорта) не нужны после её окончания
+    workdir = json.loads(params).get('workdir')
+    if workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- Выполнение в процессе пула ---
+
+_worker_app = None
+
+
+def worker_config(config):
+    # Настройки приложения для процессов пула: всё, что переносится через
+    # pickle, и итоговый адрес базы (фабрика читает его из DATABASE_URL)
+    resolved = {}
+    for key, value in config.items():
+        try:
+            pickle.dumps(value)
+        except Exception:
+            continue
+        resolved[key] = value
+    resolved['DATABASE_URL'] = config['SQLALCHEMY_DATABASE_URI']
+    return resolved
+
+
+def _init_worker(app_path, config):
+    # Процессы пула запускаются через spawn и сами импортируют приложение
+    # с настройками родительского процесса
+    global _worker_app
+    module, name = app_path.split(':')
+    target = getattr(importlib.import_module(module), name)
+    # Фабрика (create_app) вызывается с настройками, готовое приложение берётся как есть
+    _worker_app = target if isinstance(target, Flask) else target(config)
+
+
+def _update_job(job_id, **values):
+    # Отдельное соединение: основное занято чтением строк экспорта
+    with db.engine.begin() as connection:
+        connection.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+def _report_progress(job_id, done):
+    with db.engine.begin() as connection:
+        connection.execute(update(Job).where(Job.id == job_id).values(progress=done))
+        cancelled = connection.execute(select(Job.cancel_requested).where(Job.id == job_id)).scalar()
+    if cancelled:
+        raise JobCancelled()
+
+
+def _tracked(job_id, rows):
+    done = 0
+    for row in rows:
+        yield row
+        done += 1
+        if done % PROGRESS_EVERY == 0:
+            _report_progress(job_id, done)
+    _update_job(job_id, progress=done)
+
+
+def _write_export(job_id, kind, params):
+    # CSV пишется во временный файл, готовый результат заменяет его целиком
+    folder = current_app.config['JOBS_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    path = result_path(folder, job_id)
+    partial = path + '.part'
+    try:
+        header, rows, total = JOB_TASKS[kind][1](params)
+        if total is not None:
+            _update_job(job_id, total=total)
+        with open(partial, 'w', encoding='utf-8', newline='') as f:
+            for chunk in stream_csv(header, _tracked(job_id, rows)):
+                f.write(chunk)
+        os.replace(partial, path)
+    except Exception:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+    return os.path.basename(path)
+
+
+def execute_job(job_id):
+    app = _worker_app
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        params = json.loads(job.params)
+        result_file = None
+        try:
+            if job.kind in JOB_ACTIONS:
+                JOB_ACTIONS[job.kind](job_id, params)
+            else:
+                result_file = _write_export(job_id, job.kind, params)
+        except Exception as error:
+            db.session.rollback()
+            if isinstance(error, JobCancelled):
+                _update_job(job_id, status='cancelled', finished_at=datetime.datetime.utcnow())
+            else:
+                app.logger.exception(f'Задача #{job_id} завершилась с ошибкой')
+                _update_job(job_id, status='failed', error=str(error), finished_at=datetime.datetime.utcnow())
+            return
+        now = datetime.datetime.utcnow()
+        if result_file is None:
+            _update_job(job_id, status='done', finished_at=now)
+        else:
+            _update_job(
+                job_id, status='done', result_file=result_file, finished_at=now,
+                expires_at=now + datetime.timedelta(seconds=app.config['JOBS_RESULT_TTL'])
+            )
+
+
+# --- Очередь и диспетчер ---
+
+class JobRunner:
+    def __init__(self, app=None):
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('JOBS_FOLDER', os.path.join(app.instance_path, 'jobs'))
+        app.config.setdefault('JOBS_MAX_RUNNING', 2)      # одновременно на всю машину
+        app.config.setdefault('JOBS_MAX_PER_USER', 2)     # в очереди и в работе у одного пользователя
+        app.config.setdefault('JOBS_RESULT_TTL', 24 * 3600)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 1.0)
+        app.config.setdefault('JOBS_STALE_AFTER', 120)
+        app.config.setdefault('JOBS_HEARTBEAT_INTERVAL', 30)  # меньше JOBS_STALE_AFTER
+        app.config.setdefault('JOBS_APP', 'app:create_app')  # откуда процессы пула берут приложение
+        self.app = app
+        app.extensions['jobs'] = self
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # Пул и диспетчер создаются лениво и заново после fork()
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pool = None
+            self._futures = {}
+            self._wakeup = threading.Event()
+            self._stopping = threading.Event()
+            self._expired_at = 0
+            self._heartbeat_at = 0
+            self._thread = threading.Thread(target=self._run, name='job-dispatcher', daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def _get_pool(self):
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.app.config['JOBS_MAX_RUNNING'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_init_worker,
+                initargs=(self.app.config['JOBS_APP'], worker_config(self.app.config))
+            )
+        return self._pool
+
+    # --- Постановка, отмена, просмотр ---
+
+    def submit(self, kind, params, user_id):
+        # Повторный запуск того же экспорта возвращает уже идущую задачу
+        encoded = encode_params(params)
+        active = Job.query.filter(Job.user_id == user_id, Job.status.in_(ACTIVE_STATUSES)).all()
+        for job in active:
+            if job.kind == kind and job.params == encoded:
+                return job
+        limit = self.app.config['JOBS_MAX_PER_USER']
+        if len(active) >= limit:
+            raise JobLimitExceeded(f'Одновременно можно запустить не больше {limit} задач')
+        job = Job(kind=kind, params=encoded, user_id=user_id, status='queued')
+        db.session.add(job)
+        db.session.commit()
+        self._ensure_started()
+        self._wakeup.set()
+        return job
+
+    def cancel(self, job):
+        now = datetime.datetime.utcnow()
+        cancelled = Job.query.filter_by(id=job.id, status='queued').update(
+            {Job.status: 'cancelled', Job.finished_at: now}
+        )
+        if not cancelled:
+            Job.query.filter_by(id=job.id, status='running').update({Job.cancel_requested: True})
+        db.session.commit()
+        if cancelled:
+            discard_workdir(job.params)
+
+    def recent(self, kind, user_id, limit=5):
+        self._ensure_started()
+        return (
+            Job.query.filter_by(kind=kind, user_id=user_id)
+            .order_by(Job.id.desc())
+            .limit(limit)
+            .all()
+        )
+
+    # --- Диспетчер ---
+
+    def _has_queued(self):
+        queued = db.session.execute(select(Job.id).where(Job.status == 'queued').limit(1)).first()
+        db.session.rollback()  # не держим читающую транзакцию до следующего опроса
+        return queued is not None
+
+    def _claim(self):
+        # Следующая задача из очереди, если общий лимит выполняющихся не исчерпан
+        now = datetime.datetime.utcnow()
+        running = select(func.count(Job.id)).where(Job.status == 'running').scalar_subquery()
+        oldest = (
+            select(Job.id).where(Job.status == 'queued')
+            .order_by(Job.id).limit(1).scalar_subquery()
+        )
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == oldest, Job.status == 'queued', running < self.app.config['JOBS_MAX_RUNNING'])
+            .values(status='running', started_at=now, heartbeat_at=now, worker_pid=os.getpid())
+            .returning(Job.id, Job.params)
+        ).first()
+        db.session.commit()
+        return claimed
+
+    def _heartbeat(self):
+        if self._futures:
+            Job.query.filter(Job.id.in_(list(self._futures)), Job.status == 'running').update(
+                {Job.heartbeat_at: datetime.datetime.utcnow()}
+            )
+            db.session.commit()
+
+    def _reap_stale(self):
+        # Задачи, процесс которых завершился аварийно
+        stale = datetime.datetime.utcnow() - datetime.timedelta(seconds=self.app.config['JOBS_STALE_AFTER'])
+        reaped = db.session.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.heartbeat_at < stale)
+            .values(status='failed', error='Процесс задачи прервался', finished_at=datetime.datetime.utcnow())
+            .returning(Job.params)
+        ).scalars().all()
+        db.session.commit()
+        for params in reaped:
+            discard_workdir(params)
+
+    def expire_results(self):
+        now = datetime.datetime.utcnow()
+        expired = Job.query.filter(Job.status == 'done', Job.expires_at < now).all()
+        for job in expired:
+            path = result_path(self.app.config['JOBS_FOLDER'], job.id)
+            if os.path.exists(path):
+                os.remove(path)
+            job.status = 'expired'
+        db.session.commit()
+        return len(expired)
+
+    def _finished(self, job_id, params, future):
+        self._futures.pop(job_id, None)
+        discard_workdir(params)
+        error = future.exception()
+        if error is not None:
+            # Процесс пула упал (например, по памяти): пул создаётся заново
+            if isinstance(error, BrokenProcessPool):
+                self._pool = None
+            with self.app.app_context():
+                _update_job(job_id, status='failed', error=str(error) or type(error).__name__,
+                            finished_at=datetime.datetime.utcnow())
+        self._wakeup.set()
+
+    def _dispatch(self):
+        now = time.monotonic()
+        if self._heartbeat_at + self.app.config['JOBS_HEARTBEAT_INTERVAL'] <= now:
+            self._heartbeat()
+            self._reap_stale()
+            self._heartbeat_at = now
+        if self._expired_at + EXPIRE_EVERY <= now:
+            self.expire_results()
+            self._expired_at = now
+        while len(self._futures) < self.app.config['JOBS_MAX_RUNNING'] and self._has_queued():
+            claimed = self._claim()
+            if claimed is None:
+                break
+            job_id, params = claimed
+            future = self._get_pool().submit(execute_job, job_id)
+            self._futures[job_id] = future
+            future.add_done_callback(lambda future, job_id=job_id, params=params: self._finished(job_id, params, future))
+
+    def _run(self):
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    self._dispatch()
+                except Exception as e:
+                    db.session.rollback()
+                    self.app.logger.error(f'Диспетчер задач: {e}')
+            self._wakeup.wait(self.app.config['JOBS_POLL_INTERVAL'])
+            self._wakeup.clear()
+
+    def stop(self):
+        # Выполняющиеся задачи дорабатывают, новые не забираются
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        self._thread.join(timeout=10)
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+
+job_runner = JobRunner()
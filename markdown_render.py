@@ -0,0 +1,77 @@
+from models import db, Book, Review
+from concurrent.futures import ProcessPoolExecutor
+import bleach
+import markdown
+import multiprocessing
+
+# --- Markdown -> безопасный HTML ---
+# HTML строится один раз при сохранении и хранится рядом с исходным текстом.
+# RENDERER_VERSION увеличивается при изменении правил отрисовки, после чего
+# устаревшие строки обновляет команда "flask markdown rerender".
+
+RENDERER_VERSION = 1
+
+ALLOWED_TAGS = [
+    'p', 'br', 'hr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+    'strong', 'em', 'b', 'i', 'code', 'pre', 'blockquote',
+    'ul', 'ol', 'li', 'a', 'table', 'thead', 'tbody', 'tr', 'th', 'td'
+]
+
+ALLOWED_ATTRIBUTES = {
+    'a': ['href', 'title']
+}
+
+
+def render_markdown(text):
+    html = markdown.markdown(text or '', extensions=['extra', 'sane_lists'])
+    return bleach.clean(html, tags=ALLOWED_TAGS, attributes=ALLOWED_ATTRIBUTES, strip=True)
+
+
+def render_book(book):
+    book.description_html = render_markdown(book.description)
+    book.html_version = RENDERER_VERSION
+
+
+def render_review(review):
+    review.text_html = render_markdown(review.text)
+    review.html_version = RENDERER_VERSION
+
+
+# --- Массовая перерисовка устаревших строк ---
+
+RERENDER_TARGETS = {
+    Book: ('description', 'description_html'),
+    Review: ('text', 'text_html')
+}
+
+
+def rerender_stale(model, batch_size=500, workers=None):
+    source, target = RERENDER_TARGETS[model]
+    source_column = getattr(model, source)
+    updated = 0
+    last_id = 0
+    # spawn: вызов из процесса веб-сервера не должен копировать его потоки
+    # (буфер просмотров, диспетчер задач) и открытые соединения через fork()
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        while True:
+            # Пачки по возрастанию id, без OFFSET
+            rows = (
+                db.session.query(model.id, source_column)
+                .filter(model.id > last_id, model.html_version < RENDERER_VERSION)
+                .order_by(model.id)
+                .limit(batch_size)
+                .all()
+            )
+            if not rows:
+                break
+            texts = [row[1] for row in rows]
+            chunksize = max(1, len(texts) // ((workers or 4) * 4))
+            rendered = executor.map(render_markdown, texts, chunksize=chunksize)
+            db.session.execute(db.update(model), [
+                {'id': row[0], target: html, 'html_version': RENDERER_VERSION}
+                for row, html in zip(rows, rendered)
+            ])
+            db.session.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+    return updated
@@ -1,6 +1,7 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
-from datetime import datetime
+from sqlalchemy import event
+from datetime import datetime, time, timedelta
 
 db = SQLAlchemy()
 
@@ -41,42 +42,64 @@ class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     description = db.Column(db.Text, nullable=False)
+    # HTML описания, отрисованный из Markdown при сохранении (markdown_render)
+    description_html = db.Column(db.Text, nullable=True)
+    html_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     year = db.Column(db.Integer, nullable=False)
     publisher = db.Column(db.String(128), nullable=False)
     author = db.Column(db.String(128), nullable=False)
     pages = db.Column(db.Integer, nullable=False)
+    # Денормализованные агрегаты рецензий, поддерживаются событиями Review
+    review_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    rating_sum = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Версия книги для ETag и кэша фрагментов: растёт при любом изменении
+    # книги и её рецензий
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, server_default=db.func.current_timestamp())
     genres = db.relationship('Genre', secondary=book_genres, back_populates='books')
     cover = db.relationship('Cover', backref='book', uselist=False, cascade="all, delete")
-    reviews = db.relationship('Review', backref='book', cascade="all, delete")
+    reviews = db.relationship('Review', backref='book', cascade="all, delete", passive_deletes=True)
 
     def average_rating(self):
-        if not self.reviews:
+        if not self.review_count:
             return None
-        return round(sum(r.rating for r in self.reviews) / len(self.reviews), 2)
+        return round(self.rating_sum / self.review_count, 2)
 
 class Cover(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(128), nullable=False)
     mimetype = db.Column(db.String(64), nullable=False)
-    md5_hash = db.Column(db.String(64), nullable=False)
+    md5_hash = db.Column(db.String(64), nullable=False, index=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
 
 class BookViewLog(db.Model):
+    # Индексы под реальные пути доступа: по книге, по посетителю, и все - с временем
+    __table_args__ = (
+        db.Index('ix_book_view_log_book_id_timestamp', 'book_id', 'timestamp'),
+        db.Index('ix_book_view_log_user_id_timestamp', 'user_id', 'timestamp'),
+        db.Index('ix_book_view_log_session_id_timestamp', 'session_id', 'timestamp'),
+        db.Index('ix_book_view_log_ip_address_timestamp', 'ip_address', 'timestamp'),
+        db.Index('ix_book_view_log_timestamp', 'timestamp'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True)
     session_id = db.Column(db.String(128), nullable=True)  # For anonymous users
     ip_address = db.Column(db.String(64), nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
-    book = db.relationship('Book', backref=db.backref('views', cascade='all, delete-orphan'))
+    # Просмотры удаляются запросами (delete_book, view_archive), ORM их не загружает
+    book = db.relationship('Book', backref=db.backref('views', cascade='all, delete-orphan', passive_deletes=True))
     user = db.relationship('User', backref='view_logs')
 
     @classmethod
-    def check_daily_limit(cls, book_id, user_id=None, session_id=None, ip_address=None):
-        today = datetime.utcnow().date()
+    def daily_views_query(cls, book_id, user_id=None, session_id=None, ip_address=None):
+        # Полуоткрытый интервал [начало суток; начало следующих) - работает по индексу
+        today = datetime.combine(datetime.utcnow().date(), time())
         query = cls.query.filter(
             cls.book_id == book_id,
-            db.func.date(cls.timestamp) == today
+            cls.timestamp >= today,
+            cls.timestamp < today + timedelta(days=1)
         )
         
         if user_id:
@@ -86,13 +109,215 @@ class BookViewLog(db.Model):
         else:
             query = query.filter(cls.ip_address == ip_address)
             
-        return query.count() < 10  # True если лимит не превышен
+        return query
+
+    @classmethod
+    def count_daily_views(cls, book_id, user_id=None, session_id=None, ip_address=None):
+        return cls.daily_views_query(book_id, user_id, session_id, ip_address).count()
+
+    @classmethod
+    def check_daily_limit(cls, book_id, user_id=None, session_id=None, ip_address=None):
+        return cls.count_daily_views(book_id, user_id, session_id, ip_address) < 10  # True если лимит не превышен
+
+class BookViewDaily(db.Model):
+    # Суточная сводка просмотров, обновляется вместе с журналом
+    __table_args__ = (
+        db.Index('ix_book_view_daily_day', 'day', 'book_id', 'views'),
+    )
+
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True)
+    day = db.Column(db.Date, primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+    first_view = db.Column(db.DateTime, nullable=False)
+    last_view = db.Column(db.DateTime, nullable=False)
+
+    @classmethod
+    def record_views(cls, views):
+        # views - пары (book_id, timestamp); одна UPSERT-операция на пару (книга, день)
+        rows = {}
+        for book_id, timestamp in views:
+            key = (book_id, timestamp.date())
+            if key in rows:
+                row = rows[key]
+                row['views'] += 1
+                row['first_view'] = min(row['first_view'], timestamp)
+                row['last_view'] = max(row['last_view'], timestamp)
+            else:
+                rows[key] = {'book_id': book_id, 'day': key[1], 'views': 1,
+                             'first_view': timestamp, 'last_view': timestamp}
+        if not rows:
+            return
+
+        if db.session.get_bind().dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+            least, greatest = db.func.least, db.func.greatest
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+            least, greatest = db.func.min, db.func.max
+
+        stmt = insert(cls)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[cls.book_id, cls.day],
+            set_={
+                'views': cls.views + stmt.excluded.views,
+                'first_view': least(cls.first_view, stmt.excluded.first_view),
+                'last_view': greatest(cls.last_view, stmt.excluded.last_view)
+            }
+        )
+        db.session.execute(stmt, list(rows.values()))
+
+class ViewArchiveSegment(db.Model):
+    # Пачка просмотров, перенесённая в помесячный архив (view_archive);
+    # file_offset - размер файла до записи, pending - запись ещё не подтверждена
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), nullable=False)
+    file_offset = db.Column(db.BigInteger, nullable=False)
+    rows = db.Column(db.Integer, nullable=False)
+    first_id = db.Column(db.Integer, nullable=False)
+    last_id = db.Column(db.Integer, nullable=False)
+    cutoff = db.Column(db.DateTime, nullable=False)
+    status = db.Column(db.String(16), nullable=False, default='pending')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class CatalogState(db.Model):
+    # Одна строка: версия каталога в целом (список книг, жанры, обложки)
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class IdentityState(db.Model):
+    # Одна строка: версия пользователей и ролей для кэша снимков Identity
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=1)
 
 class Review(db.Model):
+    # Рецензии книги и рецензия пользователя на странице книги
+    __table_args__ = (
+        db.Index('ix_review_book_user', 'book_id', 'user_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)
     text = db.Column(db.Text, nullable=False)
+    text_html = db.Column(db.Text, nullable=True)
+    html_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
 
+class CatalogImport(db.Model):
+    # Задача импорта каталога; rows_done - прочитанные строки источника для продолжения
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(256), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=False, index=True)
+    status = db.Column(db.String(16), nullable=False, default='running')
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    imported = db.Column(db.Integer, nullable=False, default=0)
+    failed = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    finished_at = db.Column(db.DateTime, nullable=True)
+
+class BookCoView(db.Model):
+    # Разреженная матрица совместных просмотров: сколько раз за сутки один
+    # посетитель смотрел обе книги (хранятся обе пары (a, b) и (b, a))
+    book_id = db.Column(db.Integer, primary_key=True)
+    other_id = db.Column(db.Integer, primary_key=True)
+    views = db.Column(db.Integer, nullable=False, default=0)
+
+class BookVisitorDays(db.Model):
+    # Число пар (посетитель, сутки) с просмотром книги - норма для сходства
+    book_id = db.Column(db.Integer, primary_key=True)
+    visits = db.Column(db.Integer, nullable=False, default=0)
+
+class BookRecommendation(db.Model):
+    # Top-K похожих книг; страница книги читает их одним запросом по ключу
+    book_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    recommended_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False, index=True)
+    score = db.Column(db.Float, nullable=False)
+
+class RecommendationState(db.Model):
+    # Одна строка: сутки журнала до processed_until (не включая) уже учтены
+    id = db.Column(db.Integer, primary_key=True)
+    processed_until = db.Column(db.Date, nullable=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class BookTrending(db.Model):
+    # Затухающий счёт книги: сумма 2^((t - epoch) / период полураспада)
+    # по просмотрам, epoch - в TrendingState
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0)
+
+class TrendingLeaderboard(db.Model):
+    # Готовые top-N по счёту: genre_id = 0 - весь каталог
+    genre_id = db.Column(db.Integer, primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True)
+    book_id = db.Column(db.Integer, db.ForeignKey('book.id', ondelete='CASCADE'), nullable=False)
+    score = db.Column(db.Float, nullable=False)
+
+class TrendingState(db.Model):
+    # Одна строка: точка отсчёта счетов и время последнего пересчёта рейтингов
+    id = db.Column(db.Integer, primary_key=True)
+    epoch = db.Column(db.DateTime, nullable=False)
+    refreshed_at = db.Column(db.DateTime, nullable=True)
+
+class RecentlyViewed(db.Model):
+    # Недавно просмотренные книги посетителя: id через запятую, последние первыми
+    visitor = db.Column(db.String(40), primary_key=True)
+    book_ids = db.Column(db.String(128), nullable=False, default='')
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+class Job(db.Model):
+    # Фоновая задача (экспорт); params - JSON, progress - обработанные строки
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(64), nullable=False)
+    params = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(16), nullable=False, default='queued', index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='SET NULL'), nullable=True, index=True)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer, nullable=True)
+    cancel_requested = db.Column(db.Boolean, nullable=False, default=False)
+    result_file = db.Column(db.String(256), nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    worker_pid = db.Column(db.Integer, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    heartbeat_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+    def percent(self):
+        if self.status == 'done':
+            return 100
+        if not self.total:
+            return None
+        return min(99, self.progress * 100 // self.total)
+
+# --- Поддержка агрегатов рецензий в той же транзакции ---
+
+def _update_rating_aggregates(connection, review, sign):
+    book_table = Book.__table__
+    connection.execute(
+        book_table.update()
+        .where(book_table.c.id == review.book_id)
+        .values(
+            review_count=book_table.c.review_count + sign,
+            rating_sum=book_table.c.rating_sum + sign * review.rating,
+            version=book_table.c.version + 1,
+            updated_at=datetime.utcnow()
+        )
+    )
+
+@event.listens_for(Review, 'after_insert')
+def _review_inserted(mapper, connection, review):
+    _update_rating_aggregates(connection, review, 1)
+
+@event.listens_for(Review, 'after_delete')
+def _review_deleted(mapper, connection, review):
+    _update_rating_aggregates(connection, review, -1)
+
+@event.listens_for(Book, 'before_update')
+def _book_updated(mapper, connection, book):
+    if db.session.is_modified(book):
+        book.version = (book.version or 0) + 1
+        book.updated_at = datetime.utcnow()
@@ -0,0 +1,87 @@
+from flask_sqlalchemy.pagination import Pagination
+from sqlalchemy import tuple_
+import base64
+import datetime
+
+
+# --- Курсорная (keyset) пагинация ---
+# Страница задаётся не номером, а ключом (timestamp, id) последней
+# показанной записи, поэтому глубокие страницы не требуют OFFSET.
+
+def encode_cursor(timestamp, row_id):
+    raw = f'{timestamp.isoformat()}|{row_id}'.encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    # Некорректный курсор трактуется как его отсутствие
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, row_id = raw.split('|')
+        return datetime.datetime.fromisoformat(timestamp), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, items, has_next, has_prev, key):
+        self.items = items
+        self.has_next = has_next
+        self.has_prev = has_prev
+        self.next_cursor = encode_cursor(*key(items[-1])) if items and has_next else None
+        self.prev_cursor = encode_cursor(*key(items[0])) if items and has_prev else None
+
+    def __iter__(self):
+        return iter(self.items)
+
+
+def keyset_paginate(query, timestamp_column, id_column, per_page, after=None, before=None):
+    # Записи упорядочены от новых к старым; after - следующая страница, before - предыдущая
+    key = lambda item: (getattr(item, timestamp_column.key), getattr(item, id_column.key))
+    columns = tuple_(timestamp_column, id_column)
+
+    after = decode_cursor(after)
+    before = decode_cursor(before)
+
+    if before:
+        rows = (
+            query.filter(columns > tuple_(*before))
+            .order_by(timestamp_column.asc(), id_column.asc())
+            .limit(per_page + 1)
+            .all()
+        )
+        has_prev = len(rows) > per_page
+        items = list(reversed(rows[:per_page]))
+        return KeysetPage(items, has_next=True, has_prev=has_prev, key=key)
+
+    if after:
+        query = query.filter(columns < tuple_(*after))
+    rows = (
+        query.order_by(timestamp_column.desc(), id_column.desc())
+        .limit(per_page + 1)
+        .all()
+    )
+    return KeysetPage(rows[:per_page], has_next=len(rows) > per_page, has_prev=after is not None, key=key)
+
+
+# --- Пагинация по готовому списку id ---
+# Порядок и общее число записей уже известны (например, из индекса
+# фасетов), из базы загружается только текущая страница.
+
+class IdListPagination(Pagination):
+    def _query_items(self):
+        ids = [int(item_id) for item_id in self._query_args['ids'][self._query_offset:self._query_offset + self.per_page]]
+        if not ids:
+            return []
+        books = {item.id: item for item in self._query_args['query'].filter(self._query_args['id_column'].in_(ids))}
+        return [books[item_id] for item_id in ids if item_id in books]
+
+    def _query_count(self):
+        return len(self._query_args['ids'])
+
+
+def id_list_paginate(query, id_column, ids, page, per_page):
+    # ids - упорядоченные id всех записей, query - запрос для загрузки страницы
+    return IdListPagination(page=page, per_page=per_page, query=query, id_column=id_column, ids=ids)
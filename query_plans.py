@@ -0,0 +1,64 @@
+from models import db, Cover, BookViewLog, Review
+from stats import popular_books_query
+from recommendations import recommended_books_query
+from trending import trending_books_query
+from sqlalchemy import tuple_
+import datetime
+
+
+# --- Планы выполнения "горячих" запросов ---
+# Для каждого запроса выполняется EXPLAIN QUERY PLAN (только SQLite);
+# полный просмотр таблицы без индекса считается регрессией.
+
+def hot_queries():
+    now = datetime.datetime.utcnow()
+    return {
+        'daily_limit_user': BookViewLog.daily_views_query(1, user_id=1),
+        'daily_limit_session': BookViewLog.daily_views_query(1, session_id='s'),
+        'daily_limit_ip': BookViewLog.daily_views_query(1, ip_address='127.0.0.1'),
+        'popular_books': popular_books_query(),
+        'cover_by_md5': Cover.query.filter_by(md5_hash='0' * 32),
+        'book_reviews': Review.query.filter_by(book_id=1),
+        'book_recommendations': recommended_books_query(1),
+        'trending_overall': trending_books_query(),
+        'trending_genre': trending_books_query(genre_id=1),
+        'book_views_range': BookViewLog.query.filter(
+            BookViewLog.book_id == 1,
+            BookViewLog.timestamp >= now - datetime.timedelta(days=30)
+        ),
+        'activity_log_page': BookViewLog.query.filter(
+            tuple_(BookViewLog.timestamp, BookViewLog.id) < tuple_(now, 10 ** 9)
+        ).order_by(BookViewLog.timestamp.desc(), BookViewLog.id.desc()).limit(11),
+    }
+
+
+def explain(query):
+    statement = query.statement if hasattr(query, 'statement') else query
+    compiled = statement.compile(dialect=db.engine.dialect)
+    # План не зависит от значений параметров, передаём их как есть
+    params = tuple(
+        value if isinstance(value, (int, float, str, bytes, type(None))) else str(value)
+        for value in (compiled.params[name] for name in compiled.positiontup)
+    )
+    with db.engine.connect() as connection:
+        rows = connection.exec_driver_sql('EXPLAIN QUERY PLAN ' + str(compiled), params).all()
+    return [row[-1] for row in rows]
+
+
+def full_scans(plan):
+    # "SCAN book_view_log" без индекса - полный просмотр таблицы
+    tables = set(db.metadata.tables)
+    scans = []
+    for detail in plan:
+        words = detail.split()
+        if len(words) >= 2 and words[0] == 'SCAN' and words[1] in tables and 'INDEX' not in detail:
+            scans.append(detail)
+    return scans
+
+
+def check_query_plans():
+    # Словарь {имя запроса: (план, полные просмотры)}
+    return {
+        name: (plan, full_scans(plan))
+        for name, plan in ((name, explain(query)) for name, query in hot_queries().items())
+    }
@@ -0,0 +1,125 @@
+from flask import current_app, session
+from flask_login import current_user
+from models import db, Book, RecentlyViewed
+from sqlalchemy import delete
+import datetime
+import secrets
+
+
+# --- Недавно просмотренные книги ---
+# Список текущего посетителя хранится в подписанной сессии: гостю не нужна
+# ни строка в базе, ни отдельный идентификатор, а кука меняется, только
+# когда меняется сам список. Для пользователя список дополнительно
+# сохраняется в строке 'u:<id>', чтобы он переживал выход и другие
+# устройства; запись идёт через буфер просмотров (последний список
+# пользователя за интервал сброса - один UPSERT), а не в запросе. Сессия,
+# начатая по куке "запомнить меня", подгружает сохранённый список при
+# первом обращении, иначе первый просмотр затёр бы его одной книгой.
+# Список без повторов, последние первыми, не длиннее STORED_SIZE; хранится
+# чуть больше, чем показывается, чтобы удалённые книги не укорачивали блок.
+# При входе гостевой список сливается со списком пользователя. Строки
+# пользователей, не заходивших дольше RECENTLY_VIEWED_TTL_DAYS, удаляет
+# команда "flask views prune-recent".
+
+STORED_SIZE = 10
+SESSION_KEY = 'recently_viewed'
+VISITOR_KEY = 'visitor_id'
+
+
+def _parse(book_ids):
+    return [int(book_id) for book_id in book_ids.split(',') if book_id]
+
+
+def _merge(*lists):
+    merged = []
+    for book_ids in lists:
+        for book_id in book_ids:
+            if book_id not in merged:
+                merged.append(book_id)
+    return merged[:STORED_SIZE]
+
+
+def user_visitor(user_id):
+    return f'u:{user_id}'
+
+
+def session_visitor_id():
+    # Постоянный идентификатор посетителя для журнала просмотров и лимита:
+    # кука сессии меняется вместе со списком, а этот id создаётся один раз
+    if VISITOR_KEY not in session:
+        session[VISITOR_KEY] = secrets.token_hex(16)
+    return session[VISITOR_KEY]
+
+
+def _stored_list(visitor):
+    row = db.session.get(RecentlyViewed, visitor)
+    return _parse(row.book_ids) if row else []
+
+
+def _session_list():
+    if SESSION_KEY not in session and current_user.is_authenticated:
+        session[SESSION_KEY] = _stored_list(user_visitor(current_user.id))
+    return session.get(SESSION_KEY, [])
+
+
+def save_lists(lists):
+    # lists - {visitor: (список id, время)}; одним UPSERT на все строки
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    stmt = insert(RecentlyViewed)
+    db.session.execute(stmt.on_conflict_do_update(
+        index_elements=[RecentlyViewed.visitor],
+        set_={'book_ids': stmt.excluded.book_ids, 'updated_at': stmt.excluded.updated_at}
+    ), [
+        {'visitor': visitor, 'book_ids': ','.join(str(book_id) for book_id in book_ids), 'updated_at': updated_at}
+        for visitor, (book_ids, updated_at) in lists.items()
+    ])
+
+
+def remember_view(book_id):
+    # Вызывается из view_book(); книга, уже стоящая первой, ничего не меняет
+    book_ids = _session_list()
+    if book_ids[:1] == [book_id]:
+        return
+    book_ids = session[SESSION_KEY] = _merge([book_id], book_ids)
+    if current_user.is_authenticated:
+        current_app.extensions['view_buffer'].remember_recent(user_visitor(current_user.id), book_ids)
+
+
+def recent_book_ids(limit=5):
+    return _session_list()[:limit]
+
+
+def recent_books(options=(), limit=5):
+    # Одна выборка книг по первичному ключу, порядок - из списка
+    book_ids = recent_book_ids(limit)
+    if not book_ids:
+        return []
+    books = {book.id: book for book in Book.query.options(*options).filter(Book.id.in_(book_ids))}
+    return [books[book_id] for book_id in book_ids if book_id in books]
+
+
+def merge_guest_views(user_id):
+    # После входа: гостевые просмотры (более свежие) идут перед сохранёнными просмотрами пользователя
+    visitor = user_visitor(user_id)
+    stored = _stored_list(visitor)
+    book_ids = session[SESSION_KEY] = _merge(session.get(SESSION_KEY, []), stored)
+    if book_ids != stored:
+        save_lists({visitor: (book_ids, datetime.datetime.utcnow())})
+        db.session.commit()
+
+
+def forget_session_views():
+    # При выходе список и идентификатор пользователя не должны остаться следующему гостю
+    session.pop(SESSION_KEY, None)
+    session.pop(VISITOR_KEY, None)
+
+
+def prune_recently_viewed(days):
+    # Удаляет строки, не обновлявшиеся дольше days дней; возвращает их число
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=days)
+    deleted = db.session.execute(delete(RecentlyViewed).where(RecentlyViewed.updated_at < cutoff)).rowcount
+    db.session.commit()
+    return deleted
@@ -0,0 +1,263 @@
+from models import (
+    db, Book, BookViewLog, BookCoView, BookVisitorDays, BookRecommendation, RecommendationState
+)
+from sqlalchemy import cast, delete, func, insert, literal, select
+import datetime
+import itertools
+import numpy as np
+
+
+# --- Рекомендации "Читатели также смотрели" ---
+# Корзина - книги, которые один посетитель (пользователь, сессия или IP)
+# смотрел за одни сутки. Пары книг из каждой корзины накапливаются в
+# разреженной матрице BookCoView, число корзин с книгой - в BookVisitorDays.
+# Сходство - косинус co / sqrt(n_a * n_b), ослабленный для редких пар
+# множителем co / (co + SHRINK). Для каждой книги хранятся TOP_K соседей
+# (BookRecommendation), страница книги читает их одним запросом.
+#
+# Журнал обрабатывается целыми сутками: "flask recommendations update"
+# добавляет к матрице только сутки после RecommendationState.processed_until
+# и пересчитывает соседей книг, которые в них встречались, и книг, в чьём
+# top-K они есть. Оценки остальных пар со временем немного отстают от
+# точных (меняются нормы), "rebuild" пересчитывает всё заново.
+
+TOP_K = 10
+MAX_BASKET = 20    # книг из одной корзины (первые по времени просмотра)
+SHRINK = 5.0
+CHUNK_DAYS = 7     # суток журнала за один проход
+FLUSH_PAIRS = 5000000  # пар в памяти до записи в базу
+TOPK_CHUNK = 1000  # книг за один пересчёт соседей
+UPSERT_CHUNK = 10000
+
+
+def _upsert(model, index_elements, column, rows):
+    # Прибавляет счётчики к существующим строкам (INSERT ... ON CONFLICT)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    stmt = dialect_insert(model)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=index_elements,
+        set_={column: getattr(model, column) + getattr(stmt.excluded, column)}
+    )
+    connection = db.session.connection()
+    for start in range(0, len(rows), UPSERT_CHUNK):
+        connection.execute(stmt, rows[start:start + UPSERT_CHUNK])
+
+
+def _int_array(rows, columns):
+    # Строки результата из целых чисел -> массив (n, columns) без промежуточных кортежей
+    values = itertools.chain.from_iterable(rows)
+    return np.fromiter(values, dtype=np.int64, count=len(rows) * columns).reshape(-1, columns)
+
+
+def _factorize(values):
+    # Номер каждого значения в порядке первого появления
+    index = {}
+    return np.fromiter((index.setdefault(value, len(index)) for value in values), dtype=np.int64, count=len(values))
+
+
+def _state():
+    state = db.session.get(RecommendationState, 1)
+    if state is None:
+        state = RecommendationState(id=1)
+        db.session.add(state)
+    return state
+
+
+# --- Корзины и пары ---
+
+def load_baskets(since, until):
+    # (номер корзины, книга) за [since; until), книги корзины - по первому просмотру.
+    # Строки журнала читаются как есть, группировка и сортировка - в NumPy
+    # (GROUP BY по строковому ключу в SQLite в несколько раз медленнее)
+    visitor = func.coalesce(
+        literal('u').concat(cast(BookViewLog.user_id, db.String)),
+        literal('s').concat(BookViewLog.session_id),
+        literal('i').concat(BookViewLog.ip_address)
+    )
+    rows = db.session.connection().execute(
+        select(visitor, func.date(BookViewLog.timestamp), BookViewLog.book_id, BookViewLog.id)
+        .where(BookViewLog.timestamp >= since, BookViewLog.timestamp < until, visitor.isnot(None))
+    ).all()
+    if not rows:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    visitors, days, books, ids = zip(*rows)
+    day_index = _factorize(days)
+    groups = _factorize(visitors) * (day_index.max() + 1) + day_index
+    books = np.array(books, dtype=np.int64)
+    ids = np.array(ids, dtype=np.int64)
+
+    # Первый просмотр каждой книги в корзине, затем корзины подряд
+    order = np.lexsort((ids, books, groups))
+    groups, books, ids = groups[order], books[order], ids[order]
+    first = np.r_[True, (groups[1:] != groups[:-1]) | (books[1:] != books[:-1])]
+    groups, books, ids = groups[first], books[first], ids[first]
+    order = np.lexsort((ids, groups))
+    return groups[order], books[order]
+
+
+def coview_pairs(groups, books, max_basket=MAX_BASKET):
+    # Все упорядоченные пары книг внутри корзин и диагональ (a, a),
+    # посчитанные без цикла по корзинам: сдвиг k сравнивает i-ю и (i+k)-ю строки
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    sizes = np.diff(np.r_[starts, len(groups)])
+    position = np.arange(len(groups)) - np.repeat(starts, sizes)
+    keep = position < max_basket
+    groups, books = groups[keep], books[keep]
+
+    first, second = [books], [books]
+    for k in range(1, max_basket):
+        same = groups[:-k] == groups[k:]
+        if not same.any():
+            break
+        a, b = books[:-k][same], books[k:][same]
+        first += [a, b]
+        second += [b, a]
+    codes, counts = np.unique((np.concatenate(first) << 32) | np.concatenate(second), return_counts=True)
+    return codes >> 32, codes & 0xFFFFFFFF, counts
+
+
+def _write_pairs(codes, counts):
+    # Слияние накопленных пар и прибавление к матрице; возвращает затронутые книги
+    codes, inverse = np.unique(np.concatenate(codes), return_inverse=True)
+    counts = np.bincount(inverse, weights=np.concatenate(counts)).astype(np.int64)
+    a, b = codes >> 32, codes & 0xFFFFFFFF
+    diagonal = a == b
+    _upsert(BookVisitorDays, ['book_id'], 'visits', [
+        {'book_id': book_id, 'visits': visits}
+        for book_id, visits in zip(a[diagonal].tolist(), counts[diagonal].tolist())
+    ])
+    _upsert(BookCoView, ['book_id', 'other_id'], 'views', [
+        {'book_id': book_id, 'other_id': other_id, 'views': views}
+        for book_id, other_id, views in zip(a[~diagonal].tolist(), b[~diagonal].tolist(),
+                                            counts[~diagonal].tolist())
+    ])
+    return set(a[diagonal].tolist())
+
+
+def add_views(since, until, progress=None):
+    # Добавляет к матрице сутки [since; until); возвращает затронутые книги.
+    # Пары копятся в памяти до FLUSH_PAIRS и записываются вместе с отметкой
+    # processed_until, поэтому прерванный пересчёт продолжается без двойного счёта.
+    affected = set()
+    codes, counts = [], []
+    start = since
+    while start < until:
+        end = min(start + datetime.timedelta(days=CHUNK_DAYS), until)
+        groups, books = load_baskets(start, end)
+        if len(books):
+            a, b, pair_counts = coview_pairs(groups, books)
+            codes.append((a << 32) | b)
+            counts.append(pair_counts)
+        if end == until or sum(len(chunk) for chunk in codes) >= FLUSH_PAIRS:
+            if codes:
+                affected |= _write_pairs(codes, counts)
+                codes, counts = [], []
+            state = _state()
+            state.processed_until = end.date()
+            state.updated_at = datetime.datetime.utcnow()
+            db.session.commit()
+        if progress:
+            progress(end, len(books))
+        start = end
+    return affected
+
+
+# --- Соседи ---
+
+def _lookup(keys, values, wanted):
+    # values для wanted по отсортированным keys, 0 для отсутствующих
+    if not len(keys):
+        return np.zeros(len(wanted))
+    index = np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)
+    return np.where(keys[index] == wanted, values[index], 0)
+
+
+def recompute_neighbours(book_ids, top_k=TOP_K):
+    norms = _int_array(db.session.connection().execute(
+        select(BookVisitorDays.book_id, BookVisitorDays.visits).order_by(BookVisitorDays.book_id)
+    ).all(), 2)
+    norm_ids, norm_values = norms[:, 0], norms[:, 1].astype(np.float64)
+
+    book_ids = sorted(book_ids)
+    for start in range(0, len(book_ids), TOPK_CHUNK):
+        chunk = book_ids[start:start + TOPK_CHUNK]
+        connection = db.session.connection()
+        connection.execute(delete(BookRecommendation).where(BookRecommendation.book_id.in_(chunk)))
+        rows = _int_array(connection.execute(
+            select(BookCoView.book_id, BookCoView.other_id, BookCoView.views)
+            .where(BookCoView.book_id.in_(chunk))
+        ).all(), 3)
+        a, b, co = rows[:, 0], rows[:, 1], rows[:, 2].astype(np.float64)
+        denominator = np.sqrt(_lookup(norm_ids, norm_values, a) * _lookup(norm_ids, norm_values, b))
+        # У удалённых книг нормы нет: такие пары не рекомендуются
+        valid = denominator > 0
+        a, b, co, denominator = a[valid], b[valid], co[valid], denominator[valid]
+        scores = co / denominator * co / (co + SHRINK)
+
+        # По книге, внутри книги - по убыванию оценки; первые top_k в каждой группе
+        order = np.lexsort((b, -scores, a))
+        a, b, scores = a[order], b[order], scores[order]
+        starts = np.flatnonzero(np.r_[True, a[1:] != a[:-1]]) if len(a) else np.empty(0, dtype=np.int64)
+        rank = np.arange(len(a)) - np.repeat(starts, np.diff(np.r_[starts, len(a)]))
+        keep = rank < top_k
+        if keep.any():
+            connection.execute(insert(BookRecommendation), [
+                {'book_id': book_id, 'rank': position, 'recommended_id': other_id, 'score': score}
+                for book_id, position, other_id, score in zip(
+                    a[keep].tolist(), rank[keep].tolist(), b[keep].tolist(), scores[keep].tolist()
+                )
+            ])
+        db.session.commit()
+    return len(book_ids)
+
+
+# --- Обновление ---
+
+def update_recommendations(now=None, progress=None):
+    # Учитывает завершённые сутки, которые ещё не попали в матрицу
+    until = datetime.datetime.combine((now or datetime.datetime.utcnow()).date(), datetime.time())
+    state = _state()
+    if state.processed_until:
+        since = datetime.datetime.combine(state.processed_until, datetime.time())
+    else:
+        first_view = db.session.query(func.min(BookViewLog.timestamp)).scalar()
+        if first_view is None:
+            return 0
+        since = datetime.datetime.combine(first_view.date(), datetime.time())
+    if since >= until:
+        return 0
+    affected = add_views(since, until, progress)
+    referring = set()
+    for start in range(0, len(affected), TOPK_CHUNK):
+        chunk = sorted(affected)[start:start + TOPK_CHUNK]
+        referring.update(
+            book_id for book_id, in db.session.query(BookRecommendation.book_id)
+            .filter(BookRecommendation.recommended_id.in_(chunk))
+            .distinct()
+        )
+    return recompute_neighbours(affected | referring)
+
+
+def rebuild_recommendations(now=None, progress=None):
+    # С нуля по журналу; сутки, перенесённые в архив, в новую матрицу не попадут
+    for model in (BookCoView, BookVisitorDays, BookRecommendation, RecommendationState):
+        db.session.execute(delete(model))
+    db.session.commit()
+    return update_recommendations(now, progress)
+
+
+def forget_book(book_id):
+    for model in (BookCoView, BookVisitorDays, BookRecommendation):
+        db.session.execute(delete(model).where(model.book_id == book_id))
+
+
+def recommended_books_query(book_id, limit=6):
+    return (
+        Book.query.join(BookRecommendation, BookRecommendation.recommended_id == Book.id)
+        .filter(BookRecommendation.book_id == book_id)
+        .order_by(BookRecommendation.rank)
+        .limit(limit)
+    )
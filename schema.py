@@ -0,0 +1,56 @@
+from models import db
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateColumn
+
+
+# --- Обновление схемы существующей базы ---
+# create_all() создаёт только недостающие таблицы. upgrade_schema()
+# дополнительно приводит таблицы базы, созданной прежней версией, к
+# моделям: добавляет недостающие столбцы (ALTER TABLE ... ADD COLUMN) и
+# индексы. Изменение и удаление существующих столбцов не поддерживается.
+# Производные данные новых столбцов и таблиц (агрегаты оценок, HTML,
+# сводки) заполняет команда "flask setup" по списку изменений.
+
+
+def _add_column(connection, table, column):
+    preparer = connection.dialect.identifier_preparer
+    default = column.server_default.arg if column.server_default is not None else None
+    if isinstance(default, str) or (default is not None and connection.dialect.name != 'sqlite'):
+        ddl = CreateColumn(column).compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {ddl}'))
+        return
+    # SQLite не добавляет столбец с неконстантным значением по умолчанию, а
+    # NOT NULL без значения по умолчанию не добавить в непустую таблицу:
+    # такой столбец добавляется допускающим NULL и заполняется UPDATE
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(
+        f'ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column_type}'
+    ))
+    if default is None and column.default is not None and column.default.is_scalar:
+        default = column.default.arg
+    if default is not None:
+        connection.execute(table.update().values({column.name: default}))
+
+
+def upgrade_schema():
+    # Возвращает (созданные таблицы, добавленные столбцы 'таблица.столбец', созданные индексы)
+    existing = set(inspect(db.engine).get_table_names())
+    db.create_all()
+    created = [table.name for table in db.metadata.sorted_tables if table.name not in existing]
+    columns, indexes = [], []
+    inspector = inspect(db.engine)
+    with db.engine.begin() as connection:
+        for table in db.metadata.sorted_tables:
+            if table.name not in existing:
+                continue
+            present = {column['name'] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in present:
+                    _add_column(connection, table, column)
+                    columns.append(f'{table.name}.{column.name}')
+            present = {index['name'] for index in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in present:
+                    index.create(connection)
+                    indexes.append(index.name)
+    return created, columns, indexes
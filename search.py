@@ -0,0 +1,124 @@
+from models import db, Book, Genre
+from sqlalchemy import DDL, event, func, literal_column, select, table, column, or_
+import re
+
+
+# --- Полнотекстовый поиск по каталогу ---
+# Внешний FTS5-индекс book_fts над book (название, автор, издательство,
+# описание) поддерживается триггерами, поэтому синхронен при любых
+# изменениях книг. Токенизатор unicode61 приводит кириллицу к нижнему
+# регистру, но снимает диакритику только с латиницы, поэтому ё заменяется
+# на е в триггерах (и в запросе); окончания русских слов отбрасываются
+# в запросе, а оставшаяся основа ищется по префиксу.
+
+FTS_COLUMNS = ('title', 'author', 'publisher', 'description')
+
+
+def _indexed(row):
+    # Значения столбцов строки row (new, old или book) в том виде, в каком они индексируются
+    return ', '.join(f"replace(replace({row}.{name}, 'ё', 'е'), 'Ё', 'Е')" for name in FTS_COLUMNS)
+
+
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+        title, author, publisher, description,
+        content='book', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3 4'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS book_fts_ai AFTER INSERT ON book BEGIN
+        INSERT INTO book_fts(rowid, title, author, publisher, description)
+        VALUES (new.id, {_indexed('new')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS book_fts_ad AFTER DELETE ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, publisher, description)
+        VALUES ('delete', old.id, {_indexed('old')});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS book_fts_au AFTER UPDATE OF title, author, publisher, description ON book BEGIN
+        INSERT INTO book_fts(book_fts, rowid, title, author, publisher, description)
+        VALUES ('delete', old.id, {_indexed('old')});
+        INSERT INTO book_fts(rowid, title, author, publisher, description)
+        VALUES (new.id, {_indexed('new')});
+    END"""
+]
+
+for statement in SEARCH_DDL:
+    event.listen(Book.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+
+# Веса полей для bm25: название важнее автора, автор важнее описания
+FIELD_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ией',
+    'ах', 'ях', 'ов', 'ев', 'ей', 'ой', 'ый', 'ий', 'ая', 'яя', 'ое', 'ее',
+    'ые', 'ие', 'ую', 'юю', 'ом', 'ем', 'ам', 'ям', 'ию', 'ия',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь'
+], key=len, reverse=True)
+
+book_fts = table('book_fts', column('rowid'))
+
+
+def _stem(word):
+    # Грубое отсечение окончания, основа не короче трёх букв
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def query_terms(text):
+    text = text.lower().replace('ё', 'е')
+    return [_stem(word) for word in re.findall(r'\w+', text)]
+
+
+def match_expression(terms):
+    # Каждый термин - префиксный запрос в кавычках (без операторов FTS5 из ввода)
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def fts_available():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def search_books(text='', genre_id=None, year_from=None, year_to=None):
+    query = Book.query
+    terms = query_terms(text or '')
+
+    if terms and fts_available():
+        book_fts_column = literal_column('book_fts')
+        matches = (
+            select(
+                book_fts.c.rowid.label('book_id'),
+                func.bm25(book_fts_column, *FIELD_WEIGHTS).label('rank')
+            )
+            .select_from(book_fts)
+            .where(book_fts_column.op('MATCH')(match_expression(terms)))
+            .subquery()
+        )
+        query = query.join(matches, matches.c.book_id == Book.id).order_by(matches.c.rank, Book.id)
+    else:
+        for term in terms:
+            # Без FTS5 (например, PostgreSQL) - медленный поиск по подстроке
+            pattern = f'%{term}%'
+            query = query.filter(or_(Book.title.ilike(pattern), Book.author.ilike(pattern)))
+        query = query.order_by(Book.year.desc(), Book.id)
+
+    if genre_id:
+        query = query.filter(Book.genres.any(Genre.id == genre_id))
+    if year_from:
+        query = query.filter(Book.year >= year_from)
+    if year_to:
+        query = query.filter(Book.year <= year_to)
+    return query
+
+
+def rebuild_search_index():
+    # Создаёт индекс и триггеры, если их нет, и заполняет индекс заново
+    # (не командой 'rebuild': она взяла бы значения из book без замены ё)
+    for statement in SEARCH_DDL:
+        db.session.execute(db.text(statement))
+    db.session.execute(db.text("INSERT INTO book_fts(book_fts) VALUES ('delete-all')"))
+    db.session.execute(db.text(
+        f"INSERT INTO book_fts(rowid, title, author, publisher, description) SELECT book.id, {_indexed('book')} FROM book"
+    ))
+    db.session.commit()
+    return db.session.query(func.count(Book.id)).scalar()
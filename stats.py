@@ -0,0 +1,162 @@
+from models import db, Book, Review, BookViewLog, BookViewDaily, ViewArchiveSegment
+from sqlalchemy import func, case, insert, select
+import datetime
+from datetime import timedelta
+
+
+# --- Агрегаты просмотров по книгам ---
+# Все метрики считаются одним GROUP BY по суточной сводке BookViewDaily,
+# сортировка и LIMIT/OFFSET выполняются в базе данных.
+# Окна "неделя" и "месяц" считаются целыми сутками.
+
+def book_stats_query(now=None):
+    today = (now or datetime.datetime.utcnow()).date()
+    week_ago = today - timedelta(days=7)
+    month_ago = today - timedelta(days=30)
+
+    views = (
+        db.session.query(
+            BookViewDaily.book_id.label('book_id'),
+            func.sum(BookViewDaily.views).label('total_views'),
+            func.sum(case((BookViewDaily.day >= month_ago, BookViewDaily.views), else_=0)).label('monthly_views'),
+            func.sum(case((BookViewDaily.day >= week_ago, BookViewDaily.views), else_=0)).label('weekly_views'),
+            func.min(BookViewDaily.first_view).label('first_view'),
+            func.max(BookViewDaily.last_view).label('last_view')
+        )
+        .group_by(BookViewDaily.book_id)
+        .subquery()
+    )
+
+    total_views = func.coalesce(views.c.total_views, 0).label('total_views')
+    return (
+        db.session.query(
+            Book.id,
+            Book.title,
+            Book.author,
+            total_views,
+            func.coalesce(views.c.monthly_views, 0).label('monthly_views'),
+            func.coalesce(views.c.weekly_views, 0).label('weekly_views'),
+            views.c.first_view,
+            views.c.last_view
+        )
+        .outerjoin(views, views.c.book_id == Book.id)
+        .order_by(total_views.desc(), Book.id)
+    )
+
+
+def popular_books_query(limit=5, days=90, now=None):
+    # Пары (book_id, views) по суточной сводке, самые просматриваемые первыми
+    since = (now or datetime.datetime.utcnow()).date() - timedelta(days=days)
+    views = func.sum(BookViewDaily.views).label('views')
+    return (
+        db.session.query(BookViewDaily.book_id, views)
+        .filter(BookViewDaily.day >= since)
+        .group_by(BookViewDaily.book_id)
+        .order_by(views.desc(), BookViewDaily.book_id)
+        .limit(limit)
+    )
+
+
+def activity_log_filters(date_from=None, date_to=None, book_id=None, user_id=None):
+    # Условия фильтрации журнала просмотров; date_to включает весь день
+    criteria = []
+    if date_from:
+        criteria.append(BookViewLog.timestamp >= date_from)
+    if date_to:
+        criteria.append(BookViewLog.timestamp < date_to + timedelta(days=1))
+    if book_id:
+        criteria.append(BookViewLog.book_id == book_id)
+    if user_id:
+        criteria.append(BookViewLog.user_id == user_id)
+    return criteria
+
+
+def approximate_view_log_size():
+    # Оценка по диапазону первичного ключа: два поиска по индексу вместо COUNT(*)
+    # (отдельные подзапросы: SQLite оптимизирует только одиночные MIN/MAX)
+    low, high = db.session.query(
+        select(func.min(BookViewLog.id)).scalar_subquery(),
+        select(func.max(BookViewLog.id)).scalar_subquery()
+    ).one()
+    return high - low + 1 if high is not None else 0
+
+
+# --- Обслуживание суточной сводки ---
+# Сутки раньше границы архива (view_archive) есть только в сводке и в
+# архивных файлах, поэтому пересчёт и сверка по журналу их не трогают.
+
+def archive_horizon():
+    return db.session.query(func.max(ViewArchiveSegment.cutoff)).filter(ViewArchiveSegment.status == 'done').scalar()
+
+
+def _live_since(since):
+    horizon = archive_horizon()
+    if horizon and (since is None or since < horizon):
+        return horizon
+    return since
+
+
+def raw_daily_views(since=None, until=None):
+    day = func.date(BookViewLog.timestamp)
+    query = db.session.query(
+        BookViewLog.book_id,
+        day.label('day'),
+        func.count(BookViewLog.id),
+        func.min(BookViewLog.timestamp),
+        func.max(BookViewLog.timestamp)
+    )
+    if since:
+        query = query.filter(BookViewLog.timestamp >= since)
+    if until:
+        query = query.filter(BookViewLog.timestamp < until)
+    return query.group_by(BookViewLog.book_id, day)
+
+
+def rebuild_daily_views(since=None):
+    # Пересчитывает сводку по сырому журналу (целиком или начиная с даты since)
+    since = _live_since(since)
+    delete = BookViewDaily.query
+    if since:
+        delete = delete.filter(BookViewDaily.day >= since.date())
+    delete.delete(synchronize_session=False)
+
+    stmt = insert(BookViewDaily).from_select(
+        ['book_id', 'day', 'views', 'first_view', 'last_view'],
+        raw_daily_views(since).statement
+    )
+    result = db.session.execute(stmt)
+    db.session.commit()
+    return result.rowcount
+
+
+def check_daily_views(since=None):
+    # Возвращает список расхождений (book_id, day, в журнале, в сводке)
+    since = _live_since(since)
+    expected = {
+        (book_id, str(day)): views
+        for book_id, day, views, _, _ in raw_daily_views(since)
+    }
+
+    actual_query = db.session.query(BookViewDaily.book_id, BookViewDaily.day, BookViewDaily.views)
+    if since:
+        actual_query = actual_query.filter(BookViewDaily.day >= since.date())
+    actual = {(book_id, str(day)): views for book_id, day, views in actual_query}
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        if expected.get(key, 0) != actual.get(key, 0):
+            mismatches.append((key[0], key[1], expected.get(key, 0), actual.get(key, 0)))
+    return mismatches
+
+
+# --- Агрегаты рецензий ---
+
+def recompute_rating_aggregates():
+    # Восстанавливает Book.review_count и Book.rating_sum по таблице Review
+    count = select(func.count(Review.id)).where(Review.book_id == Book.id).scalar_subquery()
+    rating_sum = select(func.coalesce(func.sum(Review.rating), 0)).where(Review.book_id == Book.id).scalar_subquery()
+    result = db.session.execute(
+        db.update(Book).values(review_count=count, rating_sum=rating_sum)
+    )
+    db.session.commit()
+    return result.rowcount
@@ -0,0 +1,109 @@
+import pytest
+from sqlalchemy import event
+from werkzeug.security import generate_password_hash
+from app import create_app
+from models import db, Book, Genre, Role, User
+from fragments import bump_catalog_version
+from cache import cache
+import facets
+import threading
+
+
+# --- Общие фикстуры ---
+# Каждый тест получает приложение с отдельной SQLite-базой во временной
+# папке; буфер просмотров пишет синхронно, чтобы число запросов не
+# зависело от фонового потока.
+
+@pytest.fixture
+def app(tmp_path):
+    app = create_app({
+        'TESTING': True,
+        'DATABASE_URL': f'sqlite:///{tmp_path / "library.db"}',
+        'WTF_CSRF_ENABLED': False,
+        'VIEW_BUFFER_ENABLED': False,
+        'UPLOAD_FOLDER': str(tmp_path / 'covers'),
+        'IMPORT_FOLDER': str(tmp_path / 'imports'),
+        'JOBS_FOLDER': str(tmp_path / 'jobs')
+    })
+    with app.app_context():
+        db.create_all()
+    reset_caches()
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def reset_caches():
+    # Кэш приложения и индекс фасетов живут на уровне процесса
+    cache.clear()
+    facets._index = None
+
+
+@pytest.fixture
+def add_books(app):
+    def add(count):
+        with app.app_context():
+            genres = Genre.query.order_by(Genre.id).all()
+            if not genres:
+                genres = [Genre(name=name) for name in ('Фантастика', 'Приключения', 'Научные')]
+                db.session.add_all(genres)
+            start = Book.query.count()
+            db.session.add_all([
+                Book(title=f'Книга {number}', description=f'Описание *{number}*', year=1950 + number % 70,
+                     publisher=f'Издательство {number % 4}', author=f'Автор {number % 5}', pages=100 + number,
+                     genres=[genres[number % len(genres)], genres[(number + 1) % len(genres)]])
+                for number in range(start, start + count)
+            ])
+            db.session.commit()
+            bump_catalog_version()
+    return add
+
+
+@pytest.fixture
+def add_user(app):
+    # Пользователь с ролью role (создаётся при первом обращении); возвращает id
+    def add(username, role='Пользователь', password='password'):
+        with app.app_context():
+            user_role = Role.query.filter_by(name=role).first() or Role(name=role, description=role)
+            user = User(username=username, password_hash=generate_password_hash(password),
+                        last_name='Тестов', first_name=username, role=user_role)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return add
+
+
+def login(client, username, password='password', remember=False):
+    response = client.post('/login', data={'username': username, 'password': password,
+                                           'remember': 'y' if remember else ''})
+    assert response.status_code == 302
+    return response
+
+
+@pytest.fixture
+def count_queries(app):
+    # (ответ, список SQL-выражений) для одного запроса тестового клиента;
+    # запросы фоновых потоков (диспетчер задач, буфер просмотров) не считаются
+    def count(client, url):
+        statements = []
+        thread = threading.get_ident()
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if threading.get_ident() == thread:
+                statements.append(statement)
+
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            response = client.get(url)
+        finally:
+            event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+        return response, statements
+    return count
@@ -0,0 +1,151 @@
+import pytest
+from flask import Flask
+from cache import Cache, LocalCache, RedisCache
+import cache as cache_module
+import fnmatch
+import threading
+import time
+import types
+
+
+# --- Кэш приложения ---
+# Оба бэкенда проверяются локально: LocalCache - с подменённым временем,
+# RedisCache - на заглушке клиента с теми командами Redis, которые он использует.
+
+class StubRedis:
+    def __init__(self):
+        self.data = {}  # ключ -> (значение, срок или None)
+        self.lock = threading.Lock()
+
+    def _alive(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] < time.monotonic():
+            del self.data[key]
+            item = None
+        return item
+
+    def get(self, key):
+        with self.lock:
+            item = self._alive(key)
+            return None if item is None else item[0]
+
+    def set(self, key, value, ex=None, nx=False):
+        with self.lock:
+            if nx and self._alive(key) is not None:
+                return None
+            if isinstance(value, str):
+                value = value.encode()
+            self.data[key] = (value, time.monotonic() + ex if ex else None)
+            return True
+
+    def delete(self, *keys):
+        with self.lock:
+            return sum(self.data.pop(key, None) is not None for key in keys)
+
+    def scan_iter(self, pattern):
+        with self.lock:
+            return [key for key in list(self.data) if fnmatch.fnmatchcase(key, pattern)]
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_module, 'time', types.SimpleNamespace(monotonic=lambda: now[0], sleep=time.sleep))
+    return now
+
+
+def make_cache(backend):
+    app = Flask(__name__)
+    app.config['CACHE_BACKEND'] = backend
+    app.config['CACHE_MAX_SIZE'] = 3
+    result = Cache()
+    result.init_app(app, client=StubRedis() if backend == 'redis' else None)
+    return result
+
+
+def test_local_cache_evicts_least_recently_used():
+    local = LocalCache(max_size=2)
+    local.set('a', 1)
+    local.set('b', 2)
+    assert local.get('a') == 1  # 'b' становится самым старым
+    local.set('c', 3)
+
+    assert local.get('b') is cache_module._MISSING
+    assert local.get('a') == 1 and local.get('c') == 3
+    assert local.evictions == 1
+
+
+def test_local_cache_expires_after_ttl(clock):
+    local = LocalCache()
+    local.set('key', 'value', ttl=10)
+    clock[0] += 9
+    assert local.get('key') == 'value'
+    clock[0] += 2
+    assert local.get('key') is cache_module._MISSING
+
+
+def test_stats_count_hits_misses_and_evictions():
+    cache = make_cache('local')
+    for key in 'abcd':
+        cache.set(key, key)
+    assert cache.get('a') is None
+    assert cache.get('d') == 'd'
+    assert cache.stats() == {'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+@pytest.mark.parametrize('backend', ['local', 'redis'])
+def test_concurrent_misses_run_one_loader(backend):
+    cache = make_cache(backend)
+    calls = []
+    results = []
+    start = threading.Barrier(8)
+
+    def load():
+        calls.append(1)
+        time.sleep(0.1)
+        return {'books': [1, 2, 3]}
+
+    def worker():
+        start.wait()
+        results.append(cache.get_or_set('popular', load, ttl=60))
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert results == [{'books': [1, 2, 3]}] * 8
+
+
+def test_local_cache_drops_idle_key_locks():
+    cache = make_cache('local')
+    for number in range(10):
+        cache.get_or_set(f'key:{number}', lambda: number)
+    assert cache.backend._key_locks == {}
+
+
+def test_redis_cache_round_trip_and_ttl():
+    client = StubRedis()
+    redis_cache = RedisCache(client, prefix='test:')
+    redis_cache.set('key', {'value': [1, 2]}, ttl=30)
+
+    assert redis_cache.get('key') == {'value': [1, 2]}
+    assert client.data['test:key'][1] is not None
+    redis_cache.delete('key')
+    assert redis_cache.get('key') is cache_module._MISSING
+
+
+def test_redis_cache_releases_lock_and_clears_own_keys():
+    client = StubRedis()
+    client.set('other:key', b'1')
+    redis_cache = RedisCache(client, prefix='test:')
+    with redis_cache.lock('key'):
+        assert client.get('test:lock:key') is not None
+    assert client.get('test:lock:key') is None
+
+    redis_cache.set('a', 1)
+    redis_cache.set('b', 2)
+    redis_cache.clear()
+    assert list(client.data) == ['other:key']
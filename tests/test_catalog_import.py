@@ -0,0 +1,117 @@
+import pytest
+from conftest import login
+from models import db, Book, CatalogImport, Job
+from catalog_import import import_catalog, error_report_path
+import catalog_import
+import jobs
+import csv
+import io
+import json
+import os
+
+
+# --- Импорт каталога ---
+# Загрузка со страницы импорта становится фоновой задачей; отчёт об ошибках
+# не повторяет строки пачки, которую продолженный импорт читает заново.
+
+HEADER = 'title,author,year,publisher,pages,description,genres\n'
+
+
+def catalog_csv(rows):
+    lines = [HEADER]
+    for number in range(rows):
+        year = 'не год' if number == 2 else 1990 + number
+        lines.append(f'Импорт {number},Автор,{year},Издательство,100,Описание *{number}*,Фантастика\n')
+    return ''.join(lines)
+
+
+def report_rows(folder, job):
+    with open(error_report_path(folder, job), encoding='utf-8-sig', newline='') as f:
+        return list(csv.reader(f, delimiter=';'))[1:]
+
+
+def test_resumed_import_reports_each_error_once(app, add_books, tmp_path, monkeypatch):
+    add_books(1)  # жанры
+    path = tmp_path / 'catalog.csv'
+    path.write_text(catalog_csv(6), encoding='utf-8')
+    report_folder = str(tmp_path / 'imports')
+
+    # Вторая пачка (строки 3-4 данных, одна с ошибкой) падает до фиксации
+    store_covers = catalog_import._store_covers
+    calls = []
+
+    def failing_store_covers(*args):
+        calls.append(1)
+        if len(calls) == 2:
+            raise RuntimeError('сбой записи')
+        return store_covers(*args)
+
+    with app.app_context():
+        monkeypatch.setattr(catalog_import, '_store_covers', failing_store_covers)
+        with pytest.raises(RuntimeError):
+            import_catalog(str(path), report_folder, chunk_size=2)
+        job = CatalogImport.query.one()
+        assert job.status == 'failed' and job.rows_done == 2
+        assert report_rows(report_folder, job) == []
+
+        monkeypatch.setattr(catalog_import, '_store_covers', store_covers)
+        job = import_catalog(str(path), report_folder, chunk_size=2)
+        assert job.status == 'done'
+        assert (job.imported, job.failed) == (5, 1)
+        assert [row[0] for row in report_rows(report_folder, job)] == ['4']
+
+
+@pytest.fixture
+def import_client(app, client, add_books, add_user):
+    # Диспетчер не забирает задачи: тест выполняет их сам
+    app.config['JOBS_MAX_RUNNING'] = 0
+    add_books(1)
+    add_user('admin', role='Администратор')
+    login(client, 'admin')
+    return client
+
+
+def upload(client, rows=3):
+    return client.post('/import', data={
+        'catalog': (io.BytesIO(catalog_csv(rows).encode('utf-8')), 'books.csv')
+    }, content_type='multipart/form-data')
+
+
+def test_upload_runs_as_background_job(app, import_client, monkeypatch):
+    response = upload(import_client)
+    assert response.status_code == 302
+
+    with app.app_context():
+        job = Job.query.one()
+        assert (job.kind, job.status) == ('import_catalog', 'queued')
+        params = json.loads(job.params)
+        assert os.path.isfile(params['path'])
+        assert Book.query.count() == 1  # в запросе ничего не импортировано
+
+        job_id = job.id
+        job.status = 'running'
+        db.session.commit()
+    monkeypatch.setattr(jobs, '_worker_app', app)
+    jobs.execute_job(job_id)
+
+    with app.app_context():
+        job = db.session.get(Job, job_id)
+        assert job.status == 'done', job.error
+        assert job.progress == 3 and job.percent() == 100
+        imported = Book.query.filter(Book.title.like('Импорт%')).all()
+        assert len(imported) == 2
+        assert all(book.description_html for book in imported)
+    assert 'Задачи импорта' in import_client.get('/import').get_data(as_text=True)
+
+
+def test_cancelled_upload_is_removed(app, import_client):
+    upload(import_client)
+    with app.app_context():
+        job = Job.query.one()
+        workdir = json.loads(job.params)['workdir']
+    assert os.path.isdir(workdir)
+
+    import_client.post(f'/jobs/{job.id}/cancel')
+    with app.app_context():
+        assert db.session.get(Job, job.id).status == 'cancelled'
+    assert not os.path.exists(workdir)
@@ -0,0 +1,50 @@
+from conftest import login, reset_caches
+from models import db, Book, BookViewLog
+
+
+# --- Условные ответы ---
+# Гость с актуальным ETag получает 304 без тела; изменение книги или
+# каталога меняет ETag, а вошедшим пользователям ETag не отдаётся.
+
+def test_index_not_modified_until_catalog_changes(client, add_books):
+    add_books(3)
+    first = client.get('/')
+    assert first.status_code == 200 and first.headers['ETag']
+
+    repeat = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert repeat.status_code == 304
+    assert repeat.get_data() == b''
+
+    add_books(1)
+    reset_caches()
+    changed = client.get('/', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != first.headers['ETag']
+
+
+def test_book_page_not_modified_still_counts_view(app, client, add_books):
+    add_books(1)
+    first = client.get('/book/1')
+    assert first.headers['ETag'] and first.headers['Last-Modified']
+
+    repeat = client.get('/book/1', headers={'If-None-Match': first.headers['ETag']})
+    assert repeat.status_code == 304
+    with app.app_context():
+        assert BookViewLog.query.filter_by(book_id=1).count() == 2
+
+        book = db.session.get(Book, 1)
+        book.title = 'Новое название'
+        db.session.commit()
+    changed = client.get('/book/1', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+    assert 'Новое название' in changed.get_data(as_text=True)
+
+
+def test_no_validators_for_signed_in_users(client, add_books, add_user):
+    add_books(1)
+    add_user('reader')
+    login(client, 'reader')
+    for url in ('/', '/book/1'):
+        response = client.get(url)
+        assert response.status_code == 200
+        assert 'ETag' not in response.headers
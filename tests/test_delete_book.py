@@ -0,0 +1,59 @@
+import pytest
+from conftest import login
+from models import db, Book, BookViewLog, Cover
+import os
+
+
+# --- Удаление книги ---
+# Всё, что удаляется вместе с книгой, удаляется только при успешной
+# фиксации: ошибка оставляет книгу целиком, с обложкой и историей.
+
+@pytest.fixture
+def admin_client(app, client, add_books, add_user):
+    add_books(1)
+    add_user('admin', role='Администратор')
+    for _ in range(3):
+        app.test_client().get('/book/1')
+    login(client, 'admin')
+    folder = app.config['UPLOAD_FOLDER']
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, 'cover.jpg'), 'wb') as f:
+        f.write(b'jpeg')
+    with app.app_context():
+        db.session.add(Cover(filename='cover.jpg', mimetype='image/jpeg', md5_hash='0' * 32, book_id=1))
+        db.session.commit()
+    return client
+
+
+@pytest.fixture
+def fail_book_delete(monkeypatch):
+    # Падает фиксация, удаляющая книгу; остальные фиксации проходят
+    commit = db.session.commit
+
+    def failing_commit():
+        if any(isinstance(instance, Book) for instance in db.session.deleted):
+            raise RuntimeError('база недоступна')
+        commit()
+
+    monkeypatch.setattr(db.session, 'commit', failing_commit)
+    return monkeypatch
+
+
+def test_failed_delete_keeps_cover_files(app, admin_client, fail_book_delete):
+    admin_client.post('/delete/1')
+    fail_book_delete.undo()
+
+    with app.app_context():
+        assert db.session.get(Book, 1) is not None
+        assert BookViewLog.query.filter_by(book_id=1).count() == 3
+    assert os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'cover.jpg'))
+
+
+def test_delete_removes_cover_files(app, admin_client):
+    admin_client.post('/delete/1')
+
+    with app.app_context():
+        assert db.session.get(Book, 1) is None
+        assert Cover.query.count() == 0
+        assert BookViewLog.query.count() == 0
+    assert not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], 'cover.jpg'))
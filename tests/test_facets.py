@@ -0,0 +1,66 @@
+from werkzeug.datastructures import MultiDict
+from facets import browse_catalog, parse_filters, facet_args
+import facets
+
+
+# --- Фасетный просмотр каталога ---
+# Фильтр отбирает книги в порядке главной страницы, счётчики фасетов
+# считаются под текущим фильтром, индекс перестраивается с версией каталога.
+# Книги add_books: номер n (id n + 1), год 1950 + n, жанры n % 3 + 1 и (n + 1) % 3 + 1,
+# издательство n % 4.
+
+GENRE_NAMES = {1: 'Фантастика', 2: 'Приключения', 3: 'Научные'}
+
+
+def browse(**filters):
+    book_ids, counts = browse_catalog(filters, GENRE_NAMES)
+    return book_ids.tolist(), counts
+
+
+def test_bad_filter_values_are_skipped():
+    args = MultiDict([('genre', '2'), ('genre', 'x'), ('genre', '1'), ('decade', 'сто'),
+                      ('year_from', '1960'), ('publisher', '  '), ('author', ' Автор 1 ')])
+    assert parse_filters(args) == {'genre': [1, 2], 'year_from': 1960, 'author': 'Автор 1'}
+
+
+def test_facet_args_toggle_values():
+    filters = {'genre': [1, 2], 'decade': 1950}
+    assert facet_args(filters, 'genre', 2) == {'genre': [1], 'decade': 1950}
+    assert facet_args(filters, 'genre', 3) == {'genre': [1, 2, 3], 'decade': 1950}
+    assert facet_args(filters, 'decade', 1950) == {'genre': [1, 2]}
+    assert facet_args({'genre': [1]}, 'genre', 1) == {}
+
+
+def test_filters_and_counts(app, add_books):
+    add_books(12)
+    with app.app_context():
+        assert browse()[0] == list(range(12, 0, -1))
+        assert browse(genre=[1, 2])[0] == [10, 7, 4, 1]
+        assert browse(decade=1960)[0] == [12, 11]
+        assert browse(genre=[1], publisher='Издательство 3', year_to=1955)[0] == [4]
+
+        book_ids, counts = browse(genre=[1])
+        assert book_ids == [12, 10, 9, 7, 6, 4, 3, 1]
+        assert counts['genres'] == [(1, 'Фантастика', 8), (2, 'Приключения', 4), (3, 'Научные', 4)]
+        assert counts['decades'] == [(1960, 1), (1950, 7)]
+        assert counts['publishers'] == [(f'Издательство {code}', 2) for code in range(4)]
+
+
+def test_index_follows_catalog_version(app, add_books):
+    add_books(3)
+    with app.app_context():
+        index = facets.facet_index()
+        assert browse()[0] == [3, 2, 1]
+    add_books(1)
+    with app.app_context():
+        assert browse()[0] == [4, 3, 2, 1]
+        assert facets.facet_index() is not index
+
+
+def test_index_page_applies_filters(client, add_books):
+    add_books(12)
+    page = client.get('/?genre=1&genre=2').get_data(as_text=True)
+    for number in (0, 3):
+        assert f'Книга {number}<' in page
+    for number in (1, 2, 11):
+        assert f'Книга {number}<' not in page
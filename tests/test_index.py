@@ -0,0 +1,63 @@
+from conftest import reset_caches, login
+from models import db, Book
+
+
+# --- Число SQL-запросов главной страницы ---
+# Карточки книг не должны догружать связи по одной: главная с одной книгой
+# и с полной страницей книг выполняет одинаковое число запросов.
+
+def test_index_query_count_does_not_grow_with_books(client, add_books, count_queries):
+    add_books(1)
+    reset_caches()
+    response, one_book = count_queries(client, '/')
+    assert response.status_code == 200
+
+    add_books(11)
+    reset_caches()
+    response, many_books = count_queries(client, '/')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('Книга ') >= 6
+
+    assert len(many_books) == len(one_book), '\n'.join(many_books)
+
+
+def test_index_second_page_query_count(client, add_books, count_queries):
+    add_books(12)
+    reset_caches()
+    _, first_page = count_queries(client, '/')
+    reset_caches()
+    response, second_page = count_queries(client, '/page/2')
+    assert response.status_code == 200
+    assert len(second_page) == len(first_page)
+
+
+# --- Число SQL-запросов статистики ---
+# Статистика просмотров - один сгруппированный запрос на страницу, сколько
+# бы книг ни было просмотрено.
+
+def _view_every_book(app):
+    guest = app.test_client()
+    with app.app_context():
+        book_ids = db.session.scalars(db.select(Book.id)).all()
+    for book_id in book_ids:
+        guest.get(f'/book/{book_id}')
+
+
+def test_statistics_query_count_does_not_grow_with_books(app, client, add_books, add_user, count_queries):
+    add_user('admin', role='Администратор')
+    login(client, 'admin')
+
+    add_books(1)
+    _view_every_book(app)
+    reset_caches()
+    response, one_book = count_queries(client, '/statistics')
+    assert response.status_code == 200
+
+    add_books(14)
+    _view_every_book(app)
+    reset_caches()
+    response, many_books = count_queries(client, '/statistics')
+    assert response.status_code == 200
+    assert response.get_data(as_text=True).count('Книга ') >= 10
+
+    assert len(many_books) == len(one_book), '\n'.join(many_books)
@@ -0,0 +1,37 @@
+from models import db, Book
+from markdown_render import render_markdown, rerender_stale, RENDERER_VERSION
+
+
+# --- Markdown описаний и рецензий ---
+# Разметка Markdown сохраняется, всё опасное из исходного HTML убирается;
+# устаревший HTML перерисовывается пачками.
+
+def test_markdown_formatting_is_kept():
+    html = render_markdown('**Жирный** и *курсив*\n\n- пункт\n\n[ссылка](https://example.com "Пример")')
+    assert '<strong>Жирный</strong>' in html and '<em>курсив</em>' in html
+    assert '<li>пункт</li>' in html
+    assert '<a href="https://example.com" title="Пример">ссылка</a>' in html
+
+
+def test_unsafe_html_is_removed():
+    html = render_markdown(
+        '<script>alert(1)</script>\n\n'
+        '<img src="x" onerror="alert(2)">\n\n'
+        '<p onclick="alert(3)" style="color: red">текст</p>\n\n'
+        '[ссылка](javascript:alert(4))'
+    )
+    for fragment in ('<script', '<img', 'onerror', 'onclick', 'style=', 'javascript:'):
+        assert fragment not in html
+    assert 'текст' in html
+
+
+def test_stale_html_is_rerendered(app, add_books):
+    add_books(3)
+    with app.app_context():
+        db.session.execute(db.update(Book).values(description_html=None, html_version=0))
+        db.session.commit()
+        assert rerender_stale(Book, batch_size=2, workers=1) == 3
+        books = Book.query.order_by(Book.id).all()
+        assert [book.html_version for book in books] == [RENDERER_VERSION] * 3
+        assert books[0].description_html == '<p>Описание <em>0</em></p>'
+        assert rerender_stale(Book) == 0
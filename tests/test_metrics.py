@@ -0,0 +1,34 @@
+from conftest import login
+
+
+# --- /metrics ---
+# Метрики доступны администраторам, по токену и с разрешённых адресов,
+# имена счётчиков заканчиваются на _total.
+
+def test_metrics_hidden_from_guests_and_users(client, add_user):
+    assert client.get('/metrics').status_code == 403
+    add_user('reader')
+    login(client, 'reader')
+    assert client.get('/metrics').status_code == 403
+
+
+def test_metrics_for_admin(client, add_user):
+    add_user('admin', role='Администратор')
+    login(client, 'admin')
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    text = response.get_data(as_text=True)
+    assert '# TYPE view_buffer_flushes_total counter' in text
+    assert 'flush_count' not in text
+
+
+def test_metrics_by_token(app, client):
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert client.get('/metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 403
+    assert client.get('/metrics', headers={'Authorization': 'Bearer secret'}).status_code == 200
+
+
+def test_metrics_by_allowed_address(app, client):
+    app.config['METRICS_ALLOWED_IPS'] = ['10.0.0.5']
+    assert client.get('/metrics').status_code == 403
+    assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 200
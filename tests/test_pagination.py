@@ -0,0 +1,51 @@
+import pytest
+from models import db, BookViewLog
+from pagination import keyset_paginate
+import datetime
+
+
+# --- Курсорная пагинация журнала ---
+# Переход вперёд и назад по курсорам проходит все записи ровно по одному
+# разу, в том числе когда у нескольких записей одинаковое время.
+
+PER_PAGE = 10
+
+
+@pytest.fixture
+def log_ids(app, add_books):
+    add_books(1)
+    start = datetime.datetime(2025, 1, 1)
+    with app.app_context():
+        # По три просмотра на одну секунду: порядок внутри секунды - по id
+        db.session.add_all([BookViewLog(book_id=1, session_id='s', timestamp=start + datetime.timedelta(seconds=n // 3))
+                            for n in range(25)])
+        db.session.commit()
+        return [row.id for row in BookViewLog.query.order_by(BookViewLog.timestamp.desc(), BookViewLog.id.desc())]
+
+
+def page(after=None, before=None):
+    return keyset_paginate(BookViewLog.query, BookViewLog.timestamp, BookViewLog.id, PER_PAGE,
+                           after=after, before=before)
+
+
+def test_forward_pages_cover_every_row_once(app, log_ids):
+    with app.app_context():
+        pages = [page()]
+        while pages[-1].has_next:
+            pages.append(page(after=pages[-1].next_cursor))
+        assert [len(p.items) for p in pages] == [10, 10, 5]
+        assert [row.id for p in pages for row in p] == log_ids
+        assert not pages[0].has_prev and pages[-1].has_prev
+
+
+def test_backward_page_matches_forward_page(app, log_ids):
+    with app.app_context():
+        second = page(after=page().next_cursor)
+        last = page(after=second.next_cursor)
+        assert [row.id for row in page(before=last.prev_cursor)] == [row.id for row in second]
+        assert [row.id for row in page(before=second.prev_cursor)] == log_ids[:PER_PAGE]
+
+
+def test_invalid_cursor_means_first_page(app, log_ids):
+    with app.app_context():
+        assert [row.id for row in page(after='не-курсор')] == log_ids[:PER_PAGE]
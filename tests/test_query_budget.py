@@ -0,0 +1,68 @@
+import pytest
+from werkzeug.security import generate_password_hash
+from instrumentation import QueryBudgetExceeded, query_budget
+from models import db, Book, Review, Role, User
+
+
+# --- Бюджет SQL-запросов маршрутов ---
+# С SQL_QUERY_BUDGET_RAISE превышение бюджета - исключение, а не запись
+# в лог: маршрут сверх бюджета падает, обычные страницы в него укладываются.
+
+@pytest.fixture
+def strict_app(app, add_books):
+    app.config['SQL_QUERY_BUDGET_RAISE'] = True
+    add_books(20)
+    with app.app_context():
+        admin = User(username='admin', password_hash=generate_password_hash('adminpass'),
+                     last_name='Админов', first_name='Админ',
+                     role=Role(name='Администратор', description='Полный доступ'))
+        db.session.add(admin)
+        db.session.flush()
+        db.session.add_all([Review(book_id=book_id, user_id=admin.id, rating=4, text='Рецензия')
+                            for book_id, in db.session.query(Book.id).limit(5)])
+        db.session.commit()
+    return app
+
+
+def _login(client):
+    response = client.post('/login', data={'username': 'admin', 'password': 'adminpass'})
+    assert response.status_code == 302
+
+
+def test_over_budget_route_raises(strict_app):
+    @query_budget(2)
+    def three_queries():
+        for _ in range(3):
+            db.session.execute(db.select(Book.id).limit(1)).all()
+        return 'ok'
+
+    strict_app.add_url_rule('/three-queries', view_func=three_queries)
+    with pytest.raises(QueryBudgetExceeded):
+        strict_app.test_client().get('/three-queries')
+
+
+def test_budget_can_be_raised_per_route(strict_app):
+    @query_budget(3)
+    def three_queries():
+        for _ in range(3):
+            db.session.execute(db.select(Book.id).limit(1)).all()
+        return 'ok'
+
+    strict_app.add_url_rule('/three-queries', view_func=three_queries)
+    assert strict_app.test_client().get('/three-queries').status_code == 200
+
+
+GUEST_PAGES = ['/', '/page/2', '/book/1', '/search?q=Книга', '/genre/1', '/login']
+ADMIN_PAGES = ['/', '/book/1', '/add', '/edit/1', '/statistics', '/activity_log', '/import']
+
+
+@pytest.mark.parametrize('url', GUEST_PAGES)
+def test_guest_pages_within_budget(strict_app, url):
+    assert strict_app.test_client().get(url).status_code == 200
+
+
+@pytest.mark.parametrize('url', ADMIN_PAGES)
+def test_admin_pages_within_budget(strict_app, url):
+    client = strict_app.test_client()
+    _login(client)
+    assert client.get(url).status_code == 200
@@ -0,0 +1,61 @@
+import datetime
+import pytest
+from sqlalchemy import insert
+from models import db, Book, BookViewLog, Cover, Review, Role, User
+from query_plans import check_query_plans, hot_queries
+from recommendations import rebuild_recommendations
+from stats import rebuild_daily_views
+from trending import rebuild_trending
+
+
+# --- Планы горячих запросов ---
+# Те же проверки, что и "flask check-plans", на базе с данными во всех
+# таблицах горячих запросов: полный просмотр таблицы - ошибка.
+
+def _seed_activity(app, add_books):
+    add_books(30)
+    now = datetime.datetime.utcnow()
+    with app.app_context():
+        role = Role(name='Пользователь', description='Может оставлять рецензии')
+        users = [User(username=f'user{i}', password_hash='-', last_name='Юзеров', first_name=f'Юзер {i}', role=role)
+                 for i in range(5)]
+        db.session.add_all(users)
+        db.session.flush()
+        book_ids = [book_id for book_id, in db.session.query(Book.id)]
+        db.session.add_all([Review(book_id=book_ids[i % len(book_ids)], user_id=users[i % len(users)].id,
+                                   rating=i % 6, text='Текст') for i in range(40)])
+        db.session.add_all([Cover(filename=f'{i:032x}.jpg', mimetype='image/jpeg', md5_hash=f'{i:032x}', book_id=book_id)
+                            for i, book_id in enumerate(book_ids)])
+        db.session.execute(insert(BookViewLog), [{
+            'book_id': book_ids[i % len(book_ids)],
+            'user_id': users[i % len(users)].id if i % 3 == 0 else None,
+            'session_id': f's{i % 7}',
+            'ip_address': f'10.0.0.{i % 11}',
+            'timestamp': now - datetime.timedelta(hours=i)
+        } for i in range(500)])
+        db.session.commit()
+        rebuild_daily_views()
+        rebuild_trending(now)
+        rebuild_recommendations(now)
+
+
+@pytest.fixture
+def plans(app, add_books):
+    _seed_activity(app, add_books)
+    with app.app_context():
+        yield check_query_plans()
+
+
+def test_all_hot_queries_checked(plans, app):
+    with app.app_context():
+        assert set(plans) == set(hot_queries())
+
+
+@pytest.mark.parametrize('name', [
+    'daily_limit_user', 'daily_limit_session', 'daily_limit_ip', 'popular_books', 'cover_by_md5',
+    'book_reviews', 'book_recommendations', 'trending_overall', 'trending_genre',
+    'book_views_range', 'activity_log_page'
+])
+def test_hot_query_uses_indexes(plans, name):
+    plan, scans = plans[name]
+    assert not scans, f'{name}: полный просмотр таблицы\n' + '\n'.join(plan)
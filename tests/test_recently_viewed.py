@@ -0,0 +1,52 @@
+from conftest import login
+from models import db, BookViewLog, RecentlyViewed
+from recently_viewed import user_visitor
+
+
+# --- Недавно просмотренные и посетитель журнала просмотров ---
+# Кука сессии меняется вместе со списком недавно просмотренных, поэтому
+# журнал и дневной лимит опираются на отдельный идентификатор в сессии.
+
+def test_guest_keeps_one_visitor_id_while_list_changes(app, client, add_books):
+    add_books(2)
+    for _ in range(8):
+        for book_id in (1, 2):
+            assert client.get(f'/book/{book_id}').status_code == 200
+
+    with app.app_context():
+        assert BookViewLog.query.filter_by(book_id=1).count() == app.config['VIEW_DAILY_LIMIT'] - 2
+        assert db.session.query(BookViewLog.session_id).distinct().count() == 1
+
+        for _ in range(4):
+            client.get('/book/1')
+        assert BookViewLog.query.filter_by(book_id=1).count() == app.config['VIEW_DAILY_LIMIT']
+
+
+def test_logout_starts_a_new_visitor(app, client, add_books, add_user):
+    add_books(1)
+    add_user('reader')
+    client.get('/book/1')
+    login(client, 'reader')
+    client.get('/logout')
+    client.get('/book/1')
+
+    with app.app_context():
+        visitors = db.session.query(BookViewLog.session_id).filter(BookViewLog.user_id.is_(None)).distinct()
+        assert visitors.count() == 2
+
+
+def test_remember_me_session_keeps_stored_list(app, client, add_books, add_user):
+    add_books(4)
+    user_id = add_user('reader')
+    login(client, 'reader', remember=True)
+    for book_id in (1, 2, 3):
+        client.get(f'/book/{book_id}')
+
+    # Новая сессия по куке "запомнить меня", без входа через форму
+    client.delete_cookie('session')
+    assert client.get_cookie('remember_token') is not None
+    client.get('/book/4')
+
+    with app.app_context():
+        row = db.session.get(RecentlyViewed, user_visitor(user_id))
+        assert row.book_ids == '4,3,2,1'
@@ -0,0 +1,58 @@
+from models import db, BookViewLog, BookCoView
+from recommendations import coview_pairs, update_recommendations, rebuild_recommendations, recommended_books_query
+import datetime
+import numpy as np
+
+
+# --- "Читатели также смотрели" ---
+# Корзина - книги одного посетителя за сутки; чаще всего вместе смотрят
+# первого соседа. Ежедневное обновление даёт то же, что пересчёт с нуля.
+
+DAY = datetime.datetime(2025, 3, 10)
+
+
+def add_views(day, baskets):
+    # baskets - {посетитель: [книги в порядке просмотра]}
+    db.session.add_all([
+        BookViewLog(book_id=book_id, session_id=visitor, timestamp=day + datetime.timedelta(minutes=minute))
+        for visitor, book_ids in baskets.items() for minute, book_id in enumerate(book_ids)
+    ])
+    db.session.commit()
+
+
+def recommended(book_id):
+    return [book.id for book in recommended_books_query(book_id)]
+
+
+def coviews():
+    return {(row.book_id, row.other_id): row.views for row in BookCoView.query}
+
+
+def test_coview_pairs_count_baskets():
+    a, b, counts = coview_pairs(np.array([0, 0, 0, 1, 1]), np.array([1, 2, 3, 1, 2]))
+    pairs = dict(zip(zip(a.tolist(), b.tolist()), counts.tolist()))
+    assert pairs[(1, 2)] == pairs[(2, 1)] == 2
+    assert pairs[(1, 3)] == pairs[(3, 2)] == 1
+    assert pairs[(1, 1)] == 2 and pairs[(3, 3)] == 1
+    assert (2, 2) in pairs and (3, 1) in pairs and len(pairs) == 9
+
+
+def test_daily_update_matches_rebuild(app, add_books):
+    add_books(5)
+    with app.app_context():
+        add_views(DAY, {'a': [1, 2, 3], 'b': [1, 2], 'c': [1, 4], 'd': [5]})
+        assert update_recommendations(now=DAY + datetime.timedelta(days=1)) == 5
+        assert recommended(1)[0] == 2
+        assert set(recommended(1)) == {2, 3, 4}
+        assert recommended(5) == []
+
+        # Те же сутки повторно не учитываются, следующие добавляются
+        assert update_recommendations(now=DAY + datetime.timedelta(days=1)) == 0
+        add_views(DAY + datetime.timedelta(days=1), {'a': [4, 1], 'e': [4, 1]})
+        update_recommendations(now=DAY + datetime.timedelta(days=2))
+        assert coviews()[(1, 4)] == 3
+        incremental = {book_id: recommended(book_id) for book_id in range(1, 6)}
+        assert incremental[1][0] == 4
+
+        rebuild_recommendations(now=DAY + datetime.timedelta(days=2))
+        assert {book_id: recommended(book_id) for book_id in range(1, 6)} == incremental
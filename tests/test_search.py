@@ -0,0 +1,62 @@
+import pytest
+from models import db, Book, Genre
+from search import search_books, rebuild_search_index
+
+
+# --- Полнотекстовый поиск ---
+# Индекс book_fts следует за таблицей book через триггеры; запрос понимает
+# русские словоформы, ё и регистр, а совпадение в названии важнее описания.
+
+@pytest.fixture
+def catalog(app):
+    with app.app_context():
+        genre = Genre(name='Роман')
+        db.session.add_all([
+            Book(title='Мастер и Маргарита', author='Булгаков', publisher='Азбука', year=1967, pages=480,
+                 description='Роман о дьяволе в Москве', genres=[genre]),
+            Book(title='Собачье сердце', author='Булгаков', publisher='Азбука', year=1925, pages=160,
+                 description='Повесть, в которой появляется и Маргарита', genres=[genre]),
+            Book(title='Ёлка', author='Зощенко', publisher='Эксмо', year=1939, pages=20,
+                 description='Рассказ для детей', genres=[genre])
+        ])
+        db.session.commit()
+    return app
+
+
+def titles(**criteria):
+    return [book.title for book in search_books(**criteria)]
+
+
+def test_word_forms_case_and_yo(catalog):
+    with catalog.app_context():
+        assert titles(text='МАРГАРИТЫ') == ['Мастер и Маргарита', 'Собачье сердце']
+        assert titles(text='елки') == ['Ёлка']
+        assert titles(text='булгакова', year_to=1950) == ['Собачье сердце']
+
+
+def test_index_follows_updates_and_deletes(catalog):
+    with catalog.app_context():
+        book = Book.query.filter_by(title='Ёлка').one()
+        book.title = 'Галоша'
+        db.session.commit()
+        assert titles(text='елка') == []
+        assert titles(text='галоши') == ['Галоша']
+
+        db.session.delete(book)
+        db.session.commit()
+        assert titles(text='галоша') == []
+
+
+def test_rebuilt_index_matches_trigger_index(catalog):
+    with catalog.app_context():
+        assert rebuild_search_index() == 3
+        assert titles(text='ёлки') == ['Ёлка']
+        db.session.delete(Book.query.filter_by(title='Ёлка').one())
+        db.session.commit()
+        assert titles(text='елка') == []
+
+
+def test_query_syntax_is_not_interpreted(catalog):
+    with catalog.app_context():
+        assert titles(text='NEAR(" OR * сердце') == []
+        assert titles(text='"сердце"') == ['Собачье сердце']
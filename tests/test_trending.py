@@ -0,0 +1,75 @@
+import pytest
+from models import db, Book, BookViewDaily, TrendingLeaderboard, TrendingState
+from trending import (
+    record_views, refresh_leaderboards, refresh_if_due, rebuild_trending, trending_books_query,
+    HALF_LIFE, REBASE_AFTER, REFRESH_INTERVAL, OVERALL
+)
+import datetime
+
+
+# --- Популярное сейчас ---
+# Просмотр теряет половину веса за HALF_LIFE; рейтинги (общий и по жанрам)
+# пересчитываются не чаще REFRESH_INTERVAL и переживают перенос epoch.
+
+NOW = datetime.datetime(2025, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def scored(app, add_books):
+    # Книга 1: просмотр сейчас (вес 1); книга 2: три просмотра два периода назад (0.75);
+    # книга 3: просмотр полпериода назад (~0.71)
+    add_books(3)
+    with app.app_context():
+        record_views([(1, NOW)] + [(2, NOW - 2 * HALF_LIFE)] * 3 + [(3, NOW - HALF_LIFE / 2)])
+        db.session.commit()
+    return app
+
+
+def leaderboard(genre_id=OVERALL):
+    return [(row.book_id, round(row.score, 3)) for row in
+            TrendingLeaderboard.query.filter_by(genre_id=genre_id).order_by(TrendingLeaderboard.rank)]
+
+
+def test_views_decay_by_half_life(scored):
+    with scored.app_context():
+        refresh_leaderboards(NOW)
+        assert leaderboard() == [(1, 1.0), (2, 0.75), (3, 0.707)]
+
+        refresh_leaderboards(NOW + HALF_LIFE)
+        assert leaderboard() == [(1, 0.5), (2, 0.375), (3, 0.354)]
+
+
+def test_genre_leaderboards_hold_only_their_books(scored):
+    with scored.app_context():
+        refresh_leaderboards(NOW)
+        for book in Book.query:
+            for genre in book.genres:
+                assert book.id in [book_id for book_id, _ in leaderboard(genre.id)]
+        for genre_id in {genre.id for book in Book.query for genre in book.genres}:
+            assert all(genre_id in [genre.id for genre in book.genres]
+                       for book in trending_books_query(genre_id))
+
+
+def test_rebase_keeps_current_scores(scored):
+    with scored.app_context():
+        later = NOW + REBASE_AFTER + HALF_LIFE
+        refresh_leaderboards(later)
+        before = leaderboard()
+        assert db.session.get(TrendingState, 1).epoch == later
+        refresh_leaderboards(later)
+        assert leaderboard() == before
+
+
+def test_refresh_runs_once_per_interval(scored):
+    with scored.app_context():
+        assert refresh_if_due(NOW)
+        assert not refresh_if_due(NOW + REFRESH_INTERVAL / 2)
+        assert refresh_if_due(NOW + REFRESH_INTERVAL * 2)
+
+
+def test_rebuild_from_daily_rollup_keeps_order(scored):
+    with scored.app_context():
+        BookViewDaily.record_views([(1, NOW)] + [(2, NOW - 2 * HALF_LIFE)] * 3 + [(3, NOW - HALF_LIFE / 2)])
+        db.session.commit()
+        rebuild_trending(NOW)
+        assert [book_id for book_id, _ in leaderboard()] == [1, 2, 3]
@@ -0,0 +1,63 @@
+import pytest
+from models import db, BookViewLog, BookViewDaily, BookTrending
+from view_buffer import view_buffer
+
+
+# --- Буфер просмотров ---
+# Просмотры копятся в памяти и пишутся пачкой; дневной лимит считается по
+# счётчикам буфера, а после перезапуска процесса - по журналу.
+
+@pytest.fixture
+def buffer_app(app, add_books):
+    add_books(2)
+    view_buffer._pid = None  # состояние буфера - на процесс, тест начинает с чистого
+    yield app
+    view_buffer.stop()
+    view_buffer._pid = None
+
+
+def views(app, model):
+    with app.app_context():
+        return model.query.count()
+
+
+def test_views_are_written_on_flush(buffer_app):
+    buffer_app.config.update(VIEW_BUFFER_ENABLED=True, VIEW_BUFFER_FLUSH_INTERVAL=60)
+    with buffer_app.test_request_context():
+        for book_id in (1, 1, 2):
+            assert view_buffer.record(book_id, session_id='visitor')
+    assert views(buffer_app, BookViewLog) == 0
+
+    assert view_buffer.flush() == 3
+    assert views(buffer_app, BookViewLog) == 3
+    with buffer_app.app_context():
+        assert {row.book_id: row.views for row in BookViewDaily.query} == {1: 2, 2: 1}
+        assert BookTrending.query.count() == 2
+    assert view_buffer.metrics()['flushes_total'] == 1
+
+
+def test_daily_limit_survives_restart(buffer_app):
+    limit = buffer_app.config['VIEW_DAILY_LIMIT']
+    with buffer_app.test_request_context():
+        accepted = [view_buffer.record(1, session_id='visitor') for _ in range(limit + 2)]
+        assert accepted == [True] * limit + [False, False]
+        assert view_buffer.record(1, session_id='other visitor')
+
+        # Новый процесс: счётчиков в памяти нет, лимит берётся из журнала
+        view_buffer._pid = None
+        assert not view_buffer.record(1, session_id='visitor')
+    assert views(buffer_app, BookViewLog) == limit + 1
+
+
+def test_failed_batch_is_retried(buffer_app, monkeypatch):
+    write = view_buffer._write
+    with buffer_app.test_request_context():
+        monkeypatch.setattr(view_buffer, '_write', lambda events: False)
+        view_buffer.record(1, session_id='visitor')
+        assert view_buffer.metrics()['retry_depth'] == 1
+        assert views(buffer_app, BookViewLog) == 0
+
+        monkeypatch.setattr(view_buffer, '_write', write)
+        assert view_buffer.flush(force=True) == 1
+    assert view_buffer.metrics()['retry_depth'] == 0
+    assert views(buffer_app, BookViewLog) == 1
@@ -0,0 +1,195 @@
+from models import db, Book, BookViewDaily, BookTrending, TrendingLeaderboard, TrendingState, book_genres
+from sqlalchemy import delete, insert, or_, select, update
+import datetime
+import numpy as np
+
+
+# --- Популярное сейчас ---
+# У каждой книги один затухающий счёт: просмотр в момент t добавляет
+# 2^((t - epoch) / HALF_LIFE), поэтому порядок книг не зависит от момента
+# сравнения, а сброс буфера просмотров прибавляет к счёту книги одно число
+# (UPSERT на книгу). Текущее значение - счёт * 2^(-(now - epoch) / HALF_LIFE).
+# Когда множители становятся слишком большими, пересчёт рейтингов переносит
+# epoch к текущему моменту ("перебазирование").
+#
+# Рейтинги (весь каталог и каждый жанр) пересчитываются целиком раз в
+# REFRESH_INTERVAL в одном из процессов и хранятся в TrendingLeaderboard,
+# страница читает рейтинг одним запросом по первичному ключу.
+
+HALF_LIFE = datetime.timedelta(hours=48)
+REBASE_AFTER = 30 * HALF_LIFE   # множители до 2^30
+REFRESH_INTERVAL = datetime.timedelta(minutes=5)
+LEADERBOARD_SIZE = 12
+MIN_SCORE = 0.01                # книги с меньшим текущим счётом не хранятся
+REBUILD_HALF_LIVES = 16         # глубина сводки при пересчёте с нуля
+OVERALL = 0                     # genre_id рейтинга по всему каталогу
+
+
+def _dialect_insert():
+    if db.session.get_bind().dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    return dialect_insert
+
+
+def _decay(since, until):
+    return 2.0 ** (-(until - since).total_seconds() / HALF_LIFE.total_seconds())
+
+
+def _ensure_state(now):
+    # Строку создаёт первый процесс, остальные её не трогают
+    stmt = _dialect_insert()(TrendingState).values(id=1, epoch=now).on_conflict_do_nothing(index_elements=['id'])
+    db.session.execute(stmt)
+
+
+def _epoch(now, lock=False):
+    # lock: PostgreSQL ждёт завершения перебазирования, в SQLite сброс
+    # буфера к этому моменту уже держит блокировку записи
+    _ensure_state(now)
+    query = select(TrendingState.epoch).where(TrendingState.id == 1)
+    if lock:
+        query = query.with_for_update(read=True)
+    return db.session.execute(query).scalar_one()
+
+
+# --- Счёт ---
+
+def record_views(views):
+    # views - пары (book_id, timestamp); вызывается в транзакции сброса буфера
+    views = list(views)
+    if not views:
+        return
+    epoch = _epoch(max(timestamp for _, timestamp in views), lock=True)
+    scores = {}
+    for book_id, timestamp in views:
+        scores[book_id] = scores.get(book_id, 0.0) + 1 / _decay(epoch, timestamp)
+    stmt = _dialect_insert()(BookTrending)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[BookTrending.book_id],
+        set_={'score': BookTrending.score + stmt.excluded.score}
+    )
+    db.session.execute(stmt, [{'book_id': book_id, 'score': score} for book_id, score in scores.items()])
+
+
+def _rebase(now):
+    # Переносит epoch к now: состояние обновляется первым, чтобы
+    # параллельный сброс буфера дождался конца перебазирования
+    epoch = _epoch(now)
+    factor = _decay(epoch, now)
+    db.session.execute(update(TrendingState).where(TrendingState.id == 1).values(epoch=now))
+    db.session.execute(update(BookTrending).values(score=BookTrending.score * factor))
+    db.session.execute(delete(BookTrending).where(BookTrending.score < MIN_SCORE))
+    return now
+
+
+def rebuild_trending(now=None):
+    # Счёт с нуля по суточной сводке: просмотры дня считаются сделанными
+    # в середине между первым и последним из них
+    now = now or datetime.datetime.utcnow()
+    since = (now - REBUILD_HALF_LIVES * HALF_LIFE).date()
+    rows = db.session.connection().execute(
+        select(BookViewDaily.book_id, BookViewDaily.views, BookViewDaily.first_view, BookViewDaily.last_view)
+        .where(BookViewDaily.day >= since)
+    ).all()
+    _ensure_state(now)
+    db.session.execute(update(TrendingState).where(TrendingState.id == 1).values(epoch=now))
+    db.session.execute(delete(BookTrending))
+    if rows:
+        book_ids, views, first_view, last_view = zip(*rows)
+        first_view = np.array(first_view, dtype='datetime64[us]')
+        last_view = np.array(last_view, dtype='datetime64[us]')
+        middle = first_view + (last_view - first_view) / 2
+        age = (np.datetime64(now, 'us') - middle) / np.timedelta64(1, 's')
+        weights = np.array(views, dtype=np.float64) * np.exp2(-age / HALF_LIFE.total_seconds())
+        books, inverse = np.unique(np.array(book_ids, dtype=np.int64), return_inverse=True)
+        scores = np.bincount(inverse, weights=weights)
+        keep = scores >= MIN_SCORE
+        db.session.execute(insert(BookTrending), [
+            {'book_id': book_id, 'score': score}
+            for book_id, score in zip(books[keep].tolist(), scores[keep].tolist())
+        ])
+    db.session.commit()
+    return refresh_leaderboards(now)
+
+
+# --- Рейтинги ---
+
+def refresh_leaderboards(now=None, size=LEADERBOARD_SIZE):
+    # Заменяет все рейтинги за одну транзакцию; возвращает число строк
+    now = now or datetime.datetime.utcnow()
+    epoch = _epoch(now)
+    if now - epoch > REBASE_AFTER:
+        epoch = _rebase(now)
+    threshold = MIN_SCORE / _decay(epoch, now)
+
+    connection = db.session.connection()
+    overall = connection.execute(
+        select(BookTrending.book_id, BookTrending.score).where(BookTrending.score >= threshold)
+    ).all()
+    by_genre = connection.execute(
+        select(book_genres.c.genre_id, book_genres.c.book_id, BookTrending.score)
+        .join(BookTrending, BookTrending.book_id == book_genres.c.book_id)
+        .where(BookTrending.score >= threshold)
+    ).all()
+    rows = np.array([(OVERALL, book_id, score) for book_id, score in overall] + by_genre,
+                    dtype=np.float64).reshape(-1, 3)
+    genres, books, scores = rows[:, 0].astype(np.int64), rows[:, 1].astype(np.int64), rows[:, 2]
+
+    # По жанру, внутри жанра - по убыванию счёта; первые size в каждой группе
+    order = np.lexsort((books, -scores, genres))
+    genres, books, scores = genres[order], books[order], scores[order]
+    starts = np.flatnonzero(np.r_[True, genres[1:] != genres[:-1]]) if len(genres) else np.empty(0, dtype=np.int64)
+    rank = np.arange(len(genres)) - np.repeat(starts, np.diff(np.r_[starts, len(genres)]))
+    keep = rank < size
+    current = scores[keep] * _decay(epoch, now)
+
+    connection.execute(delete(TrendingLeaderboard))
+    if keep.any():
+        connection.execute(insert(TrendingLeaderboard), [
+            {'genre_id': genre_id, 'rank': position, 'book_id': book_id, 'score': score}
+            for genre_id, position, book_id, score in zip(
+                genres[keep].tolist(), rank[keep].tolist(), books[keep].tolist(), current.tolist()
+            )
+        ])
+    db.session.execute(update(TrendingState).where(TrendingState.id == 1).values(refreshed_at=now))
+    db.session.commit()
+    return int(keep.sum())
+
+
+def refresh_if_due(now=None):
+    # Пересчёт не чаще REFRESH_INTERVAL на все процессы: срок проверяется
+    # чтением, право на пересчёт забирает один условный UPDATE
+    now = now or datetime.datetime.utcnow()
+    state = db.session.execute(
+        select(TrendingState.refreshed_at).where(TrendingState.id == 1)
+    ).first()
+    db.session.rollback()  # не держим читающую транзакцию между вызовами
+    if state is not None and state.refreshed_at is not None and state.refreshed_at >= now - REFRESH_INTERVAL:
+        return False
+    if state is None:
+        _ensure_state(now)
+    claimed = db.session.execute(
+        update(TrendingState)
+        .where(TrendingState.id == 1, or_(TrendingState.refreshed_at.is_(None),
+                                          TrendingState.refreshed_at < now - REFRESH_INTERVAL))
+        .values(refreshed_at=now)
+    ).rowcount
+    db.session.commit()
+    if claimed:
+        refresh_leaderboards(now)
+    return bool(claimed)
+
+
+def forget_book(book_id):
+    for model in (BookTrending, TrendingLeaderboard):
+        db.session.execute(delete(model).where(model.book_id == book_id))
+
+
+def trending_books_query(genre_id=None, limit=LEADERBOARD_SIZE):
+    return (
+        Book.query.join(TrendingLeaderboard, TrendingLeaderboard.book_id == Book.id)
+        .filter(TrendingLeaderboard.genre_id == (genre_id or OVERALL))
+        .order_by(TrendingLeaderboard.rank)
+        .limit(limit)
+    )
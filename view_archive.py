@@ -0,0 +1,237 @@
+from models import db, User, Book, BookViewLog, BookViewDaily, ViewArchiveSegment
+from stats import archive_horizon, raw_daily_views
+from sqlalchemy import delete, select
+import csv
+import datetime
+import gzip
+import io
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # на Windows архивацию не запускают параллельно вручную
+    fcntl = None
+
+
+# --- Архив журнала просмотров ---
+# Строки журнала старше срока хранения (целыми сутками) переносятся в
+# помесячные файлы views-ГГГГ-ММ.csv.gz и удаляются из базы пачками.
+# Каждая пачка дописывается в конец файла отдельным gzip-членом, файлы
+# только растут. Сегмент пачки (размер файла до записи) сохраняется в базе
+# заранее и подтверждается той же короткой транзакцией, что удаляет строки;
+# после сбоя неподтверждённые сегменты отрезаются от файлов и пачка
+# переносится заново. Суточная сводка BookViewDaily не меняется, поэтому
+# итоги статистики за всё время остаются верными.
+
+BATCH_SIZE = 250
+BATCH_PAUSE = 0.05
+
+ARCHIVE_FIELDS = ['id', 'book_id', 'user_id', 'session_id', 'ip_address', 'timestamp']
+
+
+def archive_path(folder, month):
+    return os.path.join(folder, f'views-{month}.csv.gz')
+
+
+def archive_months(folder):
+    if not os.path.isdir(folder):
+        return []
+    return sorted(name[len('views-'):-len('.csv.gz')] for name in os.listdir(folder)
+                  if name.startswith('views-') and name.endswith('.csv.gz'))
+
+
+def retention_cutoff(days, now=None):
+    # Начало суток, с которых строки остаются в журнале
+    today = (now or datetime.datetime.utcnow()).date()
+    return datetime.datetime.combine(today - datetime.timedelta(days=days), datetime.time())
+
+
+def delete_views(criteria, batch_size=BATCH_SIZE, pause=0):
+    # Удаление пачками с фиксацией после каждой: блокировка записи держится недолго
+    deleted = 0
+    while True:
+        ids = select(BookViewLog.id).where(*criteria).limit(batch_size)
+        result = db.session.execute(delete(BookViewLog).where(BookViewLog.id.in_(ids)))
+        db.session.commit()
+        deleted += result.rowcount
+        if result.rowcount < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+
+# --- Перенос в архив ---
+
+def recover_pending(folder):
+    # Отрезает от файлов пачки, удаление которых не было подтверждено
+    pending = ViewArchiveSegment.query.filter_by(status='pending').order_by(ViewArchiveSegment.id.desc()).all()
+    for segment in pending:
+        path = archive_path(folder, segment.month)
+        if os.path.exists(path) and os.path.getsize(path) > segment.file_offset:
+            with open(path, 'r+b') as f:
+                f.truncate(segment.file_offset)
+        db.session.delete(segment)
+    db.session.commit()
+    return len(pending)
+
+
+def _append(path, rows):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    with open(path, 'ab') as f:
+        # gzip.open читает подряд идущие члены как один поток
+        f.write(gzip.compress(buffer.getvalue().encode('utf-8')))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def archive_batch(folder, cutoff, batch_size=BATCH_SIZE):
+    rows = (
+        db.session.query(
+            BookViewLog.id, BookViewLog.book_id, BookViewLog.user_id,
+            BookViewLog.session_id, BookViewLog.ip_address, BookViewLog.timestamp
+        )
+        .filter(BookViewLog.timestamp < cutoff)
+        .order_by(BookViewLog.timestamp, BookViewLog.id)
+        .limit(batch_size)
+        .all()
+    )
+    if not rows:
+        return 0
+
+    months = {}
+    for row in rows:
+        months.setdefault(row.timestamp.strftime('%Y-%m'), []).append(row)
+
+    # 1. Заявка: где в каждом файле начнётся пачка
+    segments = []
+    for month, month_rows in months.items():
+        path = archive_path(folder, month)
+        segments.append(ViewArchiveSegment(
+            month=month,
+            file_offset=os.path.getsize(path) if os.path.exists(path) else 0,
+            rows=len(month_rows),
+            first_id=min(row.id for row in month_rows),
+            last_id=max(row.id for row in month_rows),
+            cutoff=cutoff,
+            status='pending'
+        ))
+    db.session.add_all(segments)
+    db.session.commit()
+
+    # 2. Запись в файлы вне транзакции
+    for month, month_rows in months.items():
+        _append(archive_path(folder, month), [
+            [row.id, row.book_id, row.user_id or '', row.session_id or '', row.ip_address or '',
+             row.timestamp.isoformat(sep=' ')]
+            for row in month_rows
+        ])
+
+    # 3. Удаление строк и подтверждение сегментов одной транзакцией
+    db.session.execute(delete(BookViewLog).where(BookViewLog.id.in_([row.id for row in rows])))
+    for segment in segments:
+        segment.status = 'done'
+    db.session.commit()
+    return len(rows)
+
+
+def archive_views(folder, retention_days, batch_size=BATCH_SIZE, pause=BATCH_PAUSE, now=None, progress=None):
+    os.makedirs(folder, exist_ok=True)
+    cutoff = retention_cutoff(retention_days, now)
+    with open(os.path.join(folder, '.lock'), 'w') as lock:
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                raise RuntimeError('Архивация уже выполняется другим процессом')
+        recover_pending(folder)
+        archived = 0
+        while True:
+            rows = archive_batch(folder, cutoff, batch_size)
+            if not rows:
+                return archived
+            archived += rows
+            if progress:
+                progress(archived)
+            # Пауза между пачками пропускает вперёд запись новых просмотров
+            time.sleep(pause)
+
+
+# --- Чтение архива ---
+
+def read_archive(folder, date_from=None, date_to=None, book_id=None):
+    # Словари строк журнала за период [date_from; date_to] включительно
+    end = date_to + datetime.timedelta(days=1) if date_to else None
+    for month in archive_months(folder):
+        if date_from and month < date_from.strftime('%Y-%m'):
+            continue
+        if date_to and month > date_to.strftime('%Y-%m'):
+            continue
+        with gzip.open(archive_path(folder, month), 'rt', encoding='utf-8', newline='') as f:
+            try:
+                for values in csv.reader(f):
+                    row = dict(zip(ARCHIVE_FIELDS, values))
+                    row['timestamp'] = datetime.datetime.fromisoformat(row['timestamp'])
+                    if date_from and row['timestamp'] < date_from:
+                        continue
+                    if end and row['timestamp'] >= end:
+                        continue
+                    if book_id and int(row['book_id']) != book_id:
+                        continue
+                    row['id'] = int(row['id'])
+                    row['book_id'] = int(row['book_id'])
+                    row['user_id'] = int(row['user_id']) if row['user_id'] else None
+                    yield row
+            except EOFError:
+                # Оборванная запись: её отрежет recover_pending при следующей архивации
+                continue
+
+
+def archived_activity_rows(folder, date_from=None, date_to=None, book_id=None):
+    # Строки в формате экспорта журнала (ACTIVITY_LOG_HEADER)
+    usernames, titles = {}, {}
+    for row in read_archive(folder, date_from, date_to, book_id):
+        user_id, book = row['user_id'], row['book_id']
+        if user_id and user_id not in usernames:
+            user = db.session.get(User, user_id)
+            usernames[user_id] = user.username if user else f'#{user_id}'
+        if book not in titles:
+            found = db.session.get(Book, book)
+            titles[book] = found.title if found else f'#{book} (удалена)'
+        yield [
+            row['timestamp'].strftime('%d.%m.%Y %H:%M'),
+            usernames[user_id] if user_id else 'Гость',
+            titles[book],
+            row['ip_address'] or '-',
+            row['session_id'] or '-'
+        ]
+
+
+def check_archived_views(folder):
+    # Сверка сводки за архивные сутки с архивом (плюс строки, которые ещё не перенесены);
+    # возвращает расхождения (book_id, day, в архиве и журнале, в сводке)
+    horizon = archive_horizon()
+    if horizon is None:
+        return []
+    books = {book_id for book_id, in db.session.query(Book.id)}
+    expected = {}
+    for row in read_archive(folder):
+        key = (row['book_id'], row['timestamp'].date().isoformat())
+        expected[key] = expected.get(key, 0) + 1
+    for book_id, day, views, _, _ in raw_daily_views(until=horizon):
+        key = (book_id, str(day))
+        expected[key] = expected.get(key, 0) + views
+
+    actual = {
+        (book_id, str(day)): views
+        for book_id, day, views in db.session.query(BookViewDaily.book_id, BookViewDaily.day, BookViewDaily.views)
+        .filter(BookViewDaily.day < horizon.date())
+    }
+
+    mismatches = []
+    for key in sorted(expected.keys() | actual.keys()):
+        # Сводка удалённых книг удалена, а их архив сохраняется
+        if key[0] in books and expected.get(key, 0) != actual.get(key, 0):
+            mismatches.append((key[0], key[1], expected.get(key, 0), actual.get(key, 0)))
+    return mismatches
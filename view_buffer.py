@@ -0,0 +1,268 @@
+from models import db, BookViewLog, BookViewDaily
+from sqlalchemy import insert
+from trending import record_views as record_trending, refresh_if_due as refresh_trending
+from recently_viewed import save_lists as save_recent_lists
+import atexit
+import datetime
+import os
+import queue
+import threading
+import time
+
+
+# --- Буферизованная запись журнала просмотров ---
+# view_book() только кладёт событие в ограниченную очередь, фоновый поток
+# сбрасывает её в базу пачками: по размеру пачки или не реже чем раз в
+# VIEW_BUFFER_FLUSH_INTERVAL секунд (максимальное окно потери данных).
+# Дневной лимит просмотров проверяется по счётчикам в памяти. Тот же поток
+# пересчитывает рейтинги "популярное сейчас", когда подходит их срок, и
+# сохраняет списки недавно просмотренных книг пользователей: от каждого
+# пользователя за интервал сброса записывается только последний список.
+#
+# Пачка, которую не удалось записать (база заблокирована, недоступна),
+# не теряется: она повторяется при следующих сбросах с удвоением паузы
+# от VIEW_BUFFER_RETRY_DELAY и отбрасывается только после
+# VIEW_BUFFER_MAX_ATTEMPTS неудачных попыток.
+
+class ViewBuffer:
+    def __init__(self, app=None):
+        self.app = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('VIEW_BUFFER_ENABLED', True)
+        app.config.setdefault('VIEW_BUFFER_MAX_SIZE', 10000)
+        app.config.setdefault('VIEW_BUFFER_BATCH_SIZE', 500)
+        app.config.setdefault('VIEW_BUFFER_FLUSH_INTERVAL', 2.0)
+        app.config.setdefault('VIEW_DAILY_LIMIT', 10)
+        app.config.setdefault('VIEW_BUFFER_MAX_ATTEMPTS', 5)
+        app.config.setdefault('VIEW_BUFFER_RETRY_DELAY', 2.0)
+        self.app = app
+        app.extensions['view_buffer'] = self
+        atexit.register(self.stop)
+
+    def _ensure_started(self):
+        # Поток и очередь создаются лениво и заново после fork()
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            config = self.app.config
+            self._queue = queue.Queue(maxsize=config['VIEW_BUFFER_MAX_SIZE'])
+            self._wakeup = threading.Event()
+            self._stopping = threading.Event()
+            self._counters = {}
+            self._counters_day = None
+            self._recent = {}
+            self._retry = []  # [(события, число попыток, не раньше чем)]
+            self._metrics = {
+                'flushed_total': 0,
+                'failed_total': 0,
+                'retried_total': 0,
+                'flushes_total': 0,
+                'last_flush_seconds': 0.0,
+                'max_flush_seconds': 0.0
+            }
+            self._thread = None
+            if config['VIEW_BUFFER_ENABLED']:
+                self._thread = threading.Thread(target=self._run, name='view-buffer', daemon=True)
+                self._thread.start()
+            self._pid = os.getpid()
+
+    # --- Дневной лимит ---
+
+    def _allow(self, book_id, user_id, session_id, ip_address, today):
+        if user_id:
+            visitor = ('user', user_id)
+        elif session_id:
+            visitor = ('session', session_id)
+        else:
+            visitor = ('ip', ip_address)
+        key = (book_id, visitor)
+
+        with self._lock:
+            if self._counters_day != today:
+                # Новые сутки: старые счётчики больше не нужны
+                self._counters = {}
+                self._counters_day = today
+            count = self._counters.get(key)
+
+        if count is None:
+            # Первый просмотр пары (книга, посетитель) за сутки в этом процессе
+            count = BookViewLog.count_daily_views(book_id, user_id, session_id, ip_address)
+
+        with self._lock:
+            count = max(count, self._counters.get(key, 0))
+            if count >= self.app.config['VIEW_DAILY_LIMIT']:
+                self._counters[key] = count
+                return False
+            self._counters[key] = count + 1
+            return True
+
+    # --- Приём событий ---
+
+    def record(self, book_id, user_id=None, session_id=None, ip_address=None):
+        # True, если просмотр учтён (лимит не превышен)
+        self._ensure_started()
+        now = datetime.datetime.utcnow()
+        if not self._allow(book_id, user_id, session_id, ip_address, now.date()):
+            return False
+
+        event = {
+            'book_id': book_id,
+            'user_id': user_id,
+            'session_id': session_id,
+            'ip_address': ip_address,
+            'timestamp': now
+        }
+        try:
+            self._queue.put_nowait(event)
+        except queue.Full:
+            # Очередь переполнена: сбрасываем её прямо в текущем запросе
+            self.flush()
+            self._queue.put_nowait(event)
+
+        if not self.app.config['VIEW_BUFFER_ENABLED']:
+            self.flush()
+        elif self._queue.qsize() >= self.app.config['VIEW_BUFFER_BATCH_SIZE']:
+            self._wakeup.set()
+        return True
+
+    def remember_recent(self, visitor, book_ids):
+        # Новый список недавно просмотренных заменяет ещё не записанный
+        self._ensure_started()
+        with self._lock:
+            self._recent[visitor] = (list(book_ids), datetime.datetime.utcnow())
+        if not self.app.config['VIEW_BUFFER_ENABLED']:
+            self.flush()
+
+    # --- Сброс в базу ---
+
+    def _drain(self, limit):
+        events = []
+        while len(events) < limit:
+            try:
+                events.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return events
+
+    def _take_retries(self, force):
+        # Пачки, чья пауза истекла (force - все, например при остановке)
+        now = time.monotonic()
+        with self._lock:
+            due = [item for item in self._retry if force or item[2] <= now]
+            self._retry = [item for item in self._retry if not (force or item[2] <= now)]
+        return due
+
+    def _write(self, events):
+        with self.app.app_context():
+            try:
+                db.session.execute(insert(BookViewLog), events)
+                BookViewDaily.record_views((e['book_id'], e['timestamp']) for e in events)
+                record_trending((e['book_id'], e['timestamp']) for e in events)
+                db.session.commit()
+                return True
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Не удалось записать {len(events)} просмотров: {e}')
+                return False
+
+    def _failed(self, events, attempts):
+        config = self.app.config
+        if attempts >= config['VIEW_BUFFER_MAX_ATTEMPTS']:
+            self._metrics['failed_total'] += len(events)
+            self.app.logger.error(f'{len(events)} просмотров отброшены после {attempts} попыток')
+            return
+        delay = config['VIEW_BUFFER_RETRY_DELAY'] * 2 ** (attempts - 1)
+        with self._lock:
+            self._retry.append((events, attempts, time.monotonic() + delay))
+        self._metrics['retried_total'] += len(events)
+
+    def flush(self, force=False):
+        self._ensure_started()
+        batch_size = self.app.config['VIEW_BUFFER_BATCH_SIZE']
+        flushed = 0
+        with self._flush_lock:
+            # Сначала повторы (события в них старше), потом очередь
+            batches = [(events, attempts) for events, attempts, _ in self._take_retries(force)]
+            while True:
+                if not batches:
+                    events = self._drain(batch_size)
+                    if not events:
+                        break
+                    batches.append((events, 0))
+                events, attempts = batches.pop(0)
+                started = time.perf_counter()
+                written = self._write(events)
+                elapsed = time.perf_counter() - started
+                self._metrics['flushes_total'] += 1
+                self._metrics['last_flush_seconds'] = elapsed
+                self._metrics['max_flush_seconds'] = max(self._metrics['max_flush_seconds'], elapsed)
+                if written:
+                    flushed += len(events)
+                    self._metrics['flushed_total'] += len(events)
+                    continue
+                # База, скорее всего, недоступна: остальное ждёт следующего сброса
+                self._failed(events, attempts + 1)
+                with self._lock:
+                    self._retry.extend((batch, tries, 0) for batch, tries in batches)
+                break
+            self._flush_recent()
+        return flushed
+
+    def _flush_recent(self):
+        with self._lock:
+            recent, self._recent = self._recent, {}
+        if not recent:
+            return
+        with self.app.app_context():
+            try:
+                save_recent_lists(recent)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Не удалось записать недавно просмотренные ({len(recent)}): {e}')
+                # Вернуть в буфер, если за это время не пришёл более новый список
+                with self._lock:
+                    for visitor, value in recent.items():
+                        self._recent.setdefault(visitor, value)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.app.config['VIEW_BUFFER_FLUSH_INTERVAL'])
+            self._wakeup.clear()
+            self.flush()
+            self._refresh_trending()
+
+    def _refresh_trending(self):
+        with self.app.app_context():
+            try:
+                refresh_trending()
+            except Exception as e:
+                db.session.rollback()
+                self.app.logger.error(f'Не удалось пересчитать рейтинги: {e}')
+
+    def stop(self):
+        # Вызывается при завершении процесса: дописываем всё, что осталось
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+        self.flush(force=True)
+
+    def metrics(self):
+        self._ensure_started()
+        with self._lock:
+            retry_depth = sum(len(events) for events, _, _ in self._retry)
+        return dict(self._metrics, queue_depth=self._queue.qsize(), retry_depth=retry_depth)
+
+
+view_buffer = ViewBuffer()
@@ -0,0 +1,36 @@
+from app import create_app
+from models import db
+from facets import facet_index
+from sqlalchemy.exc import SQLAlchemyError
+import gc
+import mimetypes
+
+# --- Точка входа WSGI для gunicorn --preload ---
+# gunicorn -c gunicorn.conf.py wsgi:app
+# Модуль импортируется один раз в мастере: всё, что подготовлено здесь
+# (шаблоны, карта URL, индекс фасетов), воркеры получают после fork()
+# готовым и общим с мастером, пока страницы памяти не изменятся.
+# Соединения с базой мастера закрываются до fork(), воркеры открывают свои
+# (см. post_fork в gunicorn.conf.py). Схему и папки создаёт "flask setup".
+
+
+def warm_up(app):
+    for name in app.jinja_env.list_templates():
+        app.jinja_env.get_template(name)
+    app.url_map.update()
+    mimetypes.init()  # send_from_directory() читает таблицы типов при первом вызове
+    with app.app_context():
+        try:
+            facet_index()
+        except SQLAlchemyError as e:
+            # Например, схема ещё не создана: индекс построится при первом запросе
+            app.logger.warning(f'Индекс фасетов не построен заранее: {e}')
+        db.session.remove()
+        db.engine.dispose()
+
+
+app = create_app()
+warm_up(app)
+# Объекты, созданные до fork(), сборщик мусора больше не трогает,
+# поэтому их страницы не копируются в каждый воркер
+gc.freeze()